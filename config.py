@@ -9,6 +9,38 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
 AVIASALES_API_KEY = os.getenv('AVIASALES_API_KEY')
 
+# Режим работы: 'polling' (long polling) или 'webhook' (встроенный HTTP-сервер)
+BOT_RUN_MODE = os.getenv('BOT_RUN_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # публичный адрес; если пусто, setWebhook не вызывается
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # secret_token для проверки запросов от Telegram
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = '/webhook'
+
+# Многопроцессный режим: обновления распределяются по BOT_WORKERS процессам по user_id
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))  # 1 — обычный запуск в одном процессе
+WORKER_QUEUE_SIZE = 1000  # обновлений в очереди одного процесса
+WORKER_CONCURRENCY = 64  # одновременно обрабатываемых обновлений в одном процессе
+WORKER_DRAIN_TIMEOUT = 30  # ожидание завершения процессов при остановке, секунды
+
+# Метрики Prometheus (/metrics); рабочие процессы слушают следующие порты по порядку
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9102'))  # 0 — не запускать
+
+# Трассировка и профилирование
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))  # доля трассируемых обновлений, 0 — выключено
+TRACE_FILE = 'data/traces.jsonl'
+PROFILE_DIR = 'data/profiles'
+PROFILE_DEFAULT_SECONDS = 30  # длительность /profile и профиля по SIGUSR1
+PROFILE_MAX_SECONDS = 300
+
+# Ограничения исходящих запросов к Telegram (флуд-лимиты Bot API)
+RATE_LIMIT_GLOBAL = 30  # сообщений в секунду на бота (делится между рабочими процессами)
+RATE_LIMIT_CHAT = 1  # сообщений в секунду в один личный чат
+RATE_LIMIT_CHAT_BURST = 3  # допустимая короткая серия в личный чат
+RATE_LIMIT_GROUP_PER_MINUTE = 20  # сообщений в минуту в группу
+RATE_LIMIT_MAX_RETRIES = 3  # повторов после ответа 429
+
 # Настройки временной зоны
 TIMEZONE = 'Europe/Moscow'  # UTC+3
 
@@ -26,12 +58,52 @@ SUPPORTED_CITIES = [
     'Красная Поляна'
 ]
 
+# Каталог экскурсий
+EXCURSIONS_FILE = 'data/price.xls'
+EXCURSIONS_SNAPSHOT = 'data/price.sqlite'  # скомпилированный снимок price.xls
+CATALOG_RELOAD_INTERVAL = 60  # проверка изменений price.xls, секунды
+
+# Кеш file_id фотографий экскурсий
+PHOTO_CACHE_FILE = 'data/photo_cache.db'
+PHOTO_CACHE_CHAT_ID = os.getenv('PHOTO_CACHE_CHAT_ID', '')  # служебный чат для /warm_photos
+PHOTO_WARMUP_DELAY = 3  # пауза между загрузками фото при прогреве, секунды
+
+# Данные пользователей
+USER_FLUSH_INTERVAL = 10  # запись изменённых пользователей в базу, секунды
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '100000'))  # записей пользователей в памяти
+
+# Журнал действий пользователей
+ACTION_LOG_BATCH_SIZE = 100  # строк в одном пакете записи
+ACTION_LOG_FLUSH_INTERVAL = 5  # максимальная задержка записи, секунды
+ACTION_LOG_MAX_BUFFER = 10000  # строк в буфере, если запись не удаётся (старые отбрасываются)
+ACTION_STATS_UNIQUE_MODE = os.getenv('ACTION_STATS_UNIQUE_MODE', 'hll')  # 'hll' (приблизительно) или 'exact'
+ACTION_STATS_SAVE_INTERVAL = 300  # сохранение статистики журнала на диск, секунды
+
+# Администраторы бота (через запятую в переменной окружения ADMIN_IDS)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()}
+
 # Ссылки
 TELEGRAM_GROUP_LINK = 'https://t.me/blackseaeveryday'
 
 # Настройки погодного API
+WEATHER_API_DEFAULT_URL = 'https://api.openweathermap.org'
+WEATHER_API_URL = os.getenv('WEATHER_API_URL', WEATHER_API_DEFAULT_URL)
+CITY_COORDINATES_FILE = 'data/cities.json'  # сохранённые координаты SUPPORTED_CITIES
 WEATHER_UPDATE_INTERVAL = 1800  # 30 минут
 FORECAST_DAYS = 7
+WEATHER_PREFETCH_CONCURRENCY = 4  # одновременных запросов при фоновом обновлении
+WEATHER_PREFETCH_JITTER = 5  # случайная задержка перед запросом, секунды
+WEATHER_GROUP_MAX_IDS = 20  # городов в одном групповом запросе погоды (ограничение OpenWeatherMap)
+WEATHER_SNAPSHOT_FILE = 'data/weather_cache.json'  # погода, общая для рабочих процессов
+WEATHER_SNAPSHOT_POLL_INTERVAL = 30  # проверка обновления снимка погоды, секунды
+
+# Настройки HTTP-клиента для внешних API
+HTTP_POOL_LIMIT = 100  # всего соединений в пуле
+HTTP_LIMIT_PER_HOST = 20  # соединений к одному хосту
+HTTP_DNS_CACHE_TTL = 300  # секунды
+HTTP_KEEPALIVE_TIMEOUT = 30  # секунды
+HTTP_CONNECT_TIMEOUT = 5  # секунды
+HTTP_READ_TIMEOUT = 10  # секунды
 
 # Форматы сообщений
 WEATHER_MESSAGE_FORMAT = """
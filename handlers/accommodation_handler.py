@@ -5,15 +5,8 @@ from handlers.user_handler import log_user_activity
 
 logger = logging.getLogger(__name__)
 
-async def show_accommodation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает информацию о жилье"""
-    query = update.callback_query
-    await query.answer()
-    
-    # Логируем действие
-    log_user_activity(update, "открыл раздел жилья")
-    
-    message = """
+# Текст и клавиатура раздела не меняются — собираем их один раз
+ACCOMMODATION_MESSAGE = """
 🏨 Жильё на Черноморском побережье!
 
 Найдите идеальное жильё для отдыха с помощью Суточно.ру:
@@ -28,11 +21,18 @@ async def show_accommodation(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 Нажмите кнопку ниже, чтобы найти лучшие предложения по аренде:
 """
+
+ACCOMMODATION_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🏠 Перейти на сайт", url="https://sutochno.tp.st/zntj72if")],
+    [InlineKeyboardButton("« Назад в меню", callback_data="start")]
+])
+
+async def show_accommodation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает информацию о жилье"""
+    query = update.callback_query
+    await query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("🏠 Перейти на сайт", url="https://sutochno.tp.st/zntj72if")],
-        [InlineKeyboardButton("« Назад в меню", callback_data="start")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Логируем действие
+    log_user_activity(update, "открыл раздел жилья")
     
-    await query.message.edit_text(message, reply_markup=reply_markup) 
\ No newline at end of file
+    await query.message.edit_text(ACCOMMODATION_MESSAGE, reply_markup=ACCOMMODATION_MENU) 
\ No newline at end of file
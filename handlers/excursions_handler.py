@@ -1,91 +1,139 @@
-import os
-import pandas as pd
+import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import ContextTypes
-from utils.action_logger import ActionLogger
+from config import PHOTO_WARMUP_DELAY
+from utils.action_logger import action_logger
+from utils.excursion_catalog import catalog
+from utils.render_cache import RenderCache
+from utils.photo_cache import photo_cache
+from utils.rate_limiter import PRIORITY_BACKGROUND
+from utils.callback_codec import CATEGORY_PREFIX, EXCURSION_PREFIX, encode_excursion_id, decode_excursion_id
 from handlers.user_handler import get_user_data, log_user_activity
 import logging
 
 logger = logging.getLogger(__name__)
 
-action_logger = ActionLogger()
-
-def load_excursions():
-    """Загрузка данных об экскурсиях из Excel файла"""
-    file_path = 'data/price.xls'
-    
-    # Проверяем существование файла
-    if not os.path.exists(file_path):
-        print(f"Файл не найден: {file_path}")
-        return None
-        
-    print(f"Файл найден: {file_path}")
-    
-    try:
-        # Загружаем файл как xls
-        df = pd.read_excel(file_path, sheet_name='Sheet1', engine='xlrd')
-        print("Успешно загружен файл")
-    except Exception as e:
-        print(f"Ошибка при загрузке файла: {e}")
-        return None
-    
-    # Проверяем наличие необходимых колонок
-    required_columns = ['Категория', 'Название', 'Идентификатор', 'Описание', 'Цена', 'Фото', 'Популярный товар', 'В наличии']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        print(f"Отсутствуют колонки: {missing_columns}")
-        return None
-    
-    # Выводим информацию о загруженных данных
-    print(f"Загружено {len(df)} экскурсий")
-    print(f"Категории: {df['Категория'].unique().tolist()}")
-    
-    return df
-
 def get_categories():
     """Получение списка уникальных категорий экскурсий"""
-    df = load_excursions()
-    if df is not None:
-        # Получаем уникальные категории и сортируем их
-        categories = sorted(df['Категория'].unique().tolist())
-        print(f"Найдены категории: {categories}")
-        return categories
-    print("Не удалось получить категории")
-    return []
+    categories = catalog.get_categories()
+    if not categories:
+        print("Не удалось получить категории")
+    return categories
 
 # Получение экскурсий по категории
 def get_excursions_by_category(category):
     """Получение списка экскурсий определенной категории"""
-    df = load_excursions()
-    if df is not None:
-        return df[df['Категория'] == category].to_dict('records')
-    return []
+    return catalog.get_excursions_by_category(category)
 
 def get_excursion_by_id(excursion_id: str) -> dict:
     """Получает информацию об экскурсии по её идентификатору"""
-    print(f"Поиск экскурсии с ID: {excursion_id}")
-    
-    df = load_excursions()
-    if df is None:
-        print("Не удалось загрузить данные об экскурсиях")
-        return None
-    
-    # Преобразуем excursion_id в строку для сравнения
-    excursion_id = str(excursion_id)
-    print(f"Преобразованный ID для поиска: {excursion_id}")
-    
-    # Выводим все доступные ID для проверки
-    print(f"Доступные ID в базе: {df['Идентификатор'].tolist()}")
-    
-    # Ищем экскурсию по идентификатору
-    excursion = df[df['Идентификатор'].astype(str) == excursion_id]
-    
-    if excursion.empty:
+    excursion = catalog.get_excursion_by_id(excursion_id)
+    if excursion is None:
         print(f"Экскурсия с ID {excursion_id} не найдена")
-        return None
-    
-    print(f"Найдена экскурсия: {excursion.iloc[0]['Название']}")
-    return excursion.iloc[0].to_dict()
+    return excursion
+
+def category_callback(category: str, state=None) -> str:
+    """callback_data кнопки категории (код берётся из state или текущего каталога)"""
+    code = (state or catalog.state).category_ids.encode(category)
+    return f"{CATEGORY_PREFIX}{code}" if code else f"category_{category}"
+
+def excursion_callback(excursion: dict) -> str:
+    """callback_data кнопки экскурсии"""
+    try:
+        return f"{EXCURSION_PREFIX}{encode_excursion_id(excursion['Идентификатор'])}"
+    except (TypeError, ValueError):
+        return f"excursion_{excursion['Идентификатор']}"
+
+# Клавиатуры, которые не зависят от каталога
+UNAVAILABLE_MARKUP = InlineKeyboardMarkup([[
+    InlineKeyboardButton("« Назад в меню", callback_data="main_menu")
+]])
+NOT_FOUND_MARKUP = InlineKeyboardMarkup([[
+    InlineKeyboardButton("« Назад к категориям", callback_data="excursions"),
+    InlineKeyboardButton("🏠 В главное меню", callback_data="start")
+]])
+
+CATEGORIES_MESSAGE = "🌴 Выберите категорию экскурсий:"
+
+# Клавиатуры и тексты из каталога собираются один раз на версию каталога.
+# Данные и версия берутся из одного состояния: каталог может смениться между обращениями
+render_cache = RenderCache('excursions_render', shared_version=True)
+
+def get_categories_markup(home_label: str = "« Назад в меню") -> InlineKeyboardMarkup:
+    """Клавиатура со списком категорий"""
+    state = catalog.state
+
+    def build():
+        keyboard = []
+        for category in state.categories:
+            keyboard.append([InlineKeyboardButton(f"🌴 {category}", callback_data=category_callback(category, state))])
+        keyboard.append([InlineKeyboardButton(home_label, callback_data="start")])
+        return InlineKeyboardMarkup(keyboard)
+
+    return render_cache.get(('categories', home_label), state.version, build)
+
+def render_excursions_list(state, category: str, excursions: list):
+    """Текст и клавиатура списка экскурсий категории из состояния каталога state"""
+    def build():
+        message = f"🌴 Экскурсии в категории {category}:\n\n"
+        for excursion in excursions:
+            message += f"• {excursion['Название']}\n"
+        
+        # Создаем клавиатуру с кнопками навигации
+        keyboard = []
+        for excursion in excursions:
+            keyboard.append([InlineKeyboardButton(
+                f"🏔 {excursion['Название']}", 
+                callback_data=excursion_callback(excursion)
+            )])
+        
+        # Добавляем кнопки навигации внизу
+        keyboard.append([
+            InlineKeyboardButton("« Назад к категориям", callback_data="excursions"),
+            InlineKeyboardButton("🏠 В главное меню", callback_data="start")
+        ])
+        return message, InlineKeyboardMarkup(keyboard)
+
+    return render_cache.get(('list', category), state.version, build)
+
+def render_excursion_info(state, excursion: dict):
+    """Текст и клавиатура карточки экскурсии из состояния каталога state"""
+    def build():
+        message = f"🏔 {excursion['Название']}\n\n"
+        message += f"📝 {excursion['Описание']}\n\n"
+        message += f"💰 Цена: {excursion['Цена']} ₽\n"
+        
+        if excursion['Популярный товар'] == 'Да':
+            message += "⭐️ Популярная экскурсия!\n"
+        
+        if excursion['В наличии'] == 'Да':
+            message += "✅ Доступна для бронирования\n"
+        else:
+            message += "❌ Временно недоступна\n"
+        
+        # Создаем клавиатуру с кнопками навигации
+        keyboard = [
+            [InlineKeyboardButton("« Назад к списку", callback_data=category_callback(excursion['Категория'], state))],
+            [
+                InlineKeyboardButton("« Назад к категориям", callback_data="excursions"),
+                InlineKeyboardButton("🏠 Главное меню", callback_data="start")
+            ]
+        ]
+        return message, InlineKeyboardMarkup(keyboard)
+
+    return render_cache.get(('info', str(excursion['Идентификатор'])), state.version, build)
+
+async def replace_message(message, text: str, reply_markup):
+    """Замена сообщения бота: сообщение с фото нельзя сделать текстовым, поэтому отправляем новое и удаляем его"""
+    if not message.photo:
+        await message.edit_text(text, reply_markup=reply_markup)
+        return
+    await message.reply_text(text, reply_markup=reply_markup)
+    try:
+        await message.delete()
+    except TelegramError as e:
+        logger.warning(f"Не удалось удалить сообщение с фото: {e}")
 
 async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает список категорий экскурсий"""
@@ -93,12 +141,11 @@ async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
     categories = get_categories()
     
     if not categories:
-        await update.callback_query.message.edit_text(
+        await replace_message(
+            update.callback_query.message,
             "❌ В данный момент информация об экскурсиях недоступна.\n"
             "Пожалуйста, попробуйте позже.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Назад в меню", callback_data="main_menu")
-            ]])
+            UNAVAILABLE_MARKUP
         )
         return
     
@@ -108,19 +155,12 @@ async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
         action_type="menu_view"
     )
     
-    keyboard = []
-    for category in categories:
-        keyboard.append([InlineKeyboardButton(f"🌴 {category}", callback_data=f"category_{category}")])
-    
-    keyboard.append([InlineKeyboardButton("« Назад в меню", callback_data="start")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    message = "🌴 Выберите категорию экскурсий:"
+    reply_markup = get_categories_markup()
     
     if update.callback_query:
-        await update.callback_query.message.edit_text(message, reply_markup=reply_markup)
+        await replace_message(update.callback_query.message, CATEGORIES_MESSAGE, reply_markup)
     else:
-        await update.message.reply_text(message, reply_markup=reply_markup)
+        await update.message.reply_text(CATEGORIES_MESSAGE, reply_markup=reply_markup)
 
 async def show_excursions_list(update: Update, context: ContextTypes.DEFAULT_TYPE, category: str):
     """Показывает список экскурсий в выбранной категории"""
@@ -130,109 +170,132 @@ async def show_excursions_list(update: Update, context: ContextTypes.DEFAULT_TYP
     # Логируем действие пользователя
     log_user_activity(update, f"открыл список экскурсий в категории {category}")
     
-    excursions = get_excursions_by_category(category)
+    state = catalog.state
+    excursions = state.by_category.get(category, [])
     if not excursions:
-        await query.message.edit_text(
-            "❌ В данной категории пока нет доступных экскурсий.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Назад к категориям", callback_data="excursions"),
-                InlineKeyboardButton("🏠 В главное меню", callback_data="start")
-            ]])
-        )
+        await replace_message(query.message, "❌ В данной категории пока нет доступных экскурсий.", NOT_FOUND_MARKUP)
         return
     
-    message = f"🌴 Экскурсии в категории {category}:\n\n"
-    for excursion in excursions:
-        message += f"• {excursion['Название']}\n"
-    
-    # Создаем клавиатуру с кнопками навигации
-    keyboard = []
-    for excursion in excursions:
-        keyboard.append([InlineKeyboardButton(
-            f"🏔 {excursion['Название']}", 
-            callback_data=f"excursion_{excursion['Идентификатор']}"
-        )])
-    
-    # Добавляем кнопки навигации внизу
-    keyboard.append([
-        InlineKeyboardButton("« Назад к категориям", callback_data="excursions"),
-        InlineKeyboardButton("🏠 В главное меню", callback_data="start")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    message, reply_markup = render_excursions_list(state, category, excursions)
     
     try:
-        await query.message.edit_text(message, reply_markup=reply_markup)
+        # С карточки экскурсии («Назад к списку») приходит сообщение с фото
+        await replace_message(query.message, message, reply_markup)
     except Exception as e:
         print(f"Ошибка при редактировании сообщения: {e}")
         # Если не удалось отредактировать, отправляем новое сообщение
         await query.message.reply_text(message, reply_markup=reply_markup)
 
+def remember_photo(excursion: dict, sent) -> bool:
+    """Сохранение file_id из отправленного сообщения с фото экскурсии"""
+    if sent is None or not sent.photo:
+        return False
+    # Последний элемент — фото в наибольшем размере
+    photo_cache.set(excursion['Идентификатор'], excursion['Фото'], sent.photo[-1].file_id)
+    return True
+
+async def send_excursion_photo(message, excursion: dict, caption: str, reply_markup):
+    """Отправка фото экскурсии: по сохранённому file_id, иначе по URL"""
+    excursion_id = excursion['Идентификатор']
+    file_id = photo_cache.get(excursion_id, excursion['Фото'])
+    if file_id:
+        try:
+            return await message.reply_photo(photo=file_id, caption=caption, reply_markup=reply_markup)
+        except BadRequest as e:
+            # file_id отклонён — загружаем фото по URL заново
+            logger.warning(f"file_id фото экскурсии {excursion_id} не принят: {e}")
+            photo_cache.invalidate(excursion_id)
+
+    sent = await message.reply_photo(photo=excursion['Фото'], caption=caption, reply_markup=reply_markup)
+    remember_photo(excursion, sent)
+    return sent
+
+# Прогрев кеша уступает очередь ответам пользователям
+BACKGROUND = {'priority': PRIORITY_BACKGROUND}
+
+async def warm_up_photos(bot, chat_id, delay: float = PHOTO_WARMUP_DELAY) -> tuple:
+    """
+    Предзагрузка фото каталога в служебный чат
+
+    :param bot: Бот, от имени которого отправляются фото
+    :param chat_id: Служебный чат
+    :param delay: Пауза между отправками, секунды
+    :return: (загружено, ошибок)
+    """
+    photos = {
+        excursion_id: excursion
+        for excursion_id, excursion in catalog.state.by_id.items()
+        if excursion['Фото']
+    }
+    # Записи удалённых экскурсий и сменившихся фото больше не нужны
+    photo_cache.prune({excursion_id: excursion['Фото'] for excursion_id, excursion in photos.items()})
+
+    uploaded = failed = 0
+    for excursion_id, excursion in photos.items():
+        if photo_cache.get(excursion_id, excursion['Фото']):
+            continue
+        try:
+            sent = await bot.send_photo(
+                chat_id, photo=excursion['Фото'], disable_notification=True, rate_limit_args=BACKGROUND
+            )
+            remember_photo(excursion, sent)
+            uploaded += 1
+        except TelegramError as e:
+            logger.warning(f"Не удалось загрузить фото экскурсии {excursion_id}: {e}")
+            failed += 1
+        else:
+            # file_id остаётся действительным и после удаления сообщения.
+            # Message.delete() не принимает rate_limit_args, поэтому вызываем метод бота
+            try:
+                await bot.delete_message(chat_id, sent.message_id, rate_limit_args=BACKGROUND)
+            except TelegramError as e:
+                logger.warning(f"Не удалось удалить фото экскурсии {excursion_id} из служебного чата: {e}")
+        await asyncio.sleep(delay)
+    return uploaded, failed
+
 async def show_excursion_info(update: Update, context: ContextTypes.DEFAULT_TYPE, excursion_id: str):
     """Показывает детальную информацию об экскурсии"""
     query = update.callback_query
     await query.answer()
     
     # Получаем данные об экскурсии
-    excursion = get_excursion_by_id(excursion_id)
+    state = catalog.state
+    excursion = state.by_id.get(str(excursion_id))
     
     if not excursion:
         # Логируем ошибку
         log_user_activity(update, f"попытался открыть несуществующую экскурсию с ID {excursion_id}")
         
-        await query.message.edit_text(
-            "❌ К сожалению, информация об этой экскурсии недоступна.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Назад к категориям", callback_data="excursions"),
-                InlineKeyboardButton("🏠 В главное меню", callback_data="start")
-            ]])
-        )
+        await replace_message(query.message, "❌ К сожалению, информация об этой экскурсии недоступна.", NOT_FOUND_MARKUP)
         return
     
     # Логируем успешное открытие экскурсии
     log_user_activity(update, f"открыл информацию об экскурсии {excursion['Название']}")
     
-    # Формируем сообщение
-    message = f"🏔 {excursion['Название']}\n\n"
-    message += f"📝 {excursion['Описание']}\n\n"
-    message += f"💰 Цена: {excursion['Цена']} ₽\n"
-    
-    if excursion['Популярный товар'] == 'Да':
-        message += "⭐️ Популярная экскурсия!\n"
-    
-    if excursion['В наличии'] == 'Да':
-        message += "✅ Доступна для бронирования\n"
-    else:
-        message += "❌ Временно недоступна\n"
-    
-    # Создаем клавиатуру с кнопками навигации
-    keyboard = [
-        [InlineKeyboardButton("« Назад к списку", callback_data=f"category_{excursion['Категория']}")],
-        [
-            InlineKeyboardButton("« Назад к категориям", callback_data="excursions"),
-            InlineKeyboardButton("🏠 Главное меню", callback_data="start")
-        ]
-    ]
+    message, reply_markup = render_excursion_info(state, excursion)
     
     # Если есть фото, отправляем его с описанием
-    if excursion['Фото'] and not pd.isna(excursion['Фото']):
+    if excursion['Фото']:
         try:
             # Отправляем фото с описанием и кнопками
-            await query.message.reply_photo(
-                photo=excursion['Фото'],
-                caption=message,
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            await send_excursion_photo(query.message, excursion, message, reply_markup)
             # Удаляем предыдущее сообщение со списком экскурсий
             await query.message.delete()
         except Exception as e:
             print(f"Ошибка при отправке фото: {e}")
-            await query.message.edit_text(
-                message,
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            await replace_message(query.message, message, reply_markup)
     else:
-        await query.message.edit_text(
-            message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
\ No newline at end of file
+        await replace_message(query.message, message, reply_markup)
+
+async def show_excursions_by_code(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str):
+    """Список экскурсий по короткому коду категории"""
+    category = catalog.get_category_by_code(code)
+    if category is None:
+        # Категория исчезла из каталога — показываем актуальный список
+        await show_categories(update, context)
+        return
+    await show_excursions_list(update, context, category)
+
+async def show_excursion_by_code(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str):
+    """Информация об экскурсии по короткому коду"""
+    await show_excursion_info(update, context, decode_excursion_id(code) or code)
@@ -5,15 +5,8 @@ from handlers.user_handler import log_user_activity
 
 logger = logging.getLogger(__name__)
 
-async def show_flights(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает информацию об авиабилетах"""
-    query = update.callback_query
-    await query.answer()
-    
-    # Логируем действие
-    log_user_activity(update, "открыл раздел авиабилетов")
-    
-    message = """
+# Текст и клавиатура раздела не меняются — собираем их один раз
+FLIGHTS_MESSAGE = """
 ✈️ Авиабилеты на Черноморское побережье!
 
 Найдите самые выгодные предложения на авиабилеты с помощью Aviasales:
@@ -27,11 +20,18 @@ async def show_flights(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 Нажмите кнопку ниже, чтобы найти самые выгодные предложения по авиабилетам:
 """
+
+FLIGHTS_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✈️ Найти авиабилеты", url="https://aviasales.tp.st/WFskNTRl")],
+    [InlineKeyboardButton("« Назад в меню", callback_data="start")]
+])
+
+async def show_flights(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает информацию об авиабилетах"""
+    query = update.callback_query
+    await query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("✈️ Найти авиабилеты", url="https://aviasales.tp.st/WFskNTRl")],
-        [InlineKeyboardButton("« Назад в меню", callback_data="start")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Логируем действие
+    log_user_activity(update, "открыл раздел авиабилетов")
     
-    await query.message.edit_text(message, reply_markup=reply_markup) 
\ No newline at end of file
+    await query.message.edit_text(FLIGHTS_MESSAGE, reply_markup=FLIGHTS_MENU) 
\ No newline at end of file
@@ -1,10 +1,9 @@
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import ContextTypes
 from utils.user_data import UserDataManager
-from utils.action_logger import ActionLogger
+from utils.action_logger import action_logger
 
 user_manager = UserDataManager()
-action_logger = ActionLogger()
 
 def get_user_data(user) -> dict:
     """Получение данных пользователя в виде словаря"""
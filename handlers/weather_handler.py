@@ -1,12 +1,12 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from config import SUPPORTED_CITIES, WEATHER_MESSAGE_FORMAT
-from utils.weather import get_weather, get_forecast, get_weather_emoji
-from utils.action_logger import ActionLogger
+from utils.weather import get_weather, get_forecast, get_weather_emoji, get_data_version
+from utils.render_cache import RenderCache
+from utils.action_logger import action_logger
+from utils.callback_codec import IdRegistry, CITY_PREFIX, FORECAST_PREFIX
 from handlers.user_handler import get_user_data
 
-action_logger = ActionLogger()
-
 # Добавляем эмодзи для городов
 CITY_EMOJIS = {
     'Сочи': '🌴',
@@ -21,35 +21,94 @@ CITY_EMOJIS = {
     'Красная Поляна': '🏔'
 }
 
+# Короткие коды городов для callback_data
+city_ids = IdRegistry(SUPPORTED_CITIES)
+
+def city_callback(city: str) -> str:
+    """callback_data кнопки текущей погоды в городе"""
+    return f"{CITY_PREFIX}{city_ids.encode(city)}"
+
+def forecast_callback(city: str) -> str:
+    """callback_data кнопки прогноза для города"""
+    return f"{FORECAST_PREFIX}{city_ids.encode(city)}"
+
+# Меню выбора города не меняется — собираем его один раз
+WEATHER_MENU_MESSAGE = "🌡 Выберите город для просмотра погоды:"
+WEATHER_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🌴 Сочи", callback_data=city_callback("Сочи"))],
+    [InlineKeyboardButton("💆‍♂️ Мацеста", callback_data=city_callback("Мацеста"))],
+    [InlineKeyboardButton("🌺 Хоста", callback_data=city_callback("Хоста"))],
+    [InlineKeyboardButton("🌅 Кудепста", callback_data=city_callback("Кудепста"))],
+    [InlineKeyboardButton("✈️ Адлер", callback_data=city_callback("Адлер"))],
+    [InlineKeyboardButton("🏔 Красная Поляна", callback_data=city_callback("Красная Поляна"))],
+    [InlineKeyboardButton("🏊‍♂️ Дагомыс", callback_data=city_callback("Дагомыс"))],
+    [InlineKeyboardButton("⛱ Лоо", callback_data=city_callback("Лоо"))],
+    [InlineKeyboardButton("🌊 Вардане", callback_data=city_callback("Вардане"))],
+    [InlineKeyboardButton("🏖 Лазаревское", callback_data=city_callback("Лазаревское"))],
+    [InlineKeyboardButton("« Назад в меню", callback_data="start")]
+])
+
 async def show_weather_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню выбора города для погоды"""
     query = update.callback_query
     await query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("🌴 Сочи", callback_data="city_Сочи")],
-        [InlineKeyboardButton("💆‍♂️ Мацеста", callback_data="city_Мацеста")],
-        [InlineKeyboardButton("🌺 Хоста", callback_data="city_Хоста")],
-        [InlineKeyboardButton("🌅 Кудепста", callback_data="city_Кудепста")],
-        [InlineKeyboardButton("✈️ Адлер", callback_data="city_Адлер")],
-        [InlineKeyboardButton("🏔 Красная Поляна", callback_data="city_Красная Поляна")],
-        [InlineKeyboardButton("🏊‍♂️ Дагомыс", callback_data="city_Дагомыс")],
-        [InlineKeyboardButton("⛱ Лоо", callback_data="city_Лоо")],
-        [InlineKeyboardButton("🌊 Вардане", callback_data="city_Вардане")],
-        [InlineKeyboardButton("🏖 Лазаревское", callback_data="city_Лазаревское")],
-        
-        
-        
-        [InlineKeyboardButton("« Назад в меню", callback_data="start")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    message = "🌡 Выберите город для просмотра погоды:"
-    
     if update.callback_query:
-        await query.message.edit_text(message, reply_markup=reply_markup)
+        await query.message.edit_text(WEATHER_MENU_MESSAGE, reply_markup=WEATHER_MENU)
     else:
-        await update.message.reply_text(message, reply_markup=reply_markup)
+        await update.message.reply_text(WEATHER_MENU_MESSAGE, reply_markup=WEATHER_MENU)
+
+# Готовые сообщения о погоде общие для всех пользователей и
+# пересобираются только после обновления данных о погоде
+render_cache = RenderCache('weather_render')
+
+def render_city_weather(city: str, weather_data: dict) -> str:
+    """Текст с текущей погодой в городе"""
+    def build():
+        # Добавляем эмодзи погоды в данные
+        data = dict(weather_data, weather_emoji=get_weather_emoji(weather_data['description']))
+        return f"{CITY_EMOJIS[city]} Погода в городе {city}:\n" + WEATHER_MESSAGE_FORMAT.format(**data)
+
+    return render_cache.get((city, "weather"), get_data_version(city, "weather"), build)
+
+def render_forecast(city: str, forecast_data: list) -> str:
+    """Текст с прогнозом погоды в городе"""
+    def build():
+        message = f"{CITY_EMOJIS[city]} Прогноз погоды в городе {city} на неделю:\n\n"
+        
+        for day in forecast_data:
+            message += f"📅 {day['weekday']}, {day['date']}:\n"
+            message += f"🌡 {day['temp_min']}°C ... {day['temp_max']}°C\n"
+            message += f"{day['weather_emojis']} {', '.join(day['descriptions'])}\n\n"
+        return message
+
+    return render_cache.get((city, "forecast"), get_data_version(city, "forecast"), build)
+
+def get_city_weather_markup(city: str) -> InlineKeyboardMarkup:
+    """Клавиатура под текущей погодой"""
+    def build():
+        keyboard = [
+            [
+                InlineKeyboardButton("📅 Прогноз на неделю", callback_data=forecast_callback(city))
+            ],
+            [InlineKeyboardButton("« Назад к городам", callback_data="weather")],
+            [InlineKeyboardButton("« Назад в меню", callback_data="start")]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+
+    return render_cache.get((city, "weather_markup"), None, build)
+
+def get_forecast_markup(city: str) -> InlineKeyboardMarkup:
+    """Клавиатура под прогнозом"""
+    def build():
+        keyboard = [
+            [InlineKeyboardButton("« К текущей погоде", callback_data=city_callback(city))],
+            [InlineKeyboardButton("« Назад к городам", callback_data="weather")],
+            [InlineKeyboardButton("« Назад в меню", callback_data="start")]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+
+    return render_cache.get((city, "forecast_markup"), None, build)
 
 async def show_city_weather(update: Update, context: ContextTypes.DEFAULT_TYPE, city: str):
     """Показывает погоду для выбранного города"""
@@ -60,10 +119,7 @@ async def show_city_weather(update: Update, context: ContextTypes.DEFAULT_TYPE,
         message = f"❌ {weather_data['error']}"
         status = "error"
     else:
-        # Добавляем эмодзи погоды в данные
-        weather_data['weather_emoji'] = get_weather_emoji(weather_data['description'])
-        
-        message = f"{CITY_EMOJIS[city]} Погода в городе {city}:\n" + WEATHER_MESSAGE_FORMAT.format(**weather_data)
+        message = render_city_weather(city, weather_data)
         status = "success"
     
     action_logger.log_action(
@@ -74,16 +130,7 @@ async def show_city_weather(update: Update, context: ContextTypes.DEFAULT_TYPE,
         status=status
     )
     
-    keyboard = [
-        [
-            InlineKeyboardButton("📅 Прогноз на неделю", callback_data=f"weekly_{city}")
-        ],
-        [InlineKeyboardButton("« Назад к городам", callback_data="weather")],
-        [InlineKeyboardButton("« Назад в меню", callback_data="start")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.message.edit_text(message, reply_markup=reply_markup)
+    await update.callback_query.message.edit_text(message, reply_markup=get_city_weather_markup(city))
 
 async def show_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE, city: str):
     """Показывает прогноз погоды для выбранного города"""
@@ -94,13 +141,7 @@ async def show_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE, city
         message = f"❌ {forecast_data[0]['error']}"
         status = "error"
     else:
-        message = f"{CITY_EMOJIS[city]} Прогноз погоды в городе {city} на неделю:\n\n"
-        
-        for day in forecast_data:
-            message += f"📅 {day['weekday']}, {day['date']}:\n"
-            message += f"🌡 {day['temp_min']}°C ... {day['temp_max']}°C\n"
-            message += f"{day['weather_emojis']} {', '.join(day['descriptions'])}\n\n"
-        
+        message = render_forecast(city, forecast_data)
         status = "success"
     
     action_logger.log_action(
@@ -111,11 +152,21 @@ async def show_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE, city
         status=status
     )
     
-    keyboard = [
-        [InlineKeyboardButton("« К текущей погоде", callback_data=f"city_{city}")],
-        [InlineKeyboardButton("« Назад к городам", callback_data="weather")],
-        [InlineKeyboardButton("« Назад в меню", callback_data="start")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.message.edit_text(message, reply_markup=reply_markup) 
\ No newline at end of file
+    await update.callback_query.message.edit_text(message, reply_markup=get_forecast_markup(city)) 
+
+async def show_city_weather_by_code(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str):
+    """Погода по короткому коду города"""
+    city = city_ids.decode(code)
+    if city is None:
+        # Устаревшая кнопка — возвращаем к выбору города
+        await show_weather_menu(update, context)
+        return
+    await show_city_weather(update, context, city)
+
+async def show_forecast_by_code(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str):
+    """Прогноз по короткому коду города"""
+    city = city_ids.decode(code)
+    if city is None:
+        await show_weather_menu(update, context)
+        return
+    await show_forecast(update, context, city)
@@ -1,13 +1,34 @@
+import os
 import asyncio
 import logging
+import signal
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters, ConversationHandler
-from config import BOT_TOKEN, TELEGRAM_GROUP_LINK
-from handlers.weather_handler import show_weather_menu, show_city_weather, show_forecast
-from handlers.user_handler import request_phone_number, handle_contact, log_user_activity
-from handlers.excursions_handler import show_categories, show_excursions_list, show_excursion_info, get_categories
+from config import (
+    BOT_TOKEN, TELEGRAM_GROUP_LINK, CATALOG_RELOAD_INTERVAL, SUPPORTED_CITIES, WEATHER_UPDATE_INTERVAL, ADMIN_IDS,
+    BOT_RUN_MODE, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    BOT_WORKERS, WEATHER_SNAPSHOT_POLL_INTERVAL, PHOTO_CACHE_CHAT_ID, RATE_LIMIT_GLOBAL,
+    METRICS_LISTEN, METRICS_PORT, PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS
+)
+from handlers.weather_handler import show_weather_menu, show_city_weather, show_forecast, show_city_weather_by_code, show_forecast_by_code
+from handlers.user_handler import request_phone_number, handle_contact, log_user_activity, user_manager
+from handlers.excursions_handler import (
+    show_categories, show_excursions_list, show_excursion_info,
+    get_categories_markup, CATEGORIES_MESSAGE, show_excursions_by_code, show_excursion_by_code, warm_up_photos
+)
 from handlers.accommodation_handler import show_accommodation
 from handlers.flights_handler import show_flights
+from utils.excursion_catalog import catalog, reload_catalog_job
+from utils.geocoding import city_registry
+from utils.http_client import init_http_client, close_http_client, get_session
+from utils.weather import prefetch_weather_job, sync_weather_snapshot_job
+from utils.action_logger import action_logger
+from utils.router import CallbackRouter
+from utils.rate_limiter import FloodRateLimiter
+from utils.metrics import MetricsServer, UPDATE_QUEUE_SIZE, timed
+from utils.tracing import TracingApplication, profiler
+from utils.webhook_server import WebhookServer, application_sink
+from utils.workers import run_sharded
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,7 +38,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_main_menu():
+# Многопроцессный режим доступен только в POSIX: дозапись журнала одним
+# os.write с O_APPEND атомарна там, но не в Windows
+WORKERS = BOT_WORKERS if os.name != 'nt' else 1
+
+def build_main_menu():
     """Функция для генерации главного меню"""
     keyboard = [
         [
@@ -39,9 +64,7 @@ def get_main_menu():
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_welcome_message():
-    """Функция для генерации приветственного сообщения"""
-    return """
+WELCOME_MESSAGE = """
 👋 Привет! Я ваш помощник по отдыху на Черноморском побережье!
 
 Что я могу:
@@ -53,6 +76,29 @@ def get_welcome_message():
 Выберите интересующий вас раздел:
 """
 
+STICKERS_MESSAGE = (
+    "🎨 Наконец-то у нас появились фирменные стикеры!\n\n"
+    "Нажмите кнопку ниже, чтобы добавить стикеры в свой Telegram:"
+)
+
+# Статические экраны собираются один раз при запуске
+MAIN_MENU = build_main_menu()
+STICKERS_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎨 Добавить стикеры", url="https://t.me/addstickers/blacksea365")],
+    [InlineKeyboardButton("« Назад в меню", callback_data="start")]
+])
+ERROR_MENU = InlineKeyboardMarkup([[
+    InlineKeyboardButton("🏠 Главное меню", callback_data="start")
+]])
+
+def get_main_menu():
+    """Главное меню"""
+    return MAIN_MENU
+
+def get_welcome_message():
+    """Приветственное сообщение"""
+    return WELCOME_MESSAGE
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
@@ -80,6 +126,188 @@ async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Перенаправляем на функцию start для показа главного меню
     await start_command(update, context)
 
+def is_admin(user) -> bool:
+    """Проверка, что пользователь входит в список администраторов"""
+    return user is not None and user.id in ADMIN_IDS
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /stats (только для администраторов)"""
+    if not is_admin(update.effective_user):
+        return
+    
+    action_type = context.args[0] if context.args else None
+    stats = action_logger.get_action_statistics(action_type)
+    
+    message = "📊 Статистика действий"
+    if action_type:
+        message += f" ({action_type})"
+    message += ":\n\n"
+    message += f"Всего действий: {stats['всего_действий']}\n"
+    message += f"Уникальных пользователей: {stats['уникальных_пользователей']}\n"
+    message += f"Успешных: {stats['процент_успешных']:.1f}%\n"
+    message += f"Ошибок: {stats['ошибок']}\n"
+    
+    if stats['действия_по_типу']:
+        message += "\nПо типам действий:\n"
+        for type_key, count in sorted(stats['действия_по_типу'].items(), key=lambda item: -item[1]):
+            message += f"• {type_key}: {count}\n"
+    
+    await update.message.reply_text(message)
+
+# Размер страницы истории действий в команде /actions
+ACTIONS_PAGE_SIZE = 10
+
+async def actions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /actions <user_id> [страница] (только для администраторов)"""
+    if not is_admin(update.effective_user):
+        return
+    
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Использование: /actions <ID пользователя> [страница]")
+        return
+    
+    user_id = int(context.args[0])
+    page = int(context.args[1]) if len(context.args) > 1 and context.args[1].isdigit() else 1
+    page = max(page, 1)
+    
+    total = action_logger.count_user_actions(user_id)
+    actions = action_logger.get_user_actions(
+        user_id, limit=ACTIONS_PAGE_SIZE, offset=(page - 1) * ACTIONS_PAGE_SIZE, newest_first=True
+    )
+    if not actions:
+        await update.message.reply_text(f"Действий пользователя {user_id} не найдено.")
+        return
+    
+    pages = (total + ACTIONS_PAGE_SIZE - 1) // ACTIONS_PAGE_SIZE
+    message = f"🗂 Действия пользователя {user_id} (страница {page} из {pages}, всего {total}):\n\n"
+    for action in actions:
+        message += f"{action['Дата и время']} | {action['Действие']} | {action['Статус']}\n"
+    
+    await update.message.reply_text(message)
+
+async def warm_photos_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /warm_photos — предзагрузка фото экскурсий (только для администраторов)"""
+    if not is_admin(update.effective_user):
+        return
+    
+    if not PHOTO_CACHE_CHAT_ID:
+        await update.message.reply_text("Не задан PHOTO_CACHE_CHAT_ID — служебный чат для загрузки фото.")
+        return
+    
+    await update.message.reply_text("⏳ Загружаю фото экскурсий в служебный чат...")
+    
+    async def warm_up():
+        uploaded, failed = await warm_up_photos(context.bot, PHOTO_CACHE_CHAT_ID)
+        await update.message.reply_text(f"✅ Фото загружено: {uploaded}, ошибок: {failed}")
+    
+    # Загрузка идёт в фоне, чтобы не задерживать обработку других обновлений
+    context.application.create_task(warm_up(), update=update)
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /profile [секунды] — профилирование бота (только для администраторов)"""
+    if not is_admin(update.effective_user):
+        return
+    
+    seconds = int(context.args[0]) if context.args and context.args[0].isdigit() else PROFILE_DEFAULT_SECONDS
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    task = profiler.start(seconds)
+    if task is None:
+        await update.message.reply_text("Профилирование уже идёт.")
+        return
+    
+    await update.message.reply_text(f"⏱ Профилирование запущено, результат придёт через {seconds} с.")
+    
+    async def report():
+        path, summary = await task
+        # Сводка может не поместиться в одно сообщение: полный отчёт лежит рядом с .prof
+        await update.message.reply_text(f"Профиль сохранён: {path}\n\n{summary[:3500]}")
+    
+    context.application.create_task(report(), update=update)
+
+async def open_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка возврата в главное меню"""
+    query = update.callback_query
+    # Проверяем, есть ли у сообщения фото
+    if query.message.photo:
+        # Если есть фото, отправляем новое сообщение с главным меню
+        await query.message.reply_text(
+            get_welcome_message(),
+            reply_markup=get_main_menu()
+        )
+    else:
+        # Если нет фото, редактируем сообщение
+        await start_command(update, context)
+
+async def open_stickers(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка фирменных стикеров"""
+    await update.callback_query.message.edit_text(STICKERS_MESSAGE, reply_markup=STICKERS_MENU)
+
+async def open_excursions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка раздела экскурсий"""
+    query = update.callback_query
+    # Проверяем, есть ли у сообщения фото
+    if query.message.photo:
+        # Если есть фото, отправляем новое сообщение со списком категорий
+        await query.message.reply_text(
+            CATEGORIES_MESSAGE,
+            reply_markup=get_categories_markup("🏠 Главное меню")
+        )
+    else:
+        # Если нет фото, редактируем сообщение
+        await show_categories(update, context)
+
+async def back_to_current(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка возврата к текущей погоде"""
+    city = context.user_data.get('current_city')
+    if city:
+        await show_city_weather(update, context, city)
+
+def build_router() -> CallbackRouter:
+    """Таблица маршрутов для callback_data"""
+    router = CallbackRouter()
+    router.add_exact("start", open_start)
+    # Старые клавиатуры экскурсий отправляли main_menu вместо start
+    router.add_exact("main_menu", open_start, name="start")
+    router.add_exact("stickers", open_stickers)
+    router.add_exact("excursions", open_excursions)
+    router.add_exact("weather", show_weather_menu)
+    router.add_exact("accommodation", show_accommodation)
+    router.add_exact("flights", show_flights)
+    router.add_exact("back_to_cities", show_weather_menu)
+    router.add_exact("back_to_current", back_to_current)
+    # Компактные callback_data с короткими кодами
+    router.add_prefix("c_", show_excursions_by_code, name="category_")
+    router.add_prefix("e_", show_excursion_by_code, name="excursion_")
+    router.add_prefix("w_", show_city_weather_by_code, name="city_")
+    router.add_prefix("f_", show_forecast_by_code, name="weekly_")
+    # Кнопки в старых сообщениях содержат названия целиком
+    router.add_prefix("category_", show_excursions_list)
+    router.add_prefix("excursion_", show_excursion_info)
+    router.add_prefix("city_", show_city_weather)
+    router.add_prefix("weekly_", show_forecast)
+    return router
+
+router = build_router()
+
+async def routes_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /routes: время обработки кнопок (только для администраторов)"""
+    if not is_admin(update.effective_user):
+        return
+    
+    route_stats = router.get_stats()
+    if not route_stats:
+        await update.message.reply_text("Нажатий на кнопки пока не было.")
+        return
+    
+    message = "⏱ Время обработки кнопок (вызовов | среднее | p50 | p95 | ошибок):\n\n"
+    for name, stats in sorted(route_stats.items(), key=lambda item: -item[1].calls):
+        message += (
+            f"{name}: {stats.calls} | {stats.average * 1000:.0f} мс | "
+            f"≤{stats.quantile(0.5) * 1000:.0f} мс | ≤{stats.quantile(0.95) * 1000:.0f} мс | {stats.errors}\n"
+        )
+    
+    await update.message.reply_text(message)
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий на кнопки"""
     query = update.callback_query
@@ -94,87 +322,156 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_user_activity(update, f"нажал кнопку {button_name}")
     
     try:
-        if data == "start":
-            # Проверяем, есть ли у сообщения фото
-            if query.message.photo:
-                # Если есть фото, отправляем новое сообщение с главным меню
-                await query.message.reply_text(
-                    get_welcome_message(),
-                    reply_markup=get_main_menu()
-                )
-            else:
-                # Если нет фото, редактируем сообщение
-                await start_command(update, context)
-        elif data == "stickers":
-            message = "🎨 Наконец-то у нас появились фирменные стикеры!\n\n"
-            message += "Нажмите кнопку ниже, чтобы добавить стикеры в свой Telegram:"
-            
-            keyboard = [
-                [InlineKeyboardButton("🎨 Добавить стикеры", url="https://t.me/addstickers/blacksea365")],
-                [InlineKeyboardButton("« Назад в меню", callback_data="start")]
-            ]
-            await query.message.edit_text(message, reply_markup=InlineKeyboardMarkup(keyboard))
-        elif data == "excursions":
-            # Проверяем, есть ли у сообщения фото
-            if query.message.photo:
-                # Если есть фото, отправляем новое сообщение со списком категорий
-                categories = get_categories()
-                keyboard = []
-                for category in categories:
-                    keyboard.append([InlineKeyboardButton(f"🌴 {category}", callback_data=f"category_{category}")])
-                keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="start")])
-                
-                await query.message.reply_text(
-                    "🌴 Выберите категорию экскурсий:",
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-            else:
-                # Если нет фото, редактируем сообщение
-                await show_categories(update, context)
-        elif data == "weather":
-            await show_weather_menu(update, context)
-        elif data == "accommodation":
-            await show_accommodation(update, context)
-        elif data == "flights":
-            await show_flights(update, context)
-        elif data.startswith("category_"):
-            category = data.replace("category_", "")
-            await show_excursions_list(update, context, category)
-        elif data.startswith("excursion_"):
-            excursion_id = data.replace("excursion_", "")
-            await show_excursion_info(update, context, excursion_id)
-        elif data.startswith("city_"):
-            city = data.replace("city_", "")
-            await show_city_weather(update, context, city)
-        elif data.startswith("weekly_"):
-            city = data.replace("weekly_", "")
-            await show_forecast(update, context, city)
-        elif data == "back_to_cities":
-            await show_weather_menu(update, context)
-        elif data == "back_to_current":
-            city = context.user_data.get('current_city')
-            if city:
-                await show_city_weather(update, context, city)
+        if not await router.dispatch(update, context, data):
+            logger.warning(f"Неизвестная кнопка: {data}")
+            await query.answer()
     except Exception as e:
         logger.error(f"Ошибка при обработке кнопки {data}: {e}")
         # В случае ошибки отправляем новое сообщение
         await query.message.reply_text(
             "Произошла ошибка при обработке запроса. Пожалуйста, попробуйте еще раз.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("🏠 Главное меню", callback_data="start")
-            ]])
+            reply_markup=ERROR_MENU
         )
 
-def main():
-    """Основная функция запуска бота"""
-    application = Application.builder().token(BOT_TOKEN).build()
+async def on_startup(application: Application):
+    """Подготовка общих ресурсов при запуске бота"""
+    # Одна HTTP-сессия с пулом соединений на всё приложение
+    await init_http_client()
+    
+    # Журнал действий и данные пользователей пишутся пакетами в фоне
+    await action_logger.start()
+    await user_manager.start()
+    
+    # Координаты городов определяются один раз и сохраняются на диск
+    await city_registry.resolve_all(SUPPORTED_CITIES, get_session())
+    
+    # Метрики: рабочий процесс N слушает METRICS_PORT + N + 1
+    if METRICS_PORT:
+        port = METRICS_PORT + application.bot_data.get('worker_index', -1) + 1
+        server = MetricsServer(METRICS_LISTEN, port)
+        try:
+            await server.start()
+            application.bot_data['metrics_server'] = server
+        except OSError as e:
+            logger.error(f"Не удалось запустить сервер метрик на порту {port}: {e}")
+        UPDATE_QUEUE_SIZE.set_function(application.update_queue.qsize)
+    
+    # SIGUSR1 запускает профилирование без команды в чате
+    if hasattr(signal, 'SIGUSR1'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.start, PROFILE_DEFAULT_SECONDS)
+
+async def on_shutdown(application: Application):
+    """Освобождение общих ресурсов при остановке бота"""
+    server = application.bot_data.pop('metrics_server', None)
+    if server is not None:
+        await server.stop()
+    await user_manager.stop()
+    await action_logger.stop()
+    await close_http_client()
+
+# Типы обновлений, которые обрабатывает бот
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+def build_application(builder=None, shared_weather: bool = False, rate_limiter=None) -> Application:
+    """
+    Создание приложения со всеми обработчиками и фоновыми задачами
+
+    :param builder: ApplicationBuilder (по умолчанию — с токеном из конфигурации)
+    :param shared_weather: Брать погоду из общего снимка вместо запросов к API
+    :param rate_limiter: Планировщик исходящих запросов (по умолчанию FloodRateLimiter)
+    """
+    builder = builder or Application.builder().token(BOT_TOKEN)
+    # Общий лимит бота делится между рабочими процессами
+    builder.rate_limiter(rate_limiter or FloodRateLimiter(global_rate=RATE_LIMIT_GLOBAL / max(WORKERS, 1)))
+    # Выборочная трассировка обновлений (TRACE_SAMPLE_RATE)
+    builder.application_class(TracingApplication)
+    application = builder.post_init(on_startup).post_shutdown(on_shutdown).build()
     
     # Добавляем обработчики команд
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("menu", menu_command))
+    # Время обработки попадает в метрики bot_handler_duration_seconds
+    application.add_handler(CommandHandler("start", timed("start_command")(start_command)))
+    application.add_handler(CommandHandler("menu", timed("menu_command")(menu_command)))
+    application.add_handler(CommandHandler("stats", timed("stats_command")(stats_command)))
+    application.add_handler(CommandHandler("actions", timed("actions_command")(actions_command)))
+    application.add_handler(CommandHandler("routes", timed("routes_command")(routes_command)))
+    application.add_handler(CommandHandler("warm_photos", timed("warm_photos_command")(warm_photos_command)))
+    application.add_handler(CommandHandler("profile", timed("profile_command")(profile_command)))
+    # Кнопки замеряются по маршрутам в CallbackRouter.dispatch (handler=имя маршрута)
     application.add_handler(CallbackQueryHandler(button_handler))
     
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Горячая перезагрузка каталога при изменении price.xls
+    application.job_queue.run_repeating(reload_catalog_job, interval=CATALOG_RELOAD_INTERVAL, first=CATALOG_RELOAD_INTERVAL)
+    
+    if shared_weather:
+        # Рабочий процесс: погоду обновляет приёмный процесс и публикует снимок
+        application.job_queue.run_repeating(sync_weather_snapshot_job, interval=WEATHER_SNAPSHOT_POLL_INTERVAL, first=WEATHER_SNAPSHOT_POLL_INTERVAL)
+    else:
+        # Фоновое обновление погоды: экраны погоды отдают уже готовые данные
+        application.job_queue.run_repeating(prefetch_weather_job, interval=WEATHER_UPDATE_INTERVAL, first=0)
+    
+    return application
+
+async def run_webhook(application: Application):
+    """Запуск бота в режиме вебхука со встроенным HTTP-сервером"""
+    server = WebhookServer(application_sink(application), WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: остановка по KeyboardInterrupt
+            pass
+    
+    await application.initialize()
+    try:
+        await application.post_init(application)
+        await application.start()
+        await server.start()
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=ALLOWED_UPDATES
+            )
+            logger.info(f"Вебхук зарегистрирован: {WEBHOOK_URL}")
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+def main():
+    """Основная функция запуска бота"""
+    if BOT_RUN_MODE == 'webhook' and not WEBHOOK_SECRET:
+        logger.error("Для режима вебхука нужен WEBHOOK_SECRET: без него запросы к боту не проверяются")
+        return
+    
+    # Загружаем каталог экскурсий заранее, чтобы не читать price.xls при нажатиях
+    catalog.load()
+    
+    if WORKERS < BOT_WORKERS:
+        logger.warning("Многопроцессный режим не поддерживается в Windows, бот запускается в одном процессе")
+    
+    if WORKERS > 1:
+        # Приёмный процесс распределяет обновления по рабочим процессам
+        try:
+            asyncio.run(run_sharded(WORKERS, ALLOWED_UPDATES))
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    application = build_application()
+    
+    if BOT_RUN_MODE == 'webhook':
+        try:
+            asyncio.run(run_webhook(application))
+        except KeyboardInterrupt:
+            pass
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
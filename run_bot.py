@@ -56,17 +56,18 @@ def install_requirements():
         logger.error(f"Ошибка при установке зависимостей: {e}")
         raise
 
-try:
-    # Устанавливаем зависимости перед запуском
-    install_requirements()
+# Рабочие процессы (BOT_WORKERS > 1) импортируют этот файл заново: установка и запуск только в основном процессе
+if __name__ == '__main__':
+    try:
+        # Устанавливаем зависимости перед запуском
+        install_requirements()
     
-    logger.info("Запуск бота...")
-    from main import main
+        logger.info("Запуск бота...")
+        from main import main
     
-    if __name__ == '__main__':
         main()
         
-except Exception as e:
-    logger.error(f"Ошибка при запуске бота: {e}", exc_info=True)
-    # Держим окно открытым в случае ошибки
-    input("Нажмите Enter для выхода...") 
\ No newline at end of file
+    except Exception as e:
+        logger.error(f"Ошибка при запуске бота: {e}", exc_info=True)
+        # Держим окно открытым в случае ошибки
+        input("Нажмите Enter для выхода...") 
\ No newline at end of file
@@ -0,0 +1,48 @@
+import csv
+from datetime import datetime
+import pytest
+from utils.action_index import ActionIndex
+from utils.action_logger import CSV_HEADER
+
+@pytest.fixture
+def index(tmp_path):
+    """Журнал с действиями двух пользователей: у пользователя 1 по одному действию в день"""
+    csv_file = tmp_path / 'actions_log.csv'
+    with open(csv_file, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_HEADER)
+        for day in range(1, 11):
+            writer.writerow([f'{day:02d}.03.2025 12:00:00', '1', 'user1', 'Имя', '', f'действие {day}', 'command', '', 'success'])
+            writer.writerow([f'{day:02d}.03.2025 12:30:00', '2', 'user2', 'Имя', '', 'погода', 'command', '', 'success'])
+        # Перевод строки внутри поля не разбивает запись
+        writer.writerow(['11.03.2025 09:00:00', '1', 'user1', 'Имя', '', 'действие 11', 'command', 'строка\nвторая', 'success'])
+    index = ActionIndex(str(csv_file), str(tmp_path / 'actions_index.db'), CSV_HEADER)
+    assert index.sync() == 21
+    yield index
+    index.close()
+
+def actions(rows) -> list:
+    return [row['Действие'] for row in rows]
+
+def test_paging(index):
+    assert index.count_user_actions(1) == 11
+    assert actions(index.get_user_actions(1, limit=3)) == ['действие 1', 'действие 2', 'действие 3']
+    assert actions(index.get_user_actions(1, limit=3, offset=9)) == ['действие 10', 'действие 11']
+    assert index.get_user_actions(1, limit=3, offset=11) == []
+    assert actions(index.get_user_actions(1, limit=2, offset=1, newest_first=True)) == ['действие 10', 'действие 9']
+    # Страницы не пересекаются и покрывают всю историю
+    pages = [actions(index.get_user_actions(1, limit=4, offset=offset)) for offset in (0, 4, 8)]
+    assert sum(pages, []) == actions(index.get_user_actions(1))
+    assert index.get_user_actions(1)[-1]['Дополнительные данные'] == 'строка\nвторая'
+
+def test_time_range(index):
+    since = datetime(2025, 3, 3, 12, 0)
+    until = datetime(2025, 3, 5, 12, 0)
+    # Границы включаются
+    assert actions(index.get_user_actions(1, since=since, until=until)) == ['действие 3', 'действие 4', 'действие 5']
+    assert index.count_user_actions(1, since=since, until=until) == 3
+    assert index.count_user_actions(2, since=since, until=until) == 2
+    # Unix-время равнозначно datetime в часовом поясе бота
+    assert index.count_user_actions(1, since=index.to_timestamp(since)) == 9
+    assert actions(index.get_user_actions(1, limit=1, offset=1, since=since, until=until)) == ['действие 4']
+    assert index.get_user_actions(1, until=datetime(2025, 2, 28)) == []
@@ -0,0 +1,76 @@
+import asyncio
+import sqlite3
+from utils import action_logger as action_logger_module
+from utils.action_logger import ActionLogger
+from utils.csv_log import read_records
+
+USER = {'id': 42, 'username': 'user42', 'first_name': 'User'}
+
+def make_logger(tmp_path, **kwargs):
+    return ActionLogger(str(tmp_path / 'actions_log.csv'), str(tmp_path / 'actions_stats.json'),
+                        str(tmp_path / 'actions_index.db'), flush_interval=0.01, **kwargs)
+
+def logged_rows(log) -> int:
+    records, _ = read_records(log.csv_file)
+    # Первая запись — заголовок
+    return len(records) - 1
+
+def test_index_error_does_not_stop_flushing(tmp_path, monkeypatch):
+    log = make_logger(tmp_path, max_buffer=10)
+    sync = log.index.sync
+    failures = []
+
+    def locked_once():
+        if not failures:
+            failures.append(True)
+            raise sqlite3.OperationalError("database is locked")
+        return sync()
+
+    monkeypatch.setattr(log.index, 'sync', locked_once)
+
+    async def run():
+        await log.start()
+        for number in range(5):
+            log.log_action(USER, f"действие {number}")
+        await log.flush()
+        # Строки уже в журнале: ошибка индекса не возвращает их в буфер
+        assert log._buffer == []
+        for number in range(5, 8):
+            log.log_action(USER, f"действие {number}")
+        await asyncio.sleep(0.1)
+        assert not log._flush_task.done()
+        await log.stop()
+
+    asyncio.run(run())
+    assert failures
+    assert logged_rows(log) == 8
+    # Индекс догнал журнал при следующей записи
+    assert log.count_user_actions(42) == 8
+    assert log.dropped_rows == 0
+
+def test_failed_writes_keep_buffer_bounded(tmp_path, monkeypatch):
+    log = make_logger(tmp_path, max_buffer=10)
+    real_open = action_logger_module.os.open
+    broken = [True]
+
+    def failing_open(path, *args, **kwargs):
+        if broken[0] and path == log.csv_file:
+            raise OSError(28, "No space left on device")
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(action_logger_module.os, 'open', failing_open)
+
+    async def run():
+        await log.start()
+        for number in range(50):
+            log.log_action(USER, f"действие {number}")
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        assert len(log._buffer) <= 10
+        assert not log._flush_task.done()
+        broken[0] = False
+        await log.stop()
+
+    asyncio.run(run())
+    assert log.dropped_rows == 40
+    assert logged_rows(log) == 10
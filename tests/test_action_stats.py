@@ -0,0 +1,43 @@
+from utils.action_stats import HyperLogLog, ActionStatistics
+
+def test_hyperloglog_estimate():
+    counter = HyperLogLog()
+    for value in range(50000):
+        counter.add(value)
+        # Повторы не меняют оценку
+        counter.add(value)
+    # Стандартная ошибка при precision=12 — около 1.6%
+    assert abs(len(counter) - 50000) / 50000 < 0.05
+
+def test_hyperloglog_small_counts_and_state():
+    counter = HyperLogLog()
+    for value in range(100):
+        counter.add(f"user{value}")
+    # Для малых количеств работает линейный подсчёт по пустым регистрам
+    assert abs(len(counter) - 100) <= 10
+
+    restored = HyperLogLog.from_state(counter.to_state())
+    assert len(restored) == len(counter)
+
+def test_statistics_follow_log_tail(tmp_path):
+    csv_file = tmp_path / 'actions.csv'
+    stats_file = str(tmp_path / 'stats.json')
+    csv_file.write_text('Дата и время,ID,u,f,l,Действие,Тип,Данные,Статус\n', encoding='utf-8')
+    with open(csv_file, 'a', encoding='utf-8') as file:
+        file.write('01.07.2026 10:00:00,1,u,f,,a,command,,Успешно\n')
+        file.write('01.07.2026 10:00:01,2,u,f,,a,command,,Ошибка\n')
+
+    stats = ActionStatistics(str(csv_file), stats_file, unique_mode='exact')
+    assert stats.sync() == 2
+    stats.save()
+    assert not stats.dirty
+
+    with open(csv_file, 'a', encoding='utf-8') as file:
+        file.write('01.07.2026 10:00:02,1,u,f,,b,button_click,,Успешно\n')
+    restored = ActionStatistics(str(csv_file), stats_file, unique_mode='exact')
+    restored.load()
+    assert restored.sync() == 1
+    result = restored.get()
+    assert result['всего_действий'] == 3
+    assert result['уникальных_пользователей'] == 2
+    assert result['ошибок'] == 1
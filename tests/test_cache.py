@@ -0,0 +1,52 @@
+import asyncio
+from utils.cache import AsyncTTLCache
+
+def make_expired_cache(key, value):
+    """Кеш, в котором запись для key уже устарела"""
+    cache = AsyncTTLCache(ttl=0, name='test')
+    cache.set(key, value)
+    cache.ttl = 60
+    return cache
+
+def test_concurrent_misses_fetch_once():
+    cache = make_expired_cache('Сочи', 'старое')
+    calls = []
+
+    async def fetcher():
+        calls.append(True)
+        await asyncio.sleep(0.01)
+        return 'новое'
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_fetch('Сочи', fetcher) for _ in range(20)))
+
+    assert asyncio.run(run()) == ['новое'] * 20
+    assert len(calls) == 1
+    assert cache.get('Сочи') == 'новое'
+    assert not cache._inflight
+
+def test_stale_value_is_returned_while_refreshing():
+    cache = make_expired_cache('Сочи', 'старое')
+    release = None
+    calls = []
+
+    async def fetcher():
+        calls.append(True)
+        await release.wait()
+        return 'новое'
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        # Устаревшее значение отдаётся, не дожидаясь fetcher
+        first = await asyncio.wait_for(cache.get_or_fetch('Сочи', fetcher, allow_stale=True), 0.1)
+        second = await cache.get_or_fetch('Сочи', fetcher, allow_stale=True)
+        assert 'Сочи' in cache._inflight
+        release.set()
+        await cache._inflight['Сочи']
+        return first, second
+
+    assert asyncio.run(run()) == ('старое', 'старое')
+    # Обновление в фоне было одно на оба вызова
+    assert len(calls) == 1
+    assert cache.get('Сочи') == 'новое'
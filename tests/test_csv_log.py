@@ -0,0 +1,41 @@
+import csv
+from utils.csv_log import read_records, read_record
+
+def write_rows(path, rows):
+    with open(path, 'a', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(rows)
+
+def test_reads_from_offset(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    write_rows(path, [['a', '1'], ['b', '2']])
+
+    records, offset = read_records(path)
+    assert [fields for _, _, fields in records] == [['a', '1'], ['b', '2']]
+
+    write_rows(path, [['c', '3']])
+    records, next_offset = read_records(path, offset)
+    assert [fields for _, _, fields in records] == [['c', '3']]
+    assert read_record(path, records[0][0], records[0][1]) == ['c', '3']
+    assert read_records(path, next_offset) == ([], next_offset)
+
+def test_partial_last_line_is_not_consumed(tmp_path):
+    path = tmp_path / 'log.csv'
+    path.write_bytes(b'a,1\r\nb,2')
+
+    records, offset = read_records(str(path))
+    assert [fields for _, _, fields in records] == [['a', '1']]
+    assert offset == len(b'a,1\r\n')
+
+    with open(path, 'ab') as file:
+        file.write(b'\r\n')
+    records, offset = read_records(str(path), offset)
+    assert [fields for _, _, fields in records] == [['b', '2']]
+    assert offset == path.stat().st_size
+
+def test_carriage_return_inside_quoted_field(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    write_rows(path, [['a', 'line\rbreak'], ['b', 'multi\nline'], ['c', '3']])
+
+    records, offset = read_records(path)
+    assert [fields for _, _, fields in records] == [['a', 'line\rbreak'], ['b', 'multi\nline'], ['c', '3']]
+    assert offset == len(open(path, 'rb').read())
@@ -0,0 +1,20 @@
+import pytest
+from utils.callback_codec import encode_excursion_id, decode_excursion_id
+from utils.excursion_catalog import CatalogState
+
+def record(excursion_id, name='Экскурсия'):
+    return {'Категория': 'Прогулки', 'Название': name, 'Идентификатор': excursion_id}
+
+def test_ids_are_normalised_once():
+    # pandas отдаёт колонку с пропусками как float
+    state = CatalogState([record(17.0, 'А'), record('18', 'Б'), record(18.5, 'В'), record('abc', 'Г')])
+    assert sorted(state.by_id) == ['17', '18']
+    assert state.by_id['17']['Идентификатор'] == 17
+
+    # Код кнопки ведёт к той же записи
+    code = encode_excursion_id(state.by_id['17']['Идентификатор'])
+    assert state.by_id[decode_excursion_id(code)]['Название'] == 'А'
+
+def test_fractional_id_is_not_truncated():
+    with pytest.raises(TypeError):
+        encode_excursion_id(18.5)
@@ -0,0 +1,75 @@
+import time
+import asyncio
+import pytest
+from telegram.error import RetryAfter
+from utils.rate_limiter import TokenBucket, FloodRateLimiter, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+def test_token_bucket_refill():
+    bucket = TokenBucket(rate=10, capacity=2)
+    bucket.updated = 100.0
+    bucket.take(100.0)
+    bucket.take(100.0)
+    assert bucket.delay(100.0) == pytest.approx(0.1)
+    assert bucket.delay(100.05) == pytest.approx(0.05)
+    # Маркер появился, но корзина ещё не полна
+    assert bucket.delay(100.1) == pytest.approx(0)
+    assert not bucket.is_full(100.1)
+    # Маркеров не больше capacity, сколько бы времени ни прошло
+    assert bucket.is_full(200.0)
+    assert bucket.tokens == 2
+
+def send(limiter, sent, name, chat_id=None, priority=PRIORITY_INTERACTIVE, endpoint='sendMessage'):
+    """Запрос через планировщик; sent — порядок и время фактической отправки"""
+    async def callback():
+        sent.append((name, time.monotonic()))
+        return True
+
+    data = {'chat_id': chat_id} if chat_id is not None else {}
+    return limiter.process_request(callback, (), {}, endpoint, data, {'priority': priority})
+
+def test_background_yields_to_user_traffic():
+    async def run():
+        limiter = FloodRateLimiter(global_rate=20, chat_rate=100, chat_burst=100)
+        # Общая корзина пуста: оба запроса ждут маркер
+        limiter.global_bucket.tokens = 0
+        sent = []
+        background = asyncio.create_task(send(limiter, sent, 'background', 1, PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(send(limiter, sent, 'interactive', 2))
+        await asyncio.gather(background, interactive)
+        await limiter.shutdown()
+        return [name for name, _ in sent]
+
+    assert asyncio.run(run()) == ['interactive', 'background']
+
+def test_retry_after_pauses_all_requests():
+    async def run():
+        limiter = FloodRateLimiter(global_rate=100, chat_rate=100, chat_burst=100)
+        sent = []
+        attempts = []
+
+        async def flooded():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RetryAfter(0.2)
+            return True
+
+        started = time.monotonic()
+        request = asyncio.create_task(
+            limiter.process_request(flooded, (), {}, 'sendMessage', {'chat_id': 1}, None)
+        )
+        await asyncio.sleep(0.05)
+        # Запросы без chat_id и в другие чаты тоже ждут окончания паузы
+        await asyncio.gather(
+            send(limiter, sent, 'answer', endpoint='answerCallbackQuery'),
+            send(limiter, sent, 'other_chat', 2),
+        )
+        assert await request is True
+        await limiter.shutdown()
+        return started, attempts, sent, limiter.retries
+
+    started, attempts, sent, retries = asyncio.run(run())
+    assert retries == 1
+    assert len(attempts) == 2
+    assert attempts[1] - started >= 0.2
+    assert all(moment - started >= 0.2 for _, moment in sent)
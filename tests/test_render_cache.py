@@ -0,0 +1,26 @@
+from utils.render_cache import RenderCache
+
+def test_per_key_versions_are_kept():
+    cache = RenderCache('test_render')
+    built = []
+
+    def builder(value):
+        return lambda: built.append(value) or value
+
+    assert cache.get('Сочи', 1, builder('Сочи 1')) == 'Сочи 1'
+    assert cache.get('Адлер', 5, builder('Адлер 5')) == 'Адлер 5'
+    assert cache.get('Сочи', 2, builder('Сочи 2')) == 'Сочи 2'
+    # Версия одного ключа не влияет на остальные
+    assert cache.get('Адлер', 5, builder('Адлер 6')) == 'Адлер 5'
+    assert built == ['Сочи 1', 'Адлер 5', 'Сочи 2']
+
+def test_shared_version_change_drops_old_keys():
+    cache = RenderCache('test_render', shared_version=True)
+    for excursion_id in range(3):
+        cache.get(('info', excursion_id), 1, lambda: 'старый текст')
+    assert len(cache._entries) == 3
+
+    # Каталог перезагружен: записи удалённых экскурсий не остаются в памяти
+    assert cache.get(('info', 0), 2, lambda: 'новый текст') == 'новый текст'
+    assert list(cache._entries) == [('info', 0)]
+    assert cache.get(('info', 0), 2, lambda: 'лишняя сборка') == 'новый текст'
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from utils.router import CallbackRouter
+
+async def handler(update, context, *args):
+    pass
+
+async def failing(update, context, *args):
+    raise RuntimeError("ошибка обработчика")
+
+def make_router(suffix=''):
+    """Таблица маршрутов как в main.build_application; suffix делает имена уникальными для метрик"""
+    router = CallbackRouter()
+    router.add_exact("main_menu", handler, name=f"start{suffix}")
+    router.add_exact("weather", handler, name=f"weather{suffix}")
+    router.add_exact("back_to_cities", handler, name=f"weather{suffix}")
+    router.add_prefix("c_", handler, name=f"category_{suffix}")
+    router.add_prefix("e_", failing, name=f"excursion_{suffix}")
+    # Старые кнопки в уже отправленных сообщениях
+    router.add_prefix("category_", handler, name=f"category_{suffix}")
+    router.add_prefix("excursion_", failing, name=f"excursion_{suffix}")
+    return router
+
+@pytest.mark.parametrize('data, name, args', [
+    ("main_menu", "start", ()),
+    ("weather", "weather", ()),
+    ("back_to_cities", "weather", ()),
+    ("c_3f", "category_", ("3f",)),
+    ("e_17", "excursion_", ("17",)),
+    ("category_Морские прогулки", "category_", ("Морские прогулки",)),
+    # Payload может содержать «_»: делится только первый
+    ("category_Джип_туры", "category_", ("Джип_туры",)),
+    ("excursion_17", "excursion_", ("17",)),
+    ("excursion_", "excursion_", ("",)),
+])
+def test_resolve(data, name, args):
+    route = make_router().resolve(data)
+    assert route is not None
+    assert (route[0], route[2]) == (name, args)
+
+@pytest.mark.parametrize('data', ["", "unknown", "weather_", "x_1", "main", "_17"])
+def test_resolve_unknown(data):
+    assert make_router().resolve(data) is None
+
+def test_prefix_must_be_single_word():
+    router = CallbackRouter()
+    with pytest.raises(ValueError):
+        router.add_prefix("back_to_", handler)
+    with pytest.raises(ValueError):
+        router.add_prefix("city", handler)
+
+def test_route_stats():
+    router = make_router('_stats')
+
+    async def run():
+        assert not await router.dispatch(None, None, "unknown")
+        for data in ("weather", "back_to_cities", "c_1"):
+            assert await router.dispatch(None, None, data)
+        with pytest.raises(RuntimeError):
+            await router.dispatch(None, None, "excursion_17")
+
+    asyncio.run(run())
+    stats = router.get_stats()
+    assert sorted(stats) == ['category__stats', 'excursion__stats', 'weather_stats']
+    assert stats['weather_stats'].calls == 2
+    assert stats['weather_stats'].errors == 0
+    assert stats['excursion__stats'].calls == 1
+    assert stats['excursion__stats'].errors == 1
+    assert 0 < stats['category__stats'].average <= stats['category__stats'].quantile(0.95)
@@ -0,0 +1,28 @@
+from main import router
+from handlers.weather_handler import city_callback, forecast_callback
+from utils.action_logger import ActionLogger
+from utils.callback_codec import CATEGORY_PREFIX, EXCURSION_PREFIX, encode_excursion_id
+from tools.traffic_profile import read_events
+from tools.updates import route_payloads
+
+def test_routes_from_current_log(tmp_path):
+    log = ActionLogger(str(tmp_path / 'actions_log.csv'), str(tmp_path / 'actions_stats.json'),
+                       str(tmp_path / 'actions_index.db'))
+    user = {'id': 42, 'username': 'user42', 'first_name': 'User'}
+    clicks = [
+        'weather', city_callback('Сочи'), forecast_callback('Сочи'), 'back_to_cities', 'main_menu',
+        'excursions', f"{CATEGORY_PREFIX}1A", f"{EXCURSION_PREFIX}{encode_excursion_id(17)}",
+    ]
+    # Так же, как журнал пишут start_command и button_handler
+    log.log_action(user, 'Запуск бота', 'button_click')
+    for data in clicks:
+        log.log_action(user, f"нажал кнопку {data.replace('_', ' ').title()}", 'button_click')
+
+    routes = [route for _, _, route in read_events(log.csv_file, router)]
+    assert routes == [
+        'start_command', 'weather', 'city_', 'weekly_', 'back_to_cities', 'start',
+        'excursions', 'category_', 'excursion_',
+    ]
+    # Для каждого маршрута нагрузочный тест умеет построить обновление
+    payloads = route_payloads()
+    assert all(route.endswith('_command') or payloads.get(route) for route in routes)
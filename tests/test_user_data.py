@@ -0,0 +1,71 @@
+import csv
+import asyncio
+import threading
+from utils.user_data import UserDataManager, USER_FIELDS, SCHEMA_VERSION
+
+def make_manager(tmp_path, **kwargs):
+    return UserDataManager(str(tmp_path / 'users.db'), str(tmp_path / 'users.csv'), flush_interval=60, **kwargs)
+
+def user(user_id, **fields):
+    return dict({'id': user_id, 'username': f'user{user_id}', 'first_name': 'Имя'}, **fields)
+
+def test_users_are_migrated_from_csv_once(tmp_path):
+    with open(tmp_path / 'users.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=USER_FIELDS)
+        writer.writeheader()
+        writer.writerow({'user_id': '1', 'username': 'old', 'phone_number': '+7900', 'registration_date': '2024-01-01 10:00:00'})
+        writer.writerow({'user_id': '', 'username': 'битая строка'})
+        writer.writerow({'user_id': '2', 'username': 'second'})
+
+    manager = make_manager(tmp_path)
+    assert manager.conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert [row['user_id'] for row in manager.read_users()] == [1, 2]
+    assert manager.get_user(1)['phone_number'] == '+7900'
+    manager.update_user(user(1), 'start')
+    manager.close()
+
+    # Повторный запуск не переносит CSV заново и не затирает новые данные
+    manager = make_manager(tmp_path)
+    assert manager.get_user(1)['username'] == 'user1'
+    assert manager.get_user(1)['registration_date'] == '2024-01-01 10:00:00'
+    manager.close()
+
+def test_evicted_dirty_user_is_persisted(tmp_path):
+    manager = make_manager(tmp_path, cache_size=2)
+
+    async def run():
+        await manager.start()
+        for user_id in (1, 2, 3):
+            manager.update_user(user(user_id), 'start')
+        manager.update_phone_number(1, '+7900')
+        await manager.flush()
+        # Сверх cache_size вытеснены давно активные, уже записанные пользователи
+        assert list(manager._cache) == [2, 3]
+        # Вытесненный пользователь снова активен: запись читается из базы и изменяется
+        manager.log_user_action(1, 'weather')
+        assert 1 in manager._dirty
+        await manager.flush()
+        manager.update_user(user(2, username='renamed'), 'help')
+        await manager.stop()
+
+    asyncio.run(run())
+    stored = {row['user_id']: row for row in manager.read_users()}
+    assert stored[1]['last_command'] == 'weather'
+    assert stored[1]['phone_number'] == '+7900'
+    assert stored[2]['username'] == 'renamed'
+    assert stored[3]['last_command'] == 'start'
+    manager.close()
+
+def test_cache_miss_does_not_wait_for_flush(tmp_path):
+    manager = make_manager(tmp_path)
+    manager.update_user(user(1), 'start')
+    read = []
+
+    # Поток отложенной записи держит блокировку основного соединения
+    with manager._lock:
+        reader = threading.Thread(target=lambda: read.append(manager._read_user(1)))
+        reader.start()
+        reader.join(timeout=1)
+        assert not reader.is_alive()
+    assert read[0]['username'] == 'user1'
+    manager.close()
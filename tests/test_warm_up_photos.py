@@ -0,0 +1,53 @@
+import json
+import asyncio
+from telegram.ext import ExtBot
+import handlers.excursions_handler as excursions_handler
+from tools.fake_telegram import RecordingRequest
+from utils.excursion_catalog import CatalogState
+from utils.photo_cache import PhotoCache
+from utils.rate_limiter import FloodRateLimiter
+
+BROKEN_PHOTO = 'https://example.com/broken.jpg'
+
+class FailingRequest(RecordingRequest):
+    """Telegram отклоняет одно из фото"""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if request_data is not None and request_data.parameters.get('photo') == BROKEN_PHOTO:
+            self.calls['sendPhoto'] += 1
+            body = {"ok": False, "error_code": 400, "description": "Bad Request: wrong file identifier"}
+            return 400, json.dumps(body).encode('utf-8')
+        return await super().do_request(url, method, request_data, **kwargs)
+
+class StubCatalog:
+    def __init__(self, records):
+        self.state = CatalogState(records)
+
+def excursion(excursion_id, photo):
+    return {'Категория': 'Прогулки', 'Название': f'Экскурсия {excursion_id}', 'Идентификатор': excursion_id, 'Фото': photo}
+
+def test_warm_up_photos_counts(tmp_path, monkeypatch):
+    cache = PhotoCache(str(tmp_path / 'photo_cache.db'))
+    monkeypatch.setattr(excursions_handler, 'photo_cache', cache)
+    monkeypatch.setattr(excursions_handler, 'catalog', StubCatalog([
+        excursion(1, 'https://example.com/1.jpg'),
+        excursion(2, 'https://example.com/2.jpg'),
+        excursion(3, BROKEN_PHOTO),
+        excursion(4, ''),
+    ]))
+    request = FailingRequest()
+    limiter = FloodRateLimiter(global_rate=1e9, chat_rate=1e9, chat_burst=1e9)
+
+    async def run():
+        bot = ExtBot('1:test', request=request, get_updates_request=RecordingRequest(), rate_limiter=limiter)
+        async with bot:
+            first = await excursions_handler.warm_up_photos(bot, -100, delay=0)
+            # Загруженные фото уже в кеше и повторно не отправляются
+            second = await excursions_handler.warm_up_photos(bot, -100, delay=0)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == (2, 1)
+    assert second == (0, 1)
+    assert request.calls['deleteMessage'] == 2
+    assert cache.get(1, 'https://example.com/1.jpg')
@@ -0,0 +1,107 @@
+import json
+import time
+import asyncio
+import aiohttp
+import pytest
+from aiohttp import web
+import utils.weather as weather
+from utils.cache import AsyncTTLCache
+from utils.geocoding import CityRegistry
+from tools.weather_stub import WeatherStub, FaultPolicy, CITY_FIXTURES
+
+CITIES = ['Сочи', 'Адлер', 'Хоста']
+
+# Таймаут чтения в тестах: зависший ответ заглушки не должен задерживать прогон
+READ_TIMEOUT = 0.3
+
+@pytest.fixture(autouse=True)
+def weather_env(tmp_path, monkeypatch):
+    """Реестр городов, кеш и флаг группового запроса — свои для каждого теста"""
+    registry_file = tmp_path / 'cities.json'
+    registry_file.write_text(json.dumps({
+        city: {"lat": lat, "lon": lon, "group_id": city_id}
+        for city, (lat, lon, city_id) in CITY_FIXTURES.items()
+    }, ensure_ascii=False), encoding='utf-8')
+    monkeypatch.setattr(weather, 'city_registry', CityRegistry(str(registry_file)))
+    monkeypatch.setattr(weather, 'weather_cache', AsyncTTLCache(ttl=60, name='test_weather'))
+    monkeypatch.setattr(weather, '_group_unavailable', False)
+    monkeypatch.setattr(weather, 'WEATHER_API_KEY', 'stub')
+
+def run_with_stub(monkeypatch, faults, scenario, stub=None):
+    """Запуск сценария против заглушки OpenWeatherMap с короткими таймаутами клиента"""
+    async def run():
+        nonlocal stub
+        stub = stub or WeatherStub(faults=faults)
+        monkeypatch.setattr(weather, 'WEATHER_API_URL', await stub.start())
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=READ_TIMEOUT))
+        monkeypatch.setattr(weather, 'get_session', lambda: session)
+        try:
+            return await scenario(stub)
+        finally:
+            await session.close()
+            await stub.stop()
+    return asyncio.run(run())
+
+def test_group_rate_limit_falls_back_to_single_requests(monkeypatch):
+    async def scenario(stub):
+        results = await weather.get_weather_batch(CITIES)
+        assert all(weather.is_successful(data) for data in results.values())
+        assert stub.requests['group'] == 1
+        assert stub.requests['weather'] == len(CITIES)
+        # 429 — временная ошибка: групповой запрос будет повторён в следующем цикле
+        assert weather._group_unavailable is False
+
+    run_with_stub(monkeypatch, FaultPolicy(rate_limit_rate=1.0, endpoints={'group'}), scenario)
+
+def test_group_server_error_returns_no_results(monkeypatch):
+    async def scenario(stub):
+        assert await weather.fetch_weather_group(CITIES) == {}
+        assert weather._group_unavailable is False
+
+    run_with_stub(monkeypatch, FaultPolicy(error_rate=1.0, endpoints={'group'}), scenario)
+
+def test_group_unavailable_is_remembered(monkeypatch):
+    stub = WeatherStub()
+
+    async def forbidden(request):
+        return web.json_response({"cod": 401, "message": "Invalid API key"}, status=401)
+
+    # Групповой эндпоинт не входит в тариф ключа
+    stub.handle_group = forbidden
+
+    async def scenario(stub):
+        first = await weather.get_weather_batch(CITIES)
+        assert weather._group_unavailable is True
+        second = await weather.get_weather_batch(CITIES)
+        assert all(weather.is_successful(data) for data in [*first.values(), *second.values()])
+        assert stub.requests['group'] == 1
+        assert stub.requests['weather'] == 2 * len(CITIES)
+
+    run_with_stub(monkeypatch, None, scenario, stub)
+
+@pytest.mark.parametrize('faults', [
+    FaultPolicy(error_rate=1.0),
+    FaultPolicy(rate_limit_rate=1.0),
+    FaultPolicy(timeout_rate=1.0, hang=1.0),
+], ids=['500', '429', 'timeout'])
+def test_stale_weather_is_served_when_api_fails(monkeypatch, faults):
+    async def scenario(stub):
+        fresh = await weather.get_weather('Сочи')
+        assert weather.is_successful(fresh)
+
+        # Запись устарела, а API начал отвечать ошибками
+        weather.weather_cache.ttl = 0
+        weather.weather_cache.set(('Сочи', 'weather'), weather.weather_cache.get_stale(('Сочи', 'weather')))
+        stub.faults = faults
+
+        started = time.perf_counter()
+        assert await weather.get_weather('Сочи') == fresh
+        # Устаревшее значение отдаётся сразу, не дожидаясь ответа API
+        assert time.perf_counter() - started < READ_TIMEOUT
+
+        failed = await weather.fetch_weather('Сочи')
+        assert not weather.is_successful(failed)
+        # Ошибка не вытесняет последнее удачное значение
+        assert await weather.get_weather('Сочи') == fresh
+
+    run_with_stub(monkeypatch, None, scenario)
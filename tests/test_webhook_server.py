@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from utils.webhook_server import WebhookServer, SECRET_HEADER
+
+SECRET = 'secret_123'
+PATH = '/telegram'
+
+def post(headers=None, data=None, json=None):
+    """POST на вебхук; возвращает статус, ответ и принятые обновления"""
+    received = []
+
+    async def sink(item):
+        received.append(item)
+
+    async def run():
+        server = WebhookServer(sink, '127.0.0.1', 0, PATH, SECRET)
+        app = web.Application()
+        app.router.add_post(PATH, server.handle)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(PATH, headers=headers, data=data, json=json)
+            return response.status, await response.json()
+
+    status, body = asyncio.run(run())
+    return status, body, received
+
+def secret_header(secret=SECRET):
+    # Заголовок уходит байтами UTF-8, как его прислал бы произвольный клиент
+    return {SECRET_HEADER: secret.encode('utf-8').decode('latin-1')}
+
+@pytest.mark.parametrize('headers', [None, secret_header('чужой'), {SECRET_HEADER: ''}],
+                         ids=['missing', 'wrong', 'empty'])
+def test_invalid_secret_is_rejected(headers):
+    status, body, received = post(headers=headers, json={'update_id': 1})
+    assert status == 403
+    assert received == []
+
+def test_malformed_body_is_rejected():
+    status, body, received = post(headers=secret_header(), data=b'{"update_id": ')
+    assert status == 400
+    assert body == {"error": "invalid JSON"}
+    assert received == []
+
+def test_batch_is_accepted():
+    status, body, received = post(headers=secret_header(), json=[{'update_id': 1}, 'мусор', {'update_id': 2}])
+    assert status == 200
+    assert body == {"accepted": 2}
+    assert [item['update_id'] for item in received] == [1, 2]
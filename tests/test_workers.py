@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+from utils.workers import shard_key, UpdateSequencer
+
+def message_update(update_id, user_id, chat_id=-100):
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'from': {'id': user_id}, 'chat': {'id': chat_id}, 'text': 'Погода'
+    }}
+
+def test_shard_key_is_stable_for_user():
+    message = message_update(1, 42)
+    callback = {'update_id': 2, 'callback_query': {
+        'id': 'q', 'from': {'id': 42}, 'message': {'message_id': 7, 'chat': {'id': -100}}, 'data': 'weather'
+    }}
+    assert shard_key(message) == shard_key(callback) == 42
+    assert shard_key(message_update(3, 42, chat_id=-200)) == 42
+    # Без отправителя — по чату, без чата — по update_id
+    assert shard_key({'update_id': 4, 'channel_post': {'message_id': 1, 'chat': {'id': -300}}}) == -300
+    assert shard_key({'update_id': 5}) == 5
+
+class RecordingApplication:
+    """Приложение, у которого первое обновление пользователя обрабатывается дольше остальных"""
+
+    def __init__(self):
+        self.started = []
+        self.finished = []
+
+    async def process_update(self, update):
+        self.started.append(update.update_id)
+        await asyncio.sleep(0.05 if update.update_id in (1, 2) else 0)
+        if update.update_id == 4:
+            raise RuntimeError("ошибка обработчика")
+        self.finished.append(update.update_id)
+
+def test_sequencer_keeps_per_user_order():
+    application = RecordingApplication()
+
+    async def run():
+        sequencer = UpdateSequencer(application, concurrency=10)
+        for update_id, user_id in [(1, 42), (2, 7), (3, 42), (4, 42), (5, 42), (6, 7)]:
+            await sequencer.submit(user_id, SimpleNamespace(update_id=update_id))
+        await sequencer.drain()
+        return sequencer
+
+    sequencer = asyncio.run(run())
+    user_42 = [update_id for update_id in application.finished if update_id in (1, 3, 5)]
+    user_7 = [update_id for update_id in application.finished if update_id in (2, 6)]
+    # Быстрые обновления не обгоняют медленное первое, ошибка не останавливает очередь
+    assert user_42 == [1, 3, 5]
+    assert user_7 == [2, 6]
+    # Пользователи обрабатываются параллельно: второй начал, не дожидаясь первого
+    assert application.started[:2] == [1, 2]
+    assert not sequencer._tails
@@ -0,0 +1,71 @@
+import json
+import time
+import asyncio
+import itertools
+from collections import Counter
+from telegram.request import BaseRequest
+
+# Методы Bot API, которые возвращают отправленное или изменённое сообщение
+MESSAGE_METHODS = {'sendMessage', 'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup', 'sendPhoto'}
+
+class RecordingRequest(BaseRequest):
+    """
+    Поддельный транспорт Bot API для запуска бота без Telegram.
+
+    Не отправляет запросы в сеть, а запоминает вызванные методы и объём
+    отправленных данных и отвечает так, как ответил бы Telegram.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        # Имитация времени ответа Telegram, секунды
+        self.latency = latency
+        self.calls = Counter()
+        self.bytes_sent = 0
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        """Подготовка не требуется"""
+
+    async def shutdown(self):
+        """Освобождение ресурсов не требуется"""
+
+    def make_result(self, method: str, parameters: dict):
+        """Ответ Telegram для метода"""
+        if method == 'getMe':
+            return {"id": 1, "is_bot": True, "first_name": "Bot", "username": "bot"}
+        if method not in MESSAGE_METHODS:
+            return True
+
+        chat_id = parameters.get('chat_id') or 1
+        message = {
+            "message_id": parameters.get('message_id') or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Bot", "username": "bot"},
+        }
+        if method == 'sendPhoto':
+            photo = parameters.get('photo')
+            file_id = photo if isinstance(photo, str) and not photo.startswith('http') else f"file-{next(self._file_ids)}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 600}]
+            message["caption"] = parameters.get('caption', '')
+        else:
+            message["text"] = parameters.get('text', '')
+        return message
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        parameters = {}
+        if request_data is not None:
+            self.bytes_sent += len(request_data.json_payload)
+            parameters = request_data.parameters
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = {"ok": True, "result": self.make_result(endpoint, parameters)}
+        return 200, json.dumps(body).encode('utf-8')
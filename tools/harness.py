@@ -0,0 +1,208 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+from collections import defaultdict
+from tools.weather_stub import WeatherStub, FaultPolicy
+from tools.fake_telegram import RecordingRequest
+
+# Файлы из data/, которые копируются в рабочий каталог замера
+DATA_FILES = ('price.xls', 'price.sqlite', 'cities.json')
+
+def prepare_workdir(source_dir: str) -> str:
+    """Временный каталог с копией нужных файлов data/: замер не трогает рабочие данные"""
+    workdir = tempfile.mkdtemp(prefix='bot-bench-')
+    os.makedirs(os.path.join(workdir, 'data'))
+    for name in DATA_FILES:
+        source = os.path.join(source_dir, name)
+        if os.path.exists(source):
+            shutil.copy2(source, os.path.join(workdir, 'data', name))
+    return workdir
+
+def data_size(path: str = 'data') -> int:
+    """Суммарный размер файлов в каталоге"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def io_write_bytes():
+    """Байты, записанные процессом на диск (только Linux, иначе None)"""
+    try:
+        with open('/proc/self/io', 'r') as file:
+            for line in file:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def percentile(values: list, q: float) -> float:
+    """Перцентиль по отсортированному списку (метод ближайшего ранга)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))
+    return values[index]
+
+def latency_summary(latencies: dict) -> dict:
+    """Количество и p50/p95/p99 в миллисекундах для каждого маршрута"""
+    routes = {}
+    for route, values in sorted(latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        }
+    return routes
+
+def counter_delta(after: dict, before: dict) -> dict:
+    """Прирост счётчиков (нулевые значения опускаются)"""
+    return {
+        name: count - before.get(name, 0)
+        for name, count in sorted(after.items())
+        if count - before.get(name, 0)
+    }
+
+class MeasuredApplication:
+    """Обёртка над Application: время обработки каждого обновления по маршрутам"""
+
+    def __init__(self, application):
+        self.application = application
+        self.routes = {}
+        self.latencies = defaultdict(list)
+
+    async def process_update(self, update):
+        route = self.routes.pop(update.update_id, 'unknown')
+        started = time.perf_counter()
+        try:
+            await self.application.process_update(update)
+        finally:
+            self.latencies[route].append(time.perf_counter() - started)
+
+class BotHarness:
+    """
+    Бот без Telegram и OpenWeatherMap для замеров.
+
+    Bot API подменяется RecordingRequest, погода берётся из локальной заглушки,
+    а все файлы data/ пишутся во временную копию.
+    """
+
+    def __init__(self, data_dir: str = 'data', telegram_latency: float = 0.0, rate_limit: bool = False,
+                 cold: bool = False, keep: bool = False, log_level: str = 'WARNING', weather_faults: FaultPolicy = None):
+        """
+        :param data_dir: Откуда брать price.xls и cities.json
+        :param telegram_latency: Имитация задержки Bot API, секунды
+        :param rate_limit: Включить реальные лимиты отправки
+        :param cold: Не прогревать кеш погоды перед замером
+        :param keep: Не удалять рабочий каталог
+        :param log_level: Уровень логирования бота
+        :param weather_faults: Задержки и сбои заглушки погоды
+        """
+        self.data_dir = os.path.abspath(data_dir)
+        self.telegram_latency = telegram_latency
+        self.rate_limit = rate_limit
+        self.cold = cold
+        self.keep = keep
+        self.log_level = log_level
+        self.stub = WeatherStub(faults=weather_faults)
+        self.transport = RecordingRequest(latency=telegram_latency)
+        self.application = None
+        self.router = None
+        self.workdir = None
+        self.cwd = None
+
+    async def start(self):
+        """Запуск заглушки погоды и инициализация бота во временном каталоге"""
+        base_url = await self.stub.start()
+        self.workdir = prepare_workdir(self.data_dir)
+        self.cwd = os.getcwd()
+        os.chdir(self.workdir)
+        os.environ.update({
+            'BOT_TOKEN': '1:benchmark',
+            'WEATHER_API_KEY': 'stub',
+            'WEATHER_API_URL': base_url,
+            'METRICS_PORT': '0',
+            'TRACE_SAMPLE_RATE': '0',
+        })
+        # Модули бота читают конфигурацию и открывают файлы data/ при импорте,
+        # поэтому импортируем их после подмены окружения и рабочего каталога
+        import main
+        from telegram.ext import Application
+        from utils.rate_limiter import FloodRateLimiter
+        from utils.excursion_catalog import catalog
+        from utils.weather import refresh_all_weather
+        logging.getLogger().setLevel(self.log_level)
+
+        catalog.load()
+        # Без rate_limit планировщик не ограничивает отправку, но его накладные расходы учитываются
+        limiter = None if self.rate_limit else FloodRateLimiter(global_rate=1e9, chat_rate=1e9, chat_burst=1e9)
+        self.application = main.build_application(
+            Application.builder().token('1:benchmark').request(self.transport).updater(None), rate_limiter=limiter
+        )
+        self.router = main.router
+        await self.application.initialize()
+        await self.application.post_init(self.application)
+        if not self.cold:
+            # Как в работе: погода уже загружена фоновым обновлением
+            await refresh_all_weather(jitter=0)
+
+    def snapshot(self) -> dict:
+        """Текущие значения счётчиков ресурсов"""
+        return {
+            "telegram_calls": dict(self.transport.calls),
+            "telegram_bytes": self.transport.bytes_sent,
+            "weather_requests": dict(self.stub.requests),
+            "data_bytes": data_size(),
+            "io_write_bytes": io_write_bytes(),
+        }
+
+    def usage(self, before: dict) -> dict:
+        """Ресурсы, израсходованные после снимка before"""
+        after = self.snapshot()
+        io_before = before["io_write_bytes"]
+        return {
+            "telegram_calls": counter_delta(after["telegram_calls"], before["telegram_calls"]),
+            "telegram_bytes": after["telegram_bytes"] - before["telegram_bytes"],
+            "weather_requests": counter_delta(after["weather_requests"], before["weather_requests"]),
+            "data_bytes": after["data_bytes"] - before["data_bytes"],
+            "io_write_bytes": after["io_write_bytes"] - io_before if io_before is not None else None,
+        }
+
+    async def stop_bot(self):
+        """Остановка бота: отложенные записи сбрасываются на диск"""
+        if self.application is not None:
+            await self.application.shutdown()
+            await self.application.post_shutdown(self.application)
+            self.application = None
+
+    async def close(self):
+        """Остановка бота и заглушки, удаление рабочего каталога"""
+        try:
+            await self.stop_bot()
+        finally:
+            if self.cwd is not None:
+                os.chdir(self.cwd)
+            await self.stub.stop()
+            if self.workdir is not None:
+                if self.keep:
+                    print(f"Рабочий каталог сохранён: {self.workdir}")
+                else:
+                    shutil.rmtree(self.workdir, ignore_errors=True)
+
+def print_usage(result: dict):
+    """Вывод маршрутов и израсходованных ресурсов в консоль"""
+    print(f"{'Маршрут':<24}{'вызовов':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for route, stats in result['routes'].items():
+        print(f"{route:<24}{stats['count']:>9}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+    print(f"\nЗапросы к Bot API: {result['telegram_calls']} ({result['telegram_bytes']} байт)")
+    print(f"Запросы к погодному API: {result['weather_requests'] or 'нет'}")
+    print(f"Рост файлов data/: {result['data_bytes']} байт")
+    if result['io_write_bytes'] is not None:
+        print(f"Записано на диск процессом: {result['io_write_bytes']} байт")
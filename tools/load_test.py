@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from collections import defaultdict
+from tools.harness import BotHarness, MeasuredApplication, latency_summary, percentile, print_usage
+from tools.traffic_profile import DEFAULT_PROFILE, END, load_profile, weighted_choice, think_time, peak_hour
+from tools.updates import make_update, route_payloads
+
+# Период замера задержки цикла событий, секунды
+LAG_INTERVAL = 0.1
+
+# Начало id симулируемых пользователей (не пересекается с синтетическими обновлениями)
+USER_ID_BASE = 500000
+
+class LoadTest:
+    """
+    Нагрузка по профилю журнала действий.
+
+    Сеансы пользователей начинаются случайно (пуассоновский поток с
+    интенсивностью профиля для выбранного часа, умноженной на multiplier).
+    Каждый симулируемый пользователь проходит по меню согласно таблице
+    переходов профиля, дожидаясь ответа бота и делая паузы между действиями.
+    """
+
+    def __init__(self, harness: BotHarness, profile: dict, hour: int, multiplier: float,
+                 duration: float, concurrency: int, seed: int = 0):
+        self.harness = harness
+        self.profile = profile
+        self.hour = hour
+        self.multiplier = multiplier
+        self.duration = duration
+        self.rng = random.Random(seed)
+        self.payloads = route_payloads()
+        self.measured = MeasuredApplication(harness.application)
+        # Как в рабочем процессе: не больше concurrency обновлений одновременно
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.update_ids = itertools.count(1)
+        self.stopped = asyncio.Event()
+        # Время ответа пользователю (с ожиданием свободного места) по маршрутам
+        self.responses = defaultdict(list)
+        self.waits = []
+        self.loop_lag = []
+        self.sessions = 0
+        self.active = 0
+        self.peak_active = 0
+        users = profile["users_per_hour"][hour] * multiplier
+        self.user_pool = max(1, round(users))
+
+    @property
+    def sessions_per_second(self) -> float:
+        """Интенсивность начала сеансов"""
+        return self.profile["sessions_per_hour"][self.hour] * self.multiplier / 3600
+
+    async def pause(self, seconds: float):
+        """Пауза, прерываемая окончанием замера"""
+        try:
+            await asyncio.wait_for(self.stopped.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def send(self, user_id: int, route: str) -> bool:
+        """Действие пользователя и ожидание ответа бота; False, если маршрут не поддерживается"""
+        from telegram import Update
+
+        if not route.endswith('_command') and not self.payloads.get(route):
+            return False
+        data = make_update(next(self.update_ids), user_id, route, self.payloads, self.rng)
+        update = Update.de_json(data, self.harness.application.bot)
+        self.measured.routes[update.update_id] = route
+        started = time.perf_counter()
+        async with self.semaphore:
+            self.waits.append(time.perf_counter() - started)
+            await self.measured.process_update(update)
+        self.responses[route].append(time.perf_counter() - started)
+        return True
+
+    async def session(self, user_id: int):
+        """Один сеанс пользователя: вход в бота и переходы по меню до выхода"""
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            route = weighted_choice(self.profile["entry"], self.rng)
+            while route not in (None, END) and not self.stopped.is_set():
+                if not await self.send(user_id, route):
+                    break
+                route = weighted_choice(self.profile["transitions"].get(route, {}), self.rng)
+                if route in (None, END):
+                    break
+                await self.pause(think_time(self.profile, self.rng))
+        finally:
+            self.active -= 1
+
+    async def measure_lag(self):
+        """Задержка пробуждения цикла событий: растёт, когда процессору не хватает времени"""
+        loop = asyncio.get_running_loop()
+        while not self.stopped.is_set():
+            started = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.loop_lag.append(max(loop.time() - started - LAG_INTERVAL, 0.0))
+
+    async def run(self) -> float:
+        """Запуск сеансов в течение duration секунд; возвращает фактическую длительность"""
+        if self.sessions_per_second <= 0:
+            raise ValueError(f"В профиле нет сеансов в {self.hour}:00")
+        lag_task = asyncio.create_task(self.measure_lag())
+        sessions = set()
+        started = time.perf_counter()
+        deadline = started + self.duration
+        while True:
+            delay = self.rng.expovariate(self.sessions_per_second)
+            if time.perf_counter() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+            user_id = USER_ID_BASE + self.rng.randint(1, self.user_pool)
+            task = asyncio.create_task(self.session(user_id))
+            sessions.add(task)
+            task.add_done_callback(sessions.discard)
+            self.sessions += 1
+        await asyncio.sleep(max(deadline - time.perf_counter(), 0))
+        # Новые действия больше не начинаются, начатые обновления дорабатываются
+        self.stopped.set()
+        if sessions:
+            await asyncio.wait(list(sessions))
+        await lag_task
+        return time.perf_counter() - started
+
+async def run_load(args) -> dict:
+    """Нагрузочный прогон бота по профилю и сбор результатов"""
+    harness = BotHarness(args.data_dir, args.telegram_latency / 1000, args.rate_limit, args.cold, args.keep, args.log_level)
+    try:
+        # Путь к журналу берётся до перехода во временный каталог, а читается журнал
+        # после запуска бота: маршруты кнопок определяются по его таблице
+        profile_path = os.path.abspath(args.profile)
+        await harness.start()
+        profile = load_profile(profile_path, harness.router)
+        if profile is DEFAULT_PROFILE:
+            print(f"В {args.profile} нет событий, используется профиль по умолчанию")
+        hour = peak_hour(profile) if args.hour is None else args.hour
+
+        test = LoadTest(harness, profile, hour, args.multiplier, args.duration, args.concurrency, args.seed)
+        before = harness.snapshot()
+        elapsed = await test.run()
+        await harness.stop_bot()
+
+        updates = sum(len(values) for values in test.responses.values())
+        responses = sorted(value for values in test.responses.values() for value in values)
+        test.waits.sort()
+        test.loop_lag.sort()
+        return {
+            "profile": profile.get("source", args.profile),
+            "hour": hour,
+            "multiplier": args.multiplier,
+            "target_sessions_per_hour": round(test.sessions_per_second * 3600, 1),
+            "sessions": test.sessions,
+            "peak_active_users": test.peak_active,
+            "updates": updates,
+            "seconds": round(elapsed, 3),
+            "updates_per_second": round(updates / elapsed, 2) if elapsed else 0.0,
+            "concurrency": args.concurrency,
+            "response_p95_ms": round(percentile(responses, 0.95) * 1000, 3),
+            "response_p99_ms": round(percentile(responses, 0.99) * 1000, 3),
+            "wait_p95_ms": round(percentile(test.waits, 0.95) * 1000, 3),
+            "loop_lag_p95_ms": round(percentile(test.loop_lag, 0.95) * 1000, 3),
+            "loop_lag_max_ms": round((test.loop_lag[-1] if test.loop_lag else 0.0) * 1000, 3),
+            "routes": latency_summary(test.responses),
+            "processing": latency_summary(test.measured.latencies),
+            **harness.usage(before),
+        }
+    finally:
+        await harness.close()
+
+def print_report(result: dict):
+    """Вывод результатов в консоль"""
+    print(f"\nПрофиль {result['profile']}, {result['hour']}:00, нагрузка ×{result['multiplier']}: "
+          f"{result['target_sessions_per_hour']} сеансов/ч")
+    print(f"Сеансов: {result['sessions']}, одновременно до {result['peak_active_users']} пользователей")
+    print(f"Обновлений: {result['updates']} за {result['seconds']} с — {result['updates_per_second']} обн/с")
+    print(f"Ответ p95/p99: {result['response_p95_ms']:.2f}/{result['response_p99_ms']:.2f} мс, "
+          f"ожидание очереди p95: {result['wait_p95_ms']:.2f} мс")
+    print(f"Задержка цикла событий p95/max: {result['loop_lag_p95_ms']:.2f}/{result['loop_lag_max_ms']:.2f} мс\n")
+    print_usage(result)
+
+def parse_args(argv=None):
+    """Параметры командной строки"""
+    parser = argparse.ArgumentParser(
+        prog='python -m tools.load_test',
+        description='Нагрузка на бота по реальным сценариям из журнала действий'
+    )
+    parser.add_argument('--profile', default='data/actions_log.csv',
+                        help='журнал действий CSV или профиль JSON (python -m tools.traffic_profile)')
+    parser.add_argument('--multiplier', type=float, default=1.0, help='во сколько раз больше реального трафика')
+    parser.add_argument('--hour', type=int, choices=range(24), help='час суток профиля (по умолчанию — пиковый)')
+    parser.add_argument('--duration', type=float, default=60.0, help='длительность замера, секунды')
+    parser.add_argument('--concurrency', type=int, default=64, help='одновременно обрабатываемых обновлений')
+    parser.add_argument('--seed', type=int, default=1, help='зерно генератора')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='имитация задержки Bot API, мс')
+    parser.add_argument('--rate-limit', action='store_true', help='включить реальные лимиты отправки')
+    parser.add_argument('--cold', action='store_true', help='не прогревать кеш погоды перед замером')
+    parser.add_argument('--data-dir', default='data', help='откуда брать price.xls и cities.json')
+    parser.add_argument('--json', help='сохранить результат в JSON')
+    parser.add_argument('--keep', action='store_true', help='не удалять рабочий каталог')
+    parser.add_argument('--log-level', default='WARNING', help='уровень логирования бота')
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    """Точка входа: python -m tools.load_test"""
+    args = parse_args(argv)
+    result = asyncio.run(run_load(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
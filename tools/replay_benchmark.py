@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from tools.weather_stub import FaultPolicy
+from tools.harness import BotHarness, MeasuredApplication, latency_summary, print_usage
+from tools.updates import synthetic_updates, load_updates, update_route
+
+async def run_benchmark(args) -> dict:
+    """Прогон обновлений через обработчики бота и сбор результатов"""
+    faults = FaultPolicy(latency=args.weather_latency / 1000, error_rate=args.weather_error_rate, seed=args.seed)
+    harness = BotHarness(args.data_dir, args.telegram_latency / 1000, args.rate_limit, args.cold, args.keep,
+                         args.log_level, faults)
+    try:
+        await harness.start()
+        from telegram import Update
+        from utils.workers import UpdateSequencer, shard_key
+
+        if args.updates:
+            updates = load_updates(os.path.join(harness.cwd, args.updates))
+        else:
+            updates = synthetic_updates(args.count, args.users, args.seed)
+
+        measured = MeasuredApplication(harness.application)
+        sequencer = UpdateSequencer(measured, args.concurrency)
+        before = harness.snapshot()
+
+        started = time.perf_counter()
+        for data in updates:
+            update = Update.de_json(data, harness.application.bot)
+            measured.routes[update.update_id] = update_route(data, harness.router)
+            await sequencer.submit(shard_key(data), update)
+        await sequencer.drain()
+        elapsed = time.perf_counter() - started
+
+        # Остановка сбрасывает отложенные записи — они входят в объём записанного
+        await harness.stop_bot()
+        return {
+            "updates": len(updates),
+            "seconds": round(elapsed, 3),
+            "updates_per_second": round(len(updates) / elapsed, 1) if elapsed else 0.0,
+            "concurrency": args.concurrency,
+            "routes": latency_summary(measured.latencies),
+            **harness.usage(before),
+        }
+    finally:
+        await harness.close()
+
+def print_report(result: dict):
+    """Вывод результатов в консоль"""
+    print(f"\nОбновлений: {result['updates']} за {result['seconds']} с — "
+          f"{result['updates_per_second']} обн/с (параллельно до {result['concurrency']})\n")
+    print_usage(result)
+
+def check_baseline(result: dict, baseline_path: str, max_regression: float) -> bool:
+    """Сравнение с сохранённым результатом: False, если пропускная способность упала сильнее порога"""
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    expected = baseline.get('updates_per_second') or 0
+    if not expected:
+        return True
+    change = result['updates_per_second'] / expected - 1
+    print(f"\nОтносительно {baseline_path}: {change:+.1%} обн/с")
+    return change >= -max_regression
+
+def parse_args(argv=None):
+    """Параметры командной строки"""
+    parser = argparse.ArgumentParser(
+        prog='python -m tools.replay_benchmark',
+        description='Офлайн-замер пропускной способности бота на записанных или синтетических обновлениях'
+    )
+    parser.add_argument('--updates', help='JSONL с записанными обновлениями Telegram (по умолчанию — синтетические)')
+    parser.add_argument('--count', type=int, default=2000, help='количество синтетических обновлений')
+    parser.add_argument('--users', type=int, default=200, help='количество синтетических пользователей')
+    parser.add_argument('--seed', type=int, default=1, help='зерно генератора синтетических обновлений')
+    parser.add_argument('--concurrency', type=int, default=32, help='одновременно обрабатываемых обновлений')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='имитация задержки Bot API, мс')
+    parser.add_argument('--weather-latency', type=float, default=0.0, help='задержка заглушки погоды, мс')
+    parser.add_argument('--weather-error-rate', type=float, default=0.0, help='доля ошибок 500 заглушки погоды')
+    parser.add_argument('--rate-limit', action='store_true', help='включить реальные лимиты отправки')
+    parser.add_argument('--cold', action='store_true', help='не прогревать кеш погоды перед замером')
+    parser.add_argument('--data-dir', default='data', help='откуда брать price.xls и cities.json')
+    parser.add_argument('--json', help='сохранить результат в JSON')
+    parser.add_argument('--baseline', help='JSON предыдущего замера для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='допустимое падение обн/с относительно baseline')
+    parser.add_argument('--keep', action='store_true', help='не удалять рабочий каталог')
+    parser.add_argument('--log-level', default='WARNING', help='уровень логирования бота')
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    """Точка входа: python -m tools.replay_benchmark"""
+    args = parse_args(argv)
+    result = asyncio.run(run_benchmark(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if args.baseline and not check_baseline(result, args.baseline, args.max_regression):
+        print(f"Пропускная способность упала больше чем на {args.max_regression:.0%}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import csv
+import sys
+import json
+import random
+from datetime import datetime
+from collections import Counter, defaultdict
+
+# Пауза, после которой действия пользователя считаются новым сеансом, секунды
+SESSION_GAP = 30 * 60
+
+# Сколько пауз между действиями хранится в профиле
+THINK_TIME_SAMPLES = 1000
+
+# Маршруты, которые сами вызывают start_command и пишут в журнал «Запуск бота»
+START_CALLERS = ('start', 'menu_command')
+
+# Завершение сеанса в таблице переходов
+END = 'end'
+
+# Профиль по умолчанию: навигация по меню бота и суточная кривая сеансов.
+# Используется, пока в журнале действий нет данных.
+DEFAULT_PROFILE = {
+    "source": "default",
+    "entry": {'start_command': 70, 'menu_command': 10, 'weather': 10, 'excursions': 10},
+    "transitions": {
+        'start_command': {'weather': 40, 'excursions': 35, 'accommodation': 8, 'flights': 7, END: 10},
+        'menu_command': {'weather': 40, 'excursions': 35, 'accommodation': 8, 'flights': 7, END: 10},
+        'start': {'weather': 40, 'excursions': 35, 'accommodation': 8, 'flights': 7, END: 10},
+        'weather': {'city_': 85, 'start': 10, END: 5},
+        'city_': {'weekly_': 30, 'back_to_cities': 35, 'start': 15, END: 20},
+        'back_to_cities': {'city_': 85, 'start': 10, END: 5},
+        'weekly_': {'back_to_cities': 40, 'start': 20, END: 40},
+        'excursions': {'category_': 80, 'start': 10, END: 10},
+        'category_': {'excursion_': 75, 'excursions': 15, END: 10},
+        'excursion_': {'category_': 35, 'excursions': 15, 'start': 15, END: 35},
+        'accommodation': {'start': 50, END: 50},
+        'flights': {'start': 50, END: 50},
+    },
+    "think_time": [2, 3, 3, 4, 5, 5, 6, 8, 10, 12, 15, 20, 30, 45, 60],
+    "sessions_per_hour": [
+        4, 2, 1, 1, 1, 2, 6, 14, 24, 32, 38, 42,
+        44, 42, 40, 40, 42, 48, 56, 60, 54, 40, 22, 10
+    ],
+    "users_per_hour": [
+        4, 2, 1, 1, 1, 2, 6, 13, 22, 29, 34, 38,
+        40, 38, 36, 36, 38, 43, 50, 54, 49, 36, 20, 9
+    ],
+}
+
+def button_route(button_name: str, router) -> str:
+    """
+    Маршрут по названию кнопки из журнала
+
+    В журнал пишется callback_data.replace('_', ' ').title(), поэтому код
+    восстанавливается с точностью до регистра — для поиска маршрута этого
+    достаточно. Имя маршрута берётся из таблицы бота: компактные кнопки
+    («C 1A», «W 3») и старые («Category …», «Main Menu») сводятся к одним
+    и тем же маршрутам (category_, start).
+    """
+    data = button_name.strip().lower().replace(' ', '_')
+    route = router.resolve(data)
+    return route[0] if route else 'unknown_callback'
+
+def action_route(row: dict, router):
+    """Маршрут обновления, породившего строку журнала, или None для вспомогательных строк"""
+    _, _, action = row.get('Действие', '').partition(': ')
+    action = action or row.get('Действие', '')
+    if action.startswith('нажал кнопку '):
+        return button_route(action[len('нажал кнопку '):], router)
+    if action == 'Запуск бота':
+        return 'start_command'
+    if action == 'Открытие главного меню':
+        return 'menu_command'
+    # Запросы погоды, просмотры меню и т.п. пишутся внутри уже учтённого обновления
+    return None
+
+def read_events(csv_file: str, router=None) -> list:
+    """
+    События журнала: (время, id пользователя, маршрут), по возрастанию времени
+
+    :param csv_file: Журнал действий CSV
+    :param router: Таблица маршрутов бота (по умолчанию main.router)
+    """
+    if router is None:
+        # Импорт здесь: main читает конфигурацию и файлы data/ при загрузке
+        from main import router
+    events = []
+    with open(csv_file, 'r', newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            route = action_route(row, router)
+            if route is None:
+                continue
+            try:
+                moment = datetime.strptime(row['Дата и время'], '%d.%m.%Y %H:%M:%S')
+                user_id = int(row['ID пользователя'])
+            except (KeyError, ValueError):
+                continue
+            events.append((moment, user_id, route))
+    events.sort(key=lambda event: event[0])
+
+    # /menu и кнопка «start» вызывают start_command, который пишет ещё одну строку
+    result = []
+    last = {}
+    for moment, user_id, route in events:
+        previous = last.get(user_id)
+        if (route == 'start_command' and previous is not None and previous[1] in START_CALLERS
+                and (moment - previous[0]).total_seconds() <= 2):
+            continue
+        last[user_id] = (moment, route)
+        result.append((moment, user_id, route))
+    return result
+
+def build_profile(events: list, source: str = '', seed: int = 0) -> dict:
+    """
+    Профиль нагрузки по событиям журнала
+
+    :param events: Результат read_events
+    :param source: Откуда взяты события (для отчёта)
+    :param seed: Зерно выборки пауз между действиями
+    """
+    by_user = defaultdict(list)
+    for moment, user_id, route in events:
+        by_user[user_id].append((moment, route))
+
+    entry = Counter()
+    transitions = defaultdict(Counter)
+    gaps = []
+    sessions = Counter()
+    users = defaultdict(set)
+    for user_id, user_events in by_user.items():
+        previous = None
+        for moment, route in user_events:
+            gap = (moment - previous[0]).total_seconds() if previous else None
+            if previous is None or gap > SESSION_GAP:
+                if previous is not None:
+                    transitions[previous[1]][END] += 1
+                entry[route] += 1
+                sessions[(moment.date(), moment.hour)] += 1
+            else:
+                transitions[previous[1]][route] += 1
+                gaps.append(gap)
+            users[(moment.date(), moment.hour)].add(user_id)
+            previous = (moment, route)
+        if previous is not None:
+            transitions[previous[1]][END] += 1
+
+    days = len({moment.date() for moment, _, _ in events}) or 1
+    sessions_per_hour = [0.0] * 24
+    users_per_hour = [0.0] * 24
+    for (_, hour), count in sessions.items():
+        sessions_per_hour[hour] += count / days
+    for (_, hour), hour_users in users.items():
+        users_per_hour[hour] += len(hour_users) / days
+
+    rng = random.Random(seed)
+    if len(gaps) > THINK_TIME_SAMPLES:
+        gaps = rng.sample(gaps, THINK_TIME_SAMPLES)
+    return {
+        "source": source,
+        "events": len(events),
+        "sessions": sum(entry.values()),
+        "days": days,
+        "route_mix": dict(Counter(route for _, _, route in events).most_common()),
+        "entry": dict(entry),
+        "transitions": {route: dict(counts) for route, counts in transitions.items()},
+        "think_time": sorted(round(gap, 3) for gap in gaps),
+        "sessions_per_hour": [round(value, 3) for value in sessions_per_hour],
+        "users_per_hour": [round(value, 3) for value in users_per_hour],
+    }
+
+def load_profile(path: str, router=None) -> dict:
+    """
+    Профиль из файла: JSON, сохранённый этим модулем, или журнал действий CSV
+
+    Если в журнале нет ни одного события, возвращается DEFAULT_PROFILE.
+
+    :param path: Путь к профилю JSON или журналу CSV
+    :param router: Таблица маршрутов бота (по умолчанию main.router)
+    """
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    events = read_events(path, router)
+    if not events:
+        return DEFAULT_PROFILE
+    return build_profile(events, path)
+
+def weighted_choice(weights: dict, rng: random.Random):
+    """Случайный ключ словаря с вероятностью, пропорциональной значению"""
+    if not weights:
+        return None
+    keys = list(weights)
+    return rng.choices(keys, [weights[key] for key in keys])[0]
+
+def think_time(profile: dict, rng: random.Random) -> float:
+    """Пауза перед следующим действием пользователя, секунды"""
+    samples = profile.get("think_time") or DEFAULT_PROFILE["think_time"]
+    # Случайная точка эмпирического распределения с интерполяцией между соседними замерами
+    position = rng.random() * (len(samples) - 1)
+    index = int(position)
+    if index + 1 >= len(samples):
+        return samples[-1]
+    return samples[index] + (samples[index + 1] - samples[index]) * (position - index)
+
+def peak_hour(profile: dict) -> int:
+    """Час суток с наибольшим числом сеансов"""
+    sessions = profile["sessions_per_hour"]
+    return max(range(24), key=lambda hour: sessions[hour])
+
+if __name__ == '__main__':
+    # python -m tools.traffic_profile [data/actions_log.csv] [profile.json]
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/actions_log.csv'
+    profile = load_profile(source)
+    if profile is DEFAULT_PROFILE:
+        print(f"В {source} нет событий, используется профиль по умолчанию")
+    text = json.dumps(profile, ensure_ascii=False, indent=2)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w', encoding='utf-8') as file:
+            file.write(text)
+        print(f"Профиль сохранён в {sys.argv[2]}")
+    else:
+        print(text)
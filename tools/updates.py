@@ -0,0 +1,136 @@
+import json
+import time
+import random
+
+# Доли маршрутов в синтетическом потоке обновлений
+ROUTE_MIX = {
+    'start_command': 8,
+    'menu_command': 2,
+    'start': 8,
+    'weather': 14,
+    'city_': 18,
+    'weekly_': 8,
+    'back_to_cities': 4,
+    'excursions': 12,
+    'category_': 12,
+    'excursion_': 10,
+    'accommodation': 2,
+    'flights': 2,
+}
+
+def user_payload(user_id: int) -> dict:
+    """Пользователь Telegram для синтетического обновления"""
+    return {
+        "id": user_id,
+        "is_bot": False,
+        "first_name": f"User{user_id}",
+        "username": f"user{user_id}",
+        "language_code": "ru",
+    }
+
+def bot_message(chat_id: int, message_id: int = 1, text: str = "") -> dict:
+    """Сообщение бота, к которому привязана inline-кнопка"""
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": 1, "is_bot": True, "first_name": "Bot", "username": "bot"},
+        "text": text or "меню",
+    }
+
+def command_update(update_id: int, user_id: int, command: str) -> dict:
+    """Обновление с командой (например, /start)"""
+    text = f"/{command}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user_payload(user_id),
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    """Обновление с нажатием inline-кнопки"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(user_id),
+            "from": user_payload(user_id),
+            "message": bot_message(user_id),
+            "data": data,
+        },
+    }
+
+def route_payloads() -> dict:
+    """
+    Возможные callback_data для каждого маршрута
+
+    Коды категорий, экскурсий и городов берутся из текущего каталога и
+    SUPPORTED_CITIES, поэтому модули бота импортируются здесь, а не при загрузке.
+    """
+    from config import SUPPORTED_CITIES
+    from handlers.excursions_handler import get_categories, get_excursions_by_category, category_callback, excursion_callback
+    from handlers.weather_handler import city_callback, forecast_callback
+
+    categories = get_categories()
+    excursions = [excursion for category in categories for excursion in get_excursions_by_category(category)]
+    payloads = {
+        'city_': [city_callback(city) for city in SUPPORTED_CITIES],
+        'weekly_': [forecast_callback(city) for city in SUPPORTED_CITIES],
+        'category_': [category_callback(category) for category in categories],
+        'excursion_': [excursion_callback(excursion) for excursion in excursions],
+    }
+    for route in ('start', 'weather', 'back_to_cities', 'excursions', 'accommodation', 'flights', 'stickers'):
+        payloads[route] = [route]
+    return payloads
+
+def make_update(update_id: int, user_id: int, route: str, payloads: dict, rng: random.Random) -> dict:
+    """Обновление для маршрута: команда или нажатие кнопки"""
+    if route.endswith('_command'):
+        return command_update(update_id, user_id, route[:-len('_command')])
+    return callback_update(update_id, user_id, rng.choice(payloads[route]))
+
+def synthetic_updates(count: int, users: int, seed: int = 0, mix: dict = None) -> list:
+    """
+    Синтетический поток обновлений
+
+    :param count: Количество обновлений
+    :param users: Количество разных пользователей
+    :param seed: Зерно генератора (одинаковое зерно — одинаковый поток)
+    :param mix: Доли маршрутов (по умолчанию ROUTE_MIX)
+    """
+    rng = random.Random(seed)
+    mix = mix or ROUTE_MIX
+    payloads = route_payloads()
+    routes = [route for route in mix if route.endswith('_command') or payloads.get(route)]
+    weights = [mix[route] for route in routes]
+    return [
+        make_update(update_id, rng.randint(1, users) + 100000, rng.choices(routes, weights)[0], payloads, rng)
+        for update_id in range(1, count + 1)
+    ]
+
+def load_updates(path: str) -> list:
+    """Записанные обновления из JSONL файла (одно обновление Telegram в строке)"""
+    updates = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                updates.append(json.loads(line))
+    return updates
+
+def update_route(data: dict, router) -> str:
+    """Имя маршрута обновления: команда, маршрут кнопки или тип обновления"""
+    if 'callback_query' in data:
+        route = router.resolve(data['callback_query'].get('data') or '')
+        return route[0] if route else 'unknown_callback'
+    message = data.get('message') or {}
+    text = message.get('text') or ''
+    if text.startswith('/'):
+        return text[1:].split()[0].split('@')[0] + '_command'
+    return 'message'
@@ -0,0 +1,316 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Города из SUPPORTED_CITIES: приблизительные координаты и идентификаторы для ответов заглушки
+CITY_FIXTURES = {
+    'Лазаревское': (43.9089, 39.3317, 900001),
+    'Вардане': (43.7333, 39.5500, 900002),
+    'Лоо': (43.7086, 39.5897, 900003),
+    'Дагомыс': (43.6606, 39.6547, 900004),
+    'Сочи': (43.5855, 39.7231, 900005),
+    'Мацеста': (43.5589, 39.7914, 900006),
+    'Хоста': (43.5156, 39.8681, 900007),
+    'Кудепста': (43.4997, 39.8978, 900008),
+    'Адлер': (43.4286, 39.9239, 900009),
+    'Красная Поляна': (43.6797, 40.2056, 542681),
+}
+
+DESCRIPTIONS = ['ясно', 'переменная облачность', 'облачно с прояснениями', 'пасмурно', 'небольшой дождь']
+
+# Максимум идентификаторов в одном запросе /data/2.5/group (ограничение OpenWeatherMap)
+GROUP_MAX_IDS = 20
+
+class FaultPolicy:
+    """
+    Сбои, которые заглушка добавляет к ответам.
+
+    Вероятности проверяются по порядку: зависание (клиент получает таймаут),
+    429 Too Many Requests, 500. Задержка добавляется ко всем ответам.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, timeout_rate: float = 0.0, hang: float = 60.0,
+                 retry_after: int = 1, endpoints: set = None, seed: int = None):
+        """
+        :param latency: Задержка каждого ответа, секунды
+        :param jitter: Случайная добавка к задержке от 0 до jitter, секунды
+        :param error_rate: Доля ответов 500
+        :param rate_limit_rate: Доля ответов 429
+        :param timeout_rate: Доля запросов, на которые ответ не приходит hang секунд
+        :param hang: Длительность зависания, секунды (больше таймаута клиента)
+        :param retry_after: Значение заголовка Retry-After в ответах 429
+        :param endpoints: Эндпоинты, к которым применяются сбои (None — ко всем)
+        :param seed: Зерно генератора (одинаковое зерно — одинаковая последовательность сбоев)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.retry_after = retry_after
+        self.endpoints = endpoints
+        self.rng = random.Random(seed)
+
+    def applies_to(self, endpoint: str) -> bool:
+        """Применяются ли сбои к эндпоинту"""
+        return self.endpoints is None or endpoint in self.endpoints
+
+    def delay(self) -> float:
+        """Задержка очередного ответа, секунды"""
+        return self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def choose(self):
+        """Сбой для очередного запроса: 'timeout', 'rate_limit', 'error' или None"""
+        value = self.rng.random()
+        for fault, rate in (('timeout', self.timeout_rate), ('rate_limit', self.rate_limit_rate), ('error', self.error_rate)):
+            if value < rate:
+                return fault
+            value -= rate
+        return None
+
+def load_fixtures(path: str) -> tuple:
+    """
+    Города и готовые ответы из JSON файла
+
+    Формат: {"Город": {"lat": 43.5, "lon": 39.7, "id": 491422, "weather": {...}, "forecast": {...}}}.
+    Поля weather и forecast необязательны: без них ответы генерируются по городу.
+
+    :return: (города для WeatherStub, готовые ответы по (вид, город))
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    cities = {}
+    responses = {}
+    for name, fixture in data.items():
+        cities[name] = (float(fixture['lat']), float(fixture['lon']), int(fixture['id']))
+        for kind in ('weather', 'forecast'):
+            if kind in fixture:
+                responses[(kind, name)] = fixture[kind]
+    return cities, responses
+
+class WeatherStub:
+    """
+    Локальная заглушка OpenWeatherMap.
+
+    Отвечает на запросы геокодера, текущей погоды (по одному городу и
+    группой), прогноза данными, которые зависят только от города, поэтому
+    результаты воспроизводимы. Задержки и сбои задаются FaultPolicy.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, cities: dict = None,
+                 responses: dict = None, faults: FaultPolicy = None):
+        self.host = host
+        self.port = port
+        self.cities = cities or CITY_FIXTURES
+        self.by_id = {city_id: name for name, (_, _, city_id) in self.cities.items()}
+        # Готовые ответы из фикстур по (вид, город)
+        self.responses = responses or {}
+        self.faults = faults or FaultPolicy()
+        # Количество запросов и добавленных сбоев по эндпоинтам
+        self.requests = Counter()
+        self.injected = Counter()
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        """Базовый адрес заглушки (для WEATHER_API_URL)"""
+        return f"http://{self.host}:{self.port}"
+
+    def find_city(self, query) -> str:
+        """Город по параметрам запроса: id или ближайший к lat/lon (ValueError, если это не числа)"""
+        if 'id' in query:
+            return self.by_id.get(int(query['id']))
+        if 'lat' in query and 'lon' in query:
+            lat, lon = float(query['lat']), float(query['lon'])
+            return min(self.cities, key=lambda name: (self.cities[name][0] - lat) ** 2 + (self.cities[name][1] - lon) ** 2)
+        return None
+
+    def current_weather(self, city: str) -> dict:
+        """Текущая погода в формате /data/2.5/weather"""
+        if ('weather', city) in self.responses:
+            return self.responses[('weather', city)]
+        lat, lon, city_id = self.cities[city]
+        rng = random.Random(city_id)
+        now = int(time.time())
+        return {
+            "coord": {"lat": lat, "lon": lon},
+            "weather": [{"id": 800, "main": "Clear", "description": rng.choice(DESCRIPTIONS), "icon": "01d"}],
+            "main": {
+                "temp": round(rng.uniform(15, 30), 1),
+                "feels_like": round(rng.uniform(15, 30), 1),
+                "pressure": rng.randint(1005, 1025),
+                "humidity": rng.randint(40, 90),
+            },
+            "visibility": rng.choice([10000, 8000, 6000]),
+            "wind": {"speed": round(rng.uniform(0, 8), 1), "deg": rng.randint(0, 359)},
+            "clouds": {"all": rng.randint(0, 100)},
+            "dt": now,
+            "sys": {"country": "RU", "sunrise": now - 6 * 3600, "sunset": now + 6 * 3600},
+            "id": city_id,
+            "name": city,
+            "cod": 200,
+        }
+
+    def forecast(self, city: str) -> dict:
+        """Прогноз на 5 дней с шагом 3 часа в формате /data/2.5/forecast"""
+        if ('forecast', city) in self.responses:
+            return self.responses[('forecast', city)]
+        lat, lon, city_id = self.cities[city]
+        rng = random.Random(city_id * 31)
+        start = int(time.time()) // 10800 * 10800
+        items = [
+            {
+                "dt": start + step * 10800,
+                "main": {"temp": round(rng.uniform(12, 32), 1)},
+                "weather": [{"description": rng.choice(DESCRIPTIONS)}],
+            }
+            for step in range(40)
+        ]
+        return {"cod": "200", "cnt": len(items), "list": items, "city": {"id": city_id, "name": city, "coord": {"lat": lat, "lon": lon}}}
+
+    @web.middleware
+    async def inject_faults(self, request: web.Request, handler):
+        """Подсчёт запросов, проверка ключа API, задержка и сбои"""
+        endpoint = request.match_info.route.name
+        if endpoint is None:
+            return await handler(request)
+        self.requests[endpoint] += 1
+        if not request.query.get('appid'):
+            return web.json_response({"cod": 401, "message": "Invalid API key"}, status=401)
+        if not self.faults.applies_to(endpoint):
+            return await handler(request)
+
+        delay = self.faults.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        fault = self.faults.choose()
+        if fault is not None:
+            self.injected[fault] += 1
+        if fault == 'timeout':
+            # Ответ не приходит дольше таймаута клиента
+            await asyncio.sleep(self.faults.hang)
+            return web.json_response({"cod": 504, "message": "stub timeout"}, status=504)
+        if fault == 'rate_limit':
+            return web.json_response(
+                {"cod": 429, "message": "Your account is temporary blocked due to exceeding of requests limitation"},
+                status=429, headers={'Retry-After': str(self.faults.retry_after)}
+            )
+        if fault == 'error':
+            return web.json_response({"cod": 500, "message": "Internal error"}, status=500)
+        return await handler(request)
+
+    async def handle_geo(self, request: web.Request) -> web.Response:
+        """/geo/1.0/direct?q=Город,RU"""
+        name = request.query.get('q', '').split(',')[0]
+        if name not in self.cities:
+            return web.json_response([])
+        lat, lon, _ = self.cities[name]
+        return web.json_response([{"name": name, "lat": lat, "lon": lon, "country": "RU"}])
+
+    async def handle_weather(self, request: web.Request) -> web.Response:
+        """/data/2.5/weather?lat=..&lon=.. или ?id=.."""
+        try:
+            city = self.find_city(request.query)
+        except ValueError:
+            return web.json_response({"cod": "400", "message": "wrong id or coordinates"}, status=400)
+        if city is None:
+            return web.json_response({"cod": "404", "message": "city not found"}, status=404)
+        return web.json_response(self.current_weather(city))
+
+    async def handle_group(self, request: web.Request) -> web.Response:
+        """/data/2.5/group?id=1,2,3 — текущая погода сразу для нескольких городов"""
+        try:
+            ids = [int(value) for value in request.query.get('id', '').split(',') if value]
+        except ValueError:
+            return web.json_response({"cod": "400", "message": "id is not a number"}, status=400)
+        if not ids or len(ids) > GROUP_MAX_IDS:
+            return web.json_response({"cod": "400", "message": f"expected 1..{GROUP_MAX_IDS} ids"}, status=400)
+        items = [self.current_weather(self.by_id[city_id]) for city_id in ids if city_id in self.by_id]
+        return web.json_response({"cnt": len(items), "list": items})
+
+    async def handle_forecast(self, request: web.Request) -> web.Response:
+        """/data/2.5/forecast?lat=..&lon=.. или ?id=.."""
+        try:
+            city = self.find_city(request.query)
+        except ValueError:
+            return web.json_response({"cod": "400", "message": "wrong id or coordinates"}, status=400)
+        if city is None:
+            return web.json_response({"cod": "404", "message": "city not found"}, status=404)
+        return web.json_response(self.forecast(city))
+
+    def build_app(self) -> web.Application:
+        """aiohttp-приложение с эндпоинтами заглушки"""
+        app = web.Application(middlewares=[self.inject_faults])
+        app.router.add_get('/geo/1.0/direct', self.handle_geo, name='geo')
+        app.router.add_get('/data/2.5/weather', self.handle_weather, name='weather')
+        app.router.add_get('/data/2.5/group', self.handle_group, name='group')
+        app.router.add_get('/data/2.5/forecast', self.handle_forecast, name='forecast')
+        return app
+
+    async def start(self) -> str:
+        """Запуск заглушки; возвращает её адрес (при port=0 порт выбирается свободный)"""
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Заглушка OpenWeatherMap слушает {self.url}")
+        return self.url
+
+    async def stop(self):
+        """Остановка заглушки"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def parse_args(argv=None):
+    """Параметры командной строки"""
+    parser = argparse.ArgumentParser(
+        prog='python -m tools.weather_stub',
+        description='Локальная заглушка OpenWeatherMap с задержками и сбоями'
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='адрес прослушивания')
+    parser.add_argument('--port', type=int, default=8090, help='порт')
+    parser.add_argument('--fixtures', help='JSON с городами и готовыми ответами')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, секунды')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, секунды')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='доля запросов без ответа')
+    parser.add_argument('--hang', type=float, default=60.0, help='сколько держать запрос без ответа, секунды')
+    parser.add_argument('--endpoints', help='эндпоинты со сбоями через запятую: geo,weather,group,forecast')
+    parser.add_argument('--seed', type=int, help='зерно генератора сбоев')
+    return parser.parse_args(argv)
+
+async def serve(args):
+    """Работа заглушки до остановки по Ctrl+C"""
+    cities, responses = load_fixtures(args.fixtures) if args.fixtures else (None, None)
+    faults = FaultPolicy(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, timeout_rate=args.timeout_rate, hang=args.hang,
+        endpoints=set(args.endpoints.split(',')) if args.endpoints else None, seed=args.seed
+    )
+    stub = WeatherStub(args.host, args.port, cities, responses, faults)
+    url = await stub.start()
+    print(f"Заглушка OpenWeatherMap: WEATHER_API_URL={url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+        print(f"Запросы: {dict(stub.requests)}, сбои: {dict(stub.injected)}")
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+import pytz
+from config import TIMEZONE
+from utils.csv_log import read_records, read_record
+
+logger = logging.getLogger(__name__)
+
+# Формат времени в журнале действий
+TIME_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+class ActionIndex:
+    """
+    Индекс журнала действий по пользователям.
+
+    Для каждой строки журнала хранится идентификатор пользователя, время и
+    байтовое смещение строки в CSV, поэтому история одного пользователя
+    читается без просмотра всего файла.
+    """
+
+    def __init__(self, csv_file: str, index_file: str, fieldnames: list):
+        self.csv_file = csv_file
+        self.index_file = index_file
+        self.fieldnames = fieldnames
+        self.tz = pytz.timezone(TIMEZONE)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(index_file, check_same_thread=False, isolation_level=None)
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        """Создание таблиц индекса, если они не существуют"""
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS actions (
+                    user_id TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS actions_user_ts ON actions (user_id, ts, offset)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def parse_time(self, value: str) -> int:
+        """Перевод времени из журнала в unix-время"""
+        try:
+            return int(self.tz.localize(datetime.strptime(value, TIME_FORMAT)).timestamp())
+        except ValueError:
+            return 0
+
+    def to_timestamp(self, value) -> int:
+        """Граница периода: datetime или unix-время"""
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            if value.tzinfo is None:
+                value = self.tz.localize(value)
+            return int(value.timestamp())
+        return int(value)
+
+    def sync(self) -> int:
+        """Добавление в индекс строк, дописанных в журнал после последней синхронизации"""
+        with self._lock:
+            # BEGIN IMMEDIATE не даёт двум процессам индексировать один и тот же хвост
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT value FROM meta WHERE key = 'offset'").fetchone()
+                offset = row[0] if row else 0
+                if os.path.exists(self.csv_file) and os.path.getsize(self.csv_file) < offset:
+                    # Журнал был заменён или обрезан — строим индекс заново
+                    logger.warning("Журнал действий стал короче, индекс перестраивается")
+                    self.conn.execute("DELETE FROM actions")
+                    offset = 0
+
+                records, new_offset = read_records(self.csv_file, offset)
+                rows = [
+                    (fields[1], self.parse_time(fields[0]), record_offset, length)
+                    for record_offset, length, fields in records
+                    if len(fields) > 1 and not (record_offset == 0 and fields == self.fieldnames)
+                ]
+                self.conn.executemany("INSERT INTO actions VALUES (?, ?, ?, ?)", rows)
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('offset', ?)", (new_offset,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def _where(self, user_id, since, until):
+        """Условие выборки по пользователю и периоду"""
+        clause = "user_id = ?"
+        params = [str(user_id)]
+        since = self.to_timestamp(since)
+        until = self.to_timestamp(until)
+        if since is not None:
+            clause += " AND ts >= ?"
+            params.append(since)
+        if until is not None:
+            clause += " AND ts <= ?"
+            params.append(until)
+        return clause, params
+
+    def count_user_actions(self, user_id, since=None, until=None) -> int:
+        """Количество действий пользователя за период"""
+        clause, params = self._where(user_id, since, until)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM actions WHERE {clause}", params).fetchone()[0]
+
+    def get_user_actions(self, user_id, limit: int = None, offset: int = 0, since=None, until=None, newest_first: bool = False) -> list:
+        """
+        Действия пользователя из журнала
+
+        :param user_id: Идентификатор пользователя
+        :param limit: Размер страницы (без ограничения, если не указан)
+        :param offset: Сколько записей пропустить
+        :param since: Начало периода (datetime или unix-время)
+        :param until: Конец периода (datetime или unix-время)
+        :param newest_first: Сначала новые записи
+        """
+        clause, params = self._where(user_id, since, until)
+        order = "DESC" if newest_first else "ASC"
+        query = f"SELECT offset, length FROM actions WHERE {clause} ORDER BY ts {order}, offset {order} LIMIT ? OFFSET ?"
+        params += [limit if limit is not None else -1, offset]
+        with self._lock:
+            locations = self.conn.execute(query, params).fetchall()
+
+        return [
+            dict(zip(self.fieldnames, read_record(self.csv_file, record_offset, length)))
+            for record_offset, length in locations
+        ]
+
+    def close(self):
+        """Закрытие соединения с индексом"""
+        with self._lock:
+            self.conn.close()
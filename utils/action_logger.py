@@ -1,14 +1,61 @@
 import csv
+import io
 import os
+import time
+import asyncio
+import logging
 from datetime import datetime
 import pytz
-from config import TIMEZONE
+from config import TIMEZONE, ACTION_LOG_BATCH_SIZE, ACTION_LOG_FLUSH_INTERVAL, ACTION_LOG_MAX_BUFFER, ACTION_STATS_UNIQUE_MODE, ACTION_STATS_SAVE_INTERVAL
+from utils.action_stats import ActionStatistics
+from utils.action_index import ActionIndex
+from utils.metrics import STORAGE_WRITE_LATENCY, ACTION_LOG_DROPPED
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Заголовки колонок журнала действий
+CSV_HEADER = [
+    'Дата и время',
+    'ID пользователя',
+    'Имя пользователя',
+    'Имя',
+    'Фамилия',
+    'Действие',
+    'Тип действия',
+    'Дополнительные данные',
+    'Статус'
+]
 
 class ActionLogger:
-    def __init__(self, csv_file='data/actions_log.csv'):
+    def __init__(self, csv_file='data/actions_log.csv', stats_file='data/actions_stats.json',
+                 index_file='data/actions_index.db', batch_size=ACTION_LOG_BATCH_SIZE, flush_interval=ACTION_LOG_FLUSH_INTERVAL,
+                 stats_save_interval=ACTION_STATS_SAVE_INTERVAL, max_buffer=ACTION_LOG_MAX_BUFFER):
         self.csv_file = csv_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats_save_interval = stats_save_interval
+        self.max_buffer = max_buffer
+        # Строки, отброшенные из-за переполнения буфера (например, когда диск заполнен)
+        self.dropped_rows = 0
+        # Буфер отложенной записи: используется после вызова start()
+        self._buffer = []
+        self._flush_task = None
+        self._wakeup = None
+        self._stopping = False
         self.ensure_data_dir()
         self.ensure_csv_exists()
+        # Статистика обновляется по мере записи строк и хранится отдельно от журнала.
+        # На диск она сохраняется по таймеру и при остановке: сохранённое смещение
+        # всегда соответствует счётчикам, а хвост журнала дочитывается при запуске
+        self.stats = ActionStatistics(csv_file, stats_file, unique_mode=ACTION_STATS_UNIQUE_MODE)
+        # В многопроцессном режиме файл статистики сохраняет только один процесс
+        self.persist_stats = True
+        self.stats.load()
+        self.stats.sync()
+        # Индекс по пользователям для быстрого поиска истории действий
+        self.index = ActionIndex(csv_file, index_file, CSV_HEADER)
+        self.index.sync()
 
     def ensure_data_dir(self):
         """Создание директории для данных, если она не существует"""
@@ -19,17 +66,7 @@ class ActionLogger:
         if not os.path.exists(self.csv_file):
             with open(self.csv_file, 'w', newline='', encoding='utf-8') as file:
                 writer = csv.writer(file)
-                writer.writerow([
-                    'Дата и время',
-                    'ID пользователя',
-                    'Имя пользователя',
-                    'Имя',
-                    'Фамилия',
-                    'Действие',
-                    'Тип действия',
-                    'Дополнительные данные',
-                    'Статус'
-                ])
+                writer.writerow(CSV_HEADER)
 
     def get_current_time(self):
         """Получение текущего времени в нужном формате"""
@@ -81,67 +118,163 @@ class ActionLogger:
         :param action_data: Дополнительные данные о действии
         :param status: Статус выполнения действия
         """
-        with open(self.csv_file, 'a', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow([
-                self.get_current_time(),
-                user_data.get('id', ''),
-                user_data.get('username', ''),
-                user_data.get('first_name', ''),
-                user_data.get('last_name', ''),
-                self.get_action_description(action, action_type),
-                action_type or '',
-                action_data or '',
-                self.get_status_description(status)
-            ])
-
-    def get_user_actions(self, user_id: int) -> list:
-        """Получение всех действий конкретного пользователя"""
-        actions = []
-        with open(self.csv_file, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if str(row['ID пользователя']) == str(user_id):
-                    actions.append(row)
-        return actions
+        row = [
+            self.get_current_time(),
+            user_data.get('id', ''),
+            user_data.get('username', ''),
+            user_data.get('first_name', ''),
+            user_data.get('last_name', ''),
+            self.get_action_description(action, action_type),
+            action_type or '',
+            action_data or '',
+            self.get_status_description(status)
+        ]
+
+        # Без запущенной фоновой записи пишем строку сразу
+        if self._flush_task is None:
+            self.write_rows([row])
+            return
+
+        # Сама запись идёт в фоне без контекста трассировки, здесь замеряется постановка в буфер
+        with span("storage.log_action"):
+            self._buffer.append(row)
+            if len(self._buffer) > self.max_buffer:
+                self._trim_buffer()
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+
+    def write_rows(self, rows: list):
+        """Дописывание строк в CSV файл"""
+        with STORAGE_WRITE_LATENCY.time(store='actions_csv'), span("storage.actions_csv"):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            # Один вызов write в режиме O_APPEND: строки разных процессов не перемешиваются
+            fd = os.open(self.csv_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+            try:
+                os.write(fd, buffer.getvalue().encode('utf-8'))
+            finally:
+                os.close(fd)
+        self.sync_derived()
+
+    def sync_derived(self):
+        """
+        Обновление статистики и индекса по дописанным строкам
+
+        Строки уже в журнале, поэтому ошибка здесь их не возвращает в буфер:
+        статистика и индекс читают журнал со своего смещения и догонят его
+        при следующей записи (например, после «database is locked»).
+        """
+        try:
+            with STORAGE_WRITE_LATENCY.time(store='actions_stats'), span("storage.actions_stats"):
+                self.stats.sync()
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении статистики журнала: {e}")
+        try:
+            with STORAGE_WRITE_LATENCY.time(store='actions_index'), span("storage.actions_index"):
+                self.index.sync()
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении индекса журнала: {e}")
+
+    def save_stats(self):
+        """Сохранение статистики на диск, если она изменилась"""
+        if not self.persist_stats or not self.stats.dirty:
+            return
+        with STORAGE_WRITE_LATENCY.time(store='actions_stats_file'):
+            try:
+                self.stats.save()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении статистики журнала: {e}")
+
+    async def start(self):
+        """Запуск фоновой пакетной записи журнала"""
+        if self._flush_task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Отложенная запись журнала действий включена (не реже раза в {self.flush_interval} с)")
+
+    async def stop(self):
+        """Остановка фоновой записи с сохранением всех накопленных строк"""
+        if self._flush_task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._flush_task
+        self._flush_task = None
+
+    async def flush(self):
+        """Запись накопленных строк в файл вне цикла событий"""
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        try:
+            await asyncio.to_thread(self.write_rows, rows)
+        except Exception as e:
+            logger.error(f"Ошибка при записи журнала действий: {e}")
+            # Возвращаем строки в буфер, чтобы записать их в следующий раз
+            self._buffer[:0] = rows
+            self._trim_buffer()
+
+    def _trim_buffer(self):
+        """Отбрасывание самых старых строк сверх max_buffer"""
+        excess = len(self._buffer) - self.max_buffer
+        if excess <= 0:
+            return
+        del self._buffer[:excess]
+        self.dropped_rows += excess
+        ACTION_LOG_DROPPED.inc(excess)
+        logger.error(f"Буфер журнала действий переполнен: отброшено {excess} строк (всего {self.dropped_rows})")
+
+    async def _flush_loop(self):
+        """Запись буфера по размеру пакета или по таймеру, периодическое сохранение статистики"""
+        saved_at = time.monotonic()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Любая ошибка записи не должна останавливать фоновую задачу:
+            # иначе строки копились бы в буфере до остановки бота
+            try:
+                await self.flush()
+                if time.monotonic() - saved_at >= self.stats_save_interval:
+                    await asyncio.to_thread(self.save_stats)
+                    saved_at = time.monotonic()
+            except Exception as e:
+                logger.exception(f"Ошибка фоновой записи журнала действий: {e}")
+                self._trim_buffer()
+        # Дописываем всё, что накопилось к моменту остановки
+        await self.flush()
+        await asyncio.to_thread(self.save_stats)
+
+    def get_user_actions(self, user_id: int, limit: int = None, offset: int = 0, since=None, until=None, newest_first: bool = False) -> list:
+        """
+        Получение действий конкретного пользователя
+        
+        :param user_id: Идентификатор пользователя
+        :param limit: Размер страницы (без ограничения, если не указан)
+        :param offset: Сколько записей пропустить
+        :param since: Начало периода (datetime или unix-время)
+        :param until: Конец периода (datetime или unix-время)
+        :param newest_first: Сначала новые записи
+        """
+        return self.index.get_user_actions(user_id, limit=limit, offset=offset, since=since, until=until, newest_first=newest_first)
+
+    def count_user_actions(self, user_id: int, since=None, until=None) -> int:
+        """Количество действий пользователя за период"""
+        return self.index.count_user_actions(user_id, since=since, until=until)
 
     def get_action_statistics(self, action_type: str = None) -> dict:
         """
         Получение статистики по действиям
         
+        Счётчики ведутся по мере записи журнала, поэтому ответ не зависит от его размера.
+        
         :param action_type: Тип действия для фильтрации (опционально)
         :return: Словарь со статистикой
         """
-        stats = {
-            'всего_действий': 0,
-            'уникальных_пользователей': set(),
-            'действия_по_типу': {},
-            'процент_успешных': 0,
-            'ошибок': 0
-        }
-        
-        with open(self.csv_file, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if action_type and row['Тип действия'] != action_type:
-                    continue
-                    
-                stats['всего_действий'] += 1
-                stats['уникальных_пользователей'].add(row['ID пользователя'])
-                
-                # Подсчет действий по типу
-                action_type_key = row['Тип действия'] or 'неизвестно'
-                stats['действия_по_типу'][action_type_key] = stats['действия_по_типу'].get(action_type_key, 0) + 1
-                
-                # Подсчет ошибок
-                if row['Статус'] != 'Успешно':
-                    stats['ошибок'] += 1
-        
-        # Расчет процента успешных действий
-        if stats['всего_действий'] > 0:
-            stats['процент_успешных'] = ((stats['всего_действий'] - stats['ошибок']) / stats['всего_действий']) * 100
-        
-        # Преобразуем set в количество уникальных пользователей
-        stats['уникальных_пользователей'] = len(stats['уникальных_пользователей'])
-        
-        return stats 
\ No newline at end of file
+        return self.stats.get(action_type)
+
+action_logger = ActionLogger()
@@ -0,0 +1,223 @@
+import os
+import json
+import math
+import base64
+import hashlib
+import logging
+import threading
+from utils.csv_log import read_records
+
+logger = logging.getLogger(__name__)
+
+# Индексы колонок журнала действий
+COLUMN_USER_ID = 1
+COLUMN_ACTION_TYPE = 6
+COLUMN_STATUS = 8
+
+HEADER_FIRST_COLUMN = 'Дата и время'
+UNKNOWN_ACTION_TYPE = 'неизвестно'
+SUCCESS_STATUS = 'Успешно'
+
+class HyperLogLog:
+    """Приблизительный подсчёт уникальных значений в фиксированном объёме памяти"""
+
+    def __init__(self, precision: int = 12, registers: bytes = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    def add(self, value):
+        """Добавление значения"""
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - self.precision)
+        rest = (hashed << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = min(64 - rest.bit_length(), 64 - self.precision) + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def __len__(self):
+        """Оценка количества уникальных значений"""
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        # Поправка для малого количества значений
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+    def to_state(self):
+        """Сериализация для сохранения в JSON"""
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @classmethod
+    def from_state(cls, state):
+        """Восстановление из сохранённого состояния"""
+        registers = base64.b64decode(state)
+        return cls(precision=int(math.log2(len(registers))), registers=registers)
+
+class ExactSet:
+    """Точный подсчёт уникальных значений (память растёт с количеством значений)"""
+
+    def __init__(self, values=None):
+        self.values = set(values or [])
+
+    def add(self, value):
+        """Добавление значения"""
+        self.values.add(str(value))
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_state(self):
+        """Сериализация для сохранения в JSON"""
+        return sorted(self.values)
+
+    @classmethod
+    def from_state(cls, state):
+        """Восстановление из сохранённого состояния"""
+        return cls(state)
+
+UNIQUE_COUNTERS = {
+    'hll': HyperLogLog,
+    'exact': ExactSet
+}
+
+class ActionStatistics:
+    """
+    Счётчики журнала действий, обновляемые по мере дописывания строк.
+
+    Статистика хранит смещение в CSV файле, до которого строки уже учтены,
+    поэтому после перезапуска дочитывается только хвост журнала.
+    """
+
+    def __init__(self, csv_file: str, stats_file: str, unique_mode: str = 'hll'):
+        if unique_mode not in UNIQUE_COUNTERS:
+            raise ValueError(f"Неизвестный режим подсчёта уникальных пользователей: {unique_mode}")
+        self.csv_file = csv_file
+        self.stats_file = stats_file
+        self.unique_mode = unique_mode
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Обнуление всех счётчиков"""
+        self.offset = 0
+        self.users = UNIQUE_COUNTERS[self.unique_mode]()
+        self.groups = {}
+        # Есть изменения, ещё не сохранённые на диск
+        self.dirty = True
+
+    def record(self, fields: list):
+        """Учёт одной строки журнала"""
+        user_id = fields[COLUMN_USER_ID]
+        action_type = fields[COLUMN_ACTION_TYPE]
+        group = self.groups.get(action_type)
+        if group is None:
+            group = self.groups[action_type] = {
+                'count': 0,
+                'errors': 0,
+                'users': UNIQUE_COUNTERS[self.unique_mode]()
+            }
+        group['count'] += 1
+        group['users'].add(user_id)
+        if fields[COLUMN_STATUS] != SUCCESS_STATUS:
+            group['errors'] += 1
+        self.users.add(user_id)
+
+    def sync(self) -> int:
+        """Учёт строк, дописанных в журнал после последней синхронизации"""
+        with self._lock:
+            if os.path.exists(self.csv_file) and os.path.getsize(self.csv_file) < self.offset:
+                # Журнал был заменён или обрезан — пересчитываем с начала
+                logger.warning("Журнал действий стал короче, статистика пересчитывается")
+                self.reset()
+
+            records, self.offset = read_records(self.csv_file, self.offset)
+            counted = 0
+            for offset, _, fields in records:
+                if offset == 0 and fields and fields[0] == HEADER_FIRST_COLUMN:
+                    continue
+                if len(fields) <= COLUMN_STATUS:
+                    continue
+                self.record(fields)
+                counted += 1
+            if counted:
+                self.dirty = True
+            return counted
+
+    def get(self, action_type: str = None) -> dict:
+        """Статистика в формате ActionLogger.get_action_statistics"""
+        with self._lock:
+            if action_type:
+                groups = {action_type: self.groups[action_type]} if action_type in self.groups else {}
+                users = groups[action_type]['users'] if groups else ()
+            else:
+                groups = self.groups
+                users = self.users
+
+            stats = {
+                'всего_действий': sum(group['count'] for group in groups.values()),
+                'уникальных_пользователей': len(users),
+                'действия_по_типу': {},
+                'процент_успешных': 0,
+                'ошибок': sum(group['errors'] for group in groups.values())
+            }
+            for key, group in groups.items():
+                type_key = key or UNKNOWN_ACTION_TYPE
+                stats['действия_по_типу'][type_key] = stats['действия_по_типу'].get(type_key, 0) + group['count']
+
+        if stats['всего_действий'] > 0:
+            stats['процент_успешных'] = ((stats['всего_действий'] - stats['ошибок']) / stats['всего_действий']) * 100
+        return stats
+
+    def load(self):
+        """Загрузка сохранённой статистики"""
+        if not os.path.exists(self.stats_file):
+            return
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать {self.stats_file}: {e}")
+            return
+
+        if state.get('unique_mode') != self.unique_mode:
+            logger.info("Режим подсчёта уникальных пользователей изменился, статистика пересчитывается")
+            return
+
+        counter = UNIQUE_COUNTERS[self.unique_mode]
+        with self._lock:
+            self.offset = state['offset']
+            self.users = counter.from_state(state['users'])
+            self.groups = {
+                key: {
+                    'count': group['count'],
+                    'errors': group['errors'],
+                    'users': counter.from_state(group['users'])
+                }
+                for key, group in state['groups'].items()
+            }
+            self.dirty = False
+
+    def save(self):
+        """Сохранение статистики на диск"""
+        with self._lock:
+            state = {
+                'unique_mode': self.unique_mode,
+                'offset': self.offset,
+                'users': self.users.to_state(),
+                'groups': {
+                    key: {
+                        'count': group['count'],
+                        'errors': group['errors'],
+                        'users': group['users'].to_state()
+                    }
+                    for key, group in self.groups.items()
+                }
+            }
+            self.dirty = False
+        tmp_path = f"{self.stats_file}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file, ensure_ascii=False)
+        os.replace(tmp_path, self.stats_file)
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from utils.metrics import CACHE_REQUESTS
+
+class AsyncTTLCache:
+    """
+    Асинхронный кеш с временем жизни записей.
+
+    Пока значение для ключа запрашивается, остальные вызовы с тем же ключом
+    ждут этот же запрос, а не запускают свой. Устаревшие записи не удаляются
+    и могут быть отданы сразу, пока в фоне идёт обновление.
+    """
+
+    def __init__(self, ttl: float, name: str = 'cache'):
+        self.ttl = ttl
+        self.name = name
+        self._entries = {}
+        self._inflight = {}
+        # Счётчик версий: растёт при каждом сохранении значения
+        self._version = 0
+
+    def get(self, key):
+        """Значение из кеша, если оно ещё не устарело"""
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def get_stale(self, key):
+        """Значение из кеша, даже если его время жизни истекло"""
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def get_version(self, key):
+        """Версия сохранённого значения (None, если значения нет)"""
+        entry = self._entries.get(key)
+        return entry[2] if entry else None
+
+    def set(self, key, value):
+        """Сохранение значения в кеш"""
+        self._version += 1
+        self._entries[key] = (value, time.monotonic() + self.ttl, self._version)
+
+    def items(self) -> list:
+        """Пары (ключ, значение) всех записей, включая устаревшие"""
+        return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    def invalidate(self, key=None):
+        """Удаление записи (или всех записей, если ключ не указан)"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get_or_fetch(self, key, fetcher, is_valid=None, allow_stale=False):
+        """
+        Получение значения из кеша или через fetcher с объединением запросов
+
+        :param key: Ключ кеша
+        :param fetcher: Функция без аргументов, возвращающая корутину
+        :param is_valid: Проверка, стоит ли сохранять результат в кеш
+        :param allow_stale: Отдать устаревшее значение сразу, обновив его в фоне
+        """
+        value = self.get(key)
+        if value is not None:
+            CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return value
+
+        task = self._start_fetch(key, fetcher, is_valid)
+        if allow_stale:
+            stale = self.get_stale(key)
+            if stale is not None:
+                CACHE_REQUESTS.inc(cache=self.name, result='stale')
+                return stale
+
+        CACHE_REQUESTS.inc(cache=self.name, result='miss')
+
+        # shield: отмена одного из ожидающих не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    async def refresh(self, key, fetcher, is_valid=None):
+        """Принудительное обновление значения (с объединением запросов)"""
+        return await asyncio.shield(self._start_fetch(key, fetcher, is_valid))
+
+    def _start_fetch(self, key, fetcher, is_valid):
+        """Запуск запроса для ключа или возврат уже выполняющегося"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, fetcher, is_valid))
+            self._inflight[key] = task
+        return task
+
+    async def _fetch(self, key, fetcher, is_valid):
+        """Выполнение запроса и сохранение результата"""
+        try:
+            value = await fetcher()
+            if is_valid is None or is_valid(value):
+                self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
@@ -0,0 +1,81 @@
+import string
+import hashlib
+import operator
+
+# Алфавит base62: только однобайтовые символы, допустимые в callback_data
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+ALPHABET_INDEX = {char: index for index, char in enumerate(ALPHABET)}
+
+# Размер пространства идентификаторов (32 бита — не более 6 символов base62)
+ID_SPACE = 1 << 32
+
+# Префиксы компактных callback_data
+CATEGORY_PREFIX = 'c_'
+EXCURSION_PREFIX = 'e_'
+CITY_PREFIX = 'w_'
+FORECAST_PREFIX = 'f_'
+
+def encode_int(value: int) -> str:
+    """Кодирование неотрицательного числа в base62"""
+    if value < 0:
+        raise ValueError("Можно закодировать только неотрицательное число")
+    if value == 0:
+        return ALPHABET[0]
+    chars = []
+    while value:
+        value, remainder = divmod(value, BASE)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+def decode_int(code: str) -> int:
+    """Декодирование числа из base62 (ValueError для некорректной строки)"""
+    if not code:
+        raise ValueError("Пустой код")
+    value = 0
+    for char in code:
+        index = ALPHABET_INDEX.get(char)
+        if index is None:
+            raise ValueError(f"Недопустимый символ в коде: {char}")
+        value = value * BASE + index
+    return value
+
+def stable_id(name: str) -> int:
+    """Идентификатор, зависящий только от названия (не меняется при перезагрузке каталога)"""
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(digest, 'big')
+
+class IdRegistry:
+    """Двусторонняя таблица «название ↔ короткий код»"""
+
+    def __init__(self, names):
+        self.codes = {}
+        self.names = {}
+        # Сортировка делает разрешение коллизий детерминированным
+        for name in sorted(set(names)):
+            value = stable_id(name)
+            while encode_int(value) in self.names:
+                value = (value + 1) % ID_SPACE
+            code = encode_int(value)
+            self.codes[name] = code
+            self.names[code] = name
+
+    def encode(self, name: str) -> str:
+        """Код для названия (None, если название неизвестно)"""
+        return self.codes.get(name)
+
+    def decode(self, code: str) -> str:
+        """Название по коду (None для устаревшего или неверного кода)"""
+        return self.names.get(code)
+
+def encode_excursion_id(excursion_id) -> str:
+    """Код экскурсии: целый идентификатор из price.xls в base62 (TypeError для нецелых)"""
+    # index(), а не int(): дробный идентификатор не должен молча округляться
+    return encode_int(operator.index(excursion_id))
+
+def decode_excursion_id(code: str) -> str:
+    """Идентификатор экскурсии по коду (None для неверного кода)"""
+    try:
+        return str(decode_int(code))
+    except ValueError:
+        return None
@@ -0,0 +1,48 @@
+import csv
+import io
+import os
+
+def read_records(file_path: str, offset: int = 0):
+    """
+    Чтение записей CSV файла начиная с байтового смещения
+
+    Возвращает список кортежей (смещение, длина, поля) и смещение, с которого
+    нужно продолжить чтение. Незавершённая последняя запись не возвращается.
+    """
+    if not os.path.exists(file_path):
+        return [], 0
+
+    with open(file_path, 'rb') as file:
+        file.seek(offset)
+        data = file.read()
+
+    records = []
+    position = offset
+    record_start = offset
+    pending = b''
+    # Только \n завершает строку: одиночный \r может стоять внутри поля в кавычках
+    start = 0
+    while True:
+        end = data.find(b'\n', start)
+        if end == -1:
+            break
+        line = data[start:end + 1]
+        start = end + 1
+        pending += line
+        position += len(line)
+        # Перевод строки внутри кавычек не завершает запись
+        if pending.count(b'"') % 2:
+            continue
+        fields = next(csv.reader(io.StringIO(pending.decode('utf-8'))), [])
+        records.append((record_start, len(pending), fields))
+        record_start = position
+        pending = b''
+
+    return records, record_start
+
+def read_record(file_path: str, offset: int, length: int) -> list:
+    """Чтение одной записи CSV по смещению и длине"""
+    with open(file_path, 'rb') as file:
+        file.seek(offset)
+        data = file.read(length)
+    return next(csv.reader(io.StringIO(data.decode('utf-8'))), [])
@@ -0,0 +1,325 @@
+import os
+import sys
+import hashlib
+import logging
+import sqlite3
+import threading
+import asyncio
+from datetime import datetime
+from config import EXCURSIONS_FILE, EXCURSIONS_SNAPSHOT
+from utils.callback_codec import IdRegistry
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Колонки, которые обязательно должны быть в файле с экскурсиями
+REQUIRED_COLUMNS = ['Категория', 'Название', 'Идентификатор', 'Описание', 'Цена', 'Фото', 'Популярный товар', 'В наличии']
+
+# Соответствие колонок Excel колонкам таблицы в снимке
+SNAPSHOT_COLUMNS = {
+    'Категория': 'category',
+    'Название': 'name',
+    'Идентификатор': 'excursion_id',
+    'Описание': 'description',
+    'Цена': 'price',
+    'Фото': 'photo',
+    'Популярный товар': 'popular',
+    'В наличии': 'available'
+}
+
+def load_excursions(file_path: str = EXCURSIONS_FILE):
+    """Загрузка данных об экскурсиях из Excel файла"""
+    # pandas нужен только при сборке снимка, поэтому импортируем его здесь
+    import pandas as pd
+
+    # Проверяем существование файла
+    if not os.path.exists(file_path):
+        print(f"Файл не найден: {file_path}")
+        return None
+
+    print(f"Файл найден: {file_path}")
+
+    try:
+        # Загружаем файл как xls
+        df = pd.read_excel(file_path, sheet_name='Sheet1', engine='xlrd')
+        print("Успешно загружен файл")
+    except Exception as e:
+        print(f"Ошибка при загрузке файла: {e}")
+        return None
+
+    # Проверяем наличие необходимых колонок
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        print(f"Отсутствуют колонки: {missing_columns}")
+        return None
+
+    # Выводим информацию о загруженных данных
+    print(f"Загружено {len(df)} экскурсий")
+    print(f"Категории: {df['Категория'].unique().tolist()}")
+
+    return df
+
+def get_file_stamp(file_path: str):
+    """Отметка изменения файла: время модификации и размер"""
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+def get_file_hash(file_path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _to_python(value):
+    """Приведение значения из pandas к типу, который понимает SQLite"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:  # NaN
+        return None
+    if hasattr(value, 'item'):  # numpy-скаляры
+        return value.item()
+    return value
+
+def build_snapshot(file_path: str = EXCURSIONS_FILE, snapshot_path: str = EXCURSIONS_SNAPSHOT) -> bool:
+    """Сборка снимка каталога в SQLite из Excel файла"""
+    df = load_excursions(file_path)
+    if df is None:
+        return False
+
+    mtime_ns, size = get_file_stamp(file_path)
+    source_hash = get_file_hash(file_path)
+    columns = list(SNAPSHOT_COLUMNS.values())
+
+    # Пишем во временный файл и атомарно подменяем старый снимок
+    tmp_path = f"{snapshot_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(f"CREATE TABLE excursions (position INTEGER PRIMARY KEY, {', '.join(columns)})")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        rows = [
+            [position] + [_to_python(record[column]) for column in SNAPSHOT_COLUMNS]
+            for position, record in enumerate(df.to_dict('records'))
+        ]
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        conn.executemany(f"INSERT INTO excursions VALUES ({placeholders})", rows)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ('source_mtime_ns', str(mtime_ns)),
+            ('source_size', str(size)),
+            ('source_hash', source_hash),
+            ('built_at', datetime.now().isoformat(timespec='seconds'))
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, snapshot_path)
+    logger.info(f"Снимок каталога собран: {snapshot_path} ({len(rows)} экскурсий)")
+    return True
+
+def read_snapshot(snapshot_path: str = EXCURSIONS_SNAPSHOT):
+    """Чтение снимка каталога: метаданные и список экскурсий"""
+    conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        columns = ', '.join(SNAPSHOT_COLUMNS.values())
+        cursor = conn.execute(f"SELECT {columns} FROM excursions ORDER BY position")
+        records = [dict(zip(SNAPSHOT_COLUMNS, row)) for row in cursor]
+    finally:
+        conn.close()
+    return meta, records
+
+def read_snapshot_meta(snapshot_path: str = EXCURSIONS_SNAPSHOT) -> dict:
+    """Чтение только метаданных снимка"""
+    conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    try:
+        return dict(conn.execute("SELECT key, value FROM meta"))
+    finally:
+        conn.close()
+
+def _update_snapshot_stamp(snapshot_path: str, mtime_ns: int, size: int):
+    """Обновление отметки исходного файла в снимке без пересборки"""
+    conn = sqlite3.connect(snapshot_path)
+    try:
+        conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+            ('source_mtime_ns', str(mtime_ns)),
+            ('source_size', str(size))
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+
+def normalize_excursion_id(value) -> int:
+    """Идентификатор экскурсии как целое число (ValueError для дробных и нечисловых значений)"""
+    # pandas читает колонку с пропусками как float: 17.0 — это экскурсия 17
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    raise ValueError(f"некорректный идентификатор {value!r}")
+
+class CatalogState:
+    """Неизменяемое состояние каталога: индексы и версия"""
+
+    def __init__(self, records: list, version: str = '', stamp=None):
+        by_category = {}
+        by_id = {}
+        for record in records:
+            # Идентификаторы приводятся к int один раз: по ним строятся коды кнопок и ключи by_id
+            try:
+                record['Идентификатор'] = normalize_excursion_id(record['Идентификатор'])
+            except ValueError as e:
+                logger.warning(f"Экскурсия «{record['Название']}» пропущена: {e}")
+                continue
+            by_category.setdefault(record['Категория'], []).append(record)
+            by_id[str(record['Идентификатор'])] = record
+
+        self.categories = sorted(by_category.keys())
+        self.by_category = by_category
+        self.by_id = by_id
+        # Короткие коды категорий для callback_data
+        self.category_ids = IdRegistry(self.categories)
+        self.version = version
+        self.stamp = stamp
+
+class ExcursionCatalog:
+    """Каталог экскурсий в памяти с индексами по категориям и идентификаторам"""
+
+    def __init__(self, file_path: str = EXCURSIONS_FILE, snapshot_path: str = EXCURSIONS_SNAPSHOT):
+        self.file_path = file_path
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._state = None
+        # Пересобирает снимок только владелец; остальные процессы лишь перечитывают его
+        self.owns_snapshot = True
+
+    @property
+    def state(self) -> CatalogState:
+        """Текущее состояние каталога (загружается при первом обращении)"""
+        state = self._state
+        if state is None:
+            with self._lock, span("catalog.load"):
+                if self._state is None:
+                    self._load_locked()
+                state = self._state or CatalogState([])
+        return state
+
+    @property
+    def version(self) -> str:
+        """Версия каталога (хеш исходного файла)"""
+        return self.state.version
+
+    def _snapshot_is_fresh(self, stamp) -> bool:
+        """Проверка, что снимок собран из текущей версии Excel файла"""
+        if not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            meta = read_snapshot_meta(self.snapshot_path)
+        except sqlite3.Error as e:
+            logger.warning(f"Снимок каталога повреждён: {e}")
+            return False
+
+        if (meta.get('source_mtime_ns'), meta.get('source_size')) == (str(stamp[0]), str(stamp[1])):
+            return True
+
+        # Время изменения поменялось, но содержимое могло остаться прежним
+        if meta.get('source_hash') == get_file_hash(self.file_path):
+            if self.owns_snapshot:
+                _update_snapshot_stamp(self.snapshot_path, *stamp)
+            return True
+        return False
+
+    def _load_locked(self) -> bool:
+        """Загрузка каталога из снимка с пересборкой при необходимости"""
+        stamp = None
+        if os.path.exists(self.file_path):
+            stamp = get_file_stamp(self.file_path)
+            fresh = self._snapshot_is_fresh(stamp)
+            if not fresh and self.owns_snapshot:
+                logger.info("Исходный файл каталога изменился, пересобираем снимок")
+                with span("catalog.build_snapshot"):
+                    built = build_snapshot(self.file_path, self.snapshot_path)
+                if not built:
+                    logger.error("Не удалось собрать снимок каталога")
+            elif not fresh and (self._state is not None or not os.path.exists(self.snapshot_path)):
+                # Снимок пересоберёт владелец, перечитаем его при следующей проверке
+                logger.debug("Снимок каталога ещё не пересобран, оставляем текущую версию")
+                return False
+            elif not fresh:
+                # Пока владелец пересобирает снимок, работаем с прежним, но проверим его снова
+                stamp = None
+        elif not os.path.exists(self.snapshot_path):
+            logger.error("Не найден ни файл с экскурсиями, ни снимок каталога")
+            return False
+
+        try:
+            meta, records = read_snapshot(self.snapshot_path)
+        except sqlite3.Error as e:
+            logger.error(f"Не удалось прочитать снимок каталога: {e}")
+            return False
+
+        # Подмена ссылки на состояние атомарна: текущие запросы дочитают старую версию
+        self._state = CatalogState(records, version=meta.get('source_hash', '')[:12], stamp=stamp)
+        logger.info(
+            f"Каталог экскурсий загружен: {len(self._state.by_id)} экскурсий, "
+            f"{len(self._state.categories)} категорий, версия {self._state.version}"
+        )
+        return True
+
+    def load(self) -> bool:
+        """Загрузка (или принудительная перезагрузка) каталога"""
+        with self._lock:
+            return self._load_locked()
+
+    def reload_if_changed(self) -> bool:
+        """Перезагрузка каталога, если Excel файл изменился"""
+        if not os.path.exists(self.file_path):
+            return False
+        stamp = get_file_stamp(self.file_path)
+        state = self._state
+        if state is not None and state.stamp == stamp:
+            return False
+
+        with self._lock:
+            previous_version = self._state.version if self._state else None
+            if not self._load_locked():
+                return False
+            return self._state.version != previous_version
+
+    def get_categories(self) -> list:
+        """Отсортированный список категорий"""
+        return self.state.categories
+
+    def get_excursions_by_category(self, category: str) -> list:
+        """Экскурсии указанной категории"""
+        return self.state.by_category.get(category, [])
+
+    def get_excursion_by_id(self, excursion_id) -> dict:
+        """Экскурсия по её идентификатору"""
+        return self.state.by_id.get(str(excursion_id))
+
+    def get_category_code(self, category: str) -> str:
+        """Короткий код категории для callback_data"""
+        return self.state.category_ids.encode(category)
+
+    def get_category_by_code(self, code: str) -> str:
+        """Категория по короткому коду (None, если кнопка устарела)"""
+        return self.state.category_ids.decode(code)
+
+catalog = ExcursionCatalog()
+
+async def reload_catalog_job(context):
+    """Периодическая проверка изменений price.xls и горячая перезагрузка каталога"""
+    # Пересборка идёт в отдельном потоке и не задерживает обработку обновлений
+    if await asyncio.to_thread(catalog.reload_if_changed):
+        logger.info(f"Каталог экскурсий перезагружен, версия {catalog.version}")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+    source = sys.argv[1] if len(sys.argv) > 1 else EXCURSIONS_FILE
+    target = sys.argv[2] if len(sys.argv) > 2 else EXCURSIONS_SNAPSHOT
+    sys.exit(0 if build_snapshot(source, target) else 1)
@@ -0,0 +1,137 @@
+import os
+import json
+import asyncio
+import logging
+import aiohttp
+from config import WEATHER_API_KEY, WEATHER_API_URL, WEATHER_API_DEFAULT_URL, CITY_COORDINATES_FILE, SUPPORTED_CITIES
+
+logger = logging.getLogger(__name__)
+
+# Города, для которых геокодер находит не то место: используем идентификатор OpenWeatherMap
+CITY_ID_OVERRIDES = {
+    'Красная Поляна': 542681
+}
+
+class CityRegistry:
+    """Реестр координат городов, сохраняемый на диск"""
+
+    def __init__(self, file_path: str = CITY_COORDINATES_FILE):
+        self.file_path = file_path
+        self._cities = {}
+        # Идентификаторы для группового запроса, полученные не от OpenWeatherMap (заглушка, прокси)
+        self._session_group_ids = {}
+        self._lock = None
+        self.load()
+
+    def load(self):
+        """Загрузка сохранённых координат"""
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                self._cities = json.load(file)
+            for location in self._cities.values():
+                # Идентификатор из ответа о погоде — только для группового запроса,
+                # погода по городу запрашивается по координатам
+                if "lat" in location and "id" in location:
+                    location["group_id"] = location.pop("id")
+            logger.info(f"Загружены координаты {len(self._cities)} городов из {self.file_path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать {self.file_path}: {e}")
+            self._cities = {}
+
+    def save(self):
+        """Сохранение координат на диск"""
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        tmp_path = f"{self.file_path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self._cities, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.file_path)
+
+    def get(self, city: str) -> dict:
+        """Сохранённое положение города или None"""
+        location = self._cities.get(city)
+        if location is None and city in CITY_ID_OVERRIDES:
+            location = {"id": CITY_ID_OVERRIDES[city]}
+        return location
+
+    def group_ids(self, cities: list) -> dict:
+        """Идентификаторы OpenWeatherMap для группового запроса погоды, если они известны"""
+        ids = {}
+        for city in cities:
+            location = self.get(city)
+            if location is None:
+                continue
+            city_id = self._session_group_ids.get(city) or location.get("group_id") or location.get("id")
+            if city_id:
+                ids[city] = city_id
+        return ids
+
+    def remember_group_id(self, city: str, city_id):
+        """
+        Сохранение идентификатора из ответа о погоде для группового запроса
+
+        Для небольших посёлков OpenWeatherMap возвращает идентификатор ближайшего
+        крупного города, поэтому он хранится отдельно и не заменяет координаты.
+        """
+        location = self._cities.get(city)
+        # id=0 OpenWeatherMap возвращает для мест без привязки к городу
+        if location is None or not city_id or location.get("group_id") == city_id:
+            return
+        if WEATHER_API_URL != WEATHER_API_DEFAULT_URL:
+            # Идентификаторы другого сервера с настоящим API не совпадут: храним только в памяти
+            self._session_group_ids[city] = city_id
+            return
+        location["group_id"] = city_id
+        self.save()
+        logger.info(f"Идентификатор города {city} для группового запроса сохранён: {city_id}")
+
+    async def resolve(self, city: str, session: aiohttp.ClientSession) -> dict:
+        """Положение города: из реестра или через геокодер OpenWeatherMap"""
+        # Геокодируем только города бота: произвольные строки из старых кнопок
+        # не должны расходовать квоту API и попадать в реестр
+        if city not in SUPPORTED_CITIES:
+            logger.warning(f"Запрос положения неподдерживаемого города: {city}")
+            return None
+
+        location = self.get(city)
+        if location is not None:
+            return location
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Город мог быть найден, пока мы ждали блокировку
+            location = self.get(city)
+            if location is not None:
+                return location
+
+            geocoding_url = f"{WEATHER_API_URL}/geo/1.0/direct?q={city},RU&limit=1&appid={WEATHER_API_KEY}"
+            async with session.get(geocoding_url) as response:
+                location_data = await response.json()
+            if not location_data or not isinstance(location_data, list):
+                logger.warning(f"Геокодер не нашёл город {city}")
+                return None
+
+            location = {"lat": location_data[0]["lat"], "lon": location_data[0]["lon"]}
+            self._cities[city] = location
+            self.save()
+            logger.info(f"Координаты города {city} сохранены: {location}")
+            return location
+
+    async def resolve_all(self, cities: list, session: aiohttp.ClientSession):
+        """Определение положения всех городов, которых ещё нет в реестре"""
+        for city in cities:
+            try:
+                await self.resolve(city, session)
+            except Exception as e:
+                logger.error(f"Ошибка при геокодировании города {city}: {e}")
+
+def location_query(location: dict) -> str:
+    """Параметры запроса к погодному API для положения города"""
+    # id есть только у городов из CITY_ID_OVERRIDES
+    if "id" in location:
+        return f"id={location['id']}"
+    return f"lat={location['lat']}&lon={location['lon']}"
+
+city_registry = CityRegistry()
@@ -0,0 +1,46 @@
+import logging
+import aiohttp
+from config import (
+    HTTP_POOL_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# Общая HTTP-сессия приложения
+_session = None
+
+def create_session() -> aiohttp.ClientSession:
+    """Создание HTTP-сессии с пулом соединений и кешем DNS"""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def get_session() -> aiohttp.ClientSession:
+    """Общая HTTP-сессия (создаётся при первом обращении, если ещё не открыта)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = create_session()
+    return _session
+
+async def init_http_client():
+    """Открытие общей HTTP-сессии при запуске приложения"""
+    get_session()
+    logger.info("HTTP-клиент инициализирован")
+
+async def close_http_client():
+    """Закрытие общей HTTP-сессии при остановке приложения"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("HTTP-клиент закрыт")
+    _session = None
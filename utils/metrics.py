@@ -0,0 +1,314 @@
+import time
+import bisect
+import asyncio
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм времени, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Тип ответа текстового формата Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Период замера задержки цикла событий, секунды
+LOOP_LAG_INTERVAL = 1.0
+
+def format_labels(labels: dict) -> str:
+    """Метки в формате Prometheus: {name="value",...}"""
+    if not labels:
+        return ''
+    escaped = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def format_value(value: float) -> str:
+    """Число в формате Prometheus"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Общая часть метрик: имя, описание и значения по наборам меток"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        """Значения меток в порядке labelnames"""
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """Строки (суффикс, метки, значение) для вывода"""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '', dict(zip(self.labelnames, key)), value
+
+    def render(self) -> list:
+        """Метрика в текстовом формате Prometheus"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    """Монотонно растущий счётчик"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        """Увеличение счётчика"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Текущее значение счётчика"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться при каждом чтении"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        """Установка значения"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """Значение вычисляется функцией без аргументов при каждом чтении"""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self):
+        yield from super().samples()
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                value = function()
+            except Exception as e:
+                logger.warning(f"Не удалось вычислить метрику {self.name}: {e}")
+                continue
+            yield '', dict(zip(self.labelnames, key)), value
+
+class Histogram(Metric):
+    """Гистограмма значений (обычно времени выполнения)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        """Учёт одного значения"""
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Счётчики корзин (последняя — +Inf), сумма и количество
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер времени выполнения блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels) -> tuple:
+        """Счётчики корзин, сумма и количество значений для набора меток"""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            if entry is None:
+                return [0] * (len(self.buckets) + 1), 0.0, 0
+            return list(entry[0]), entry[1], entry[2]
+
+    def quantile(self, q: float, **labels) -> float:
+        """Оценка квантиля по гистограмме (верхняя граница корзины)"""
+        counts, _, count = self.snapshot(**labels)
+        if not count:
+            return 0.0
+        threshold = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '_bucket', {**labels, 'le': format_value(float(bound))}, cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Добавление метрики (имена должны быть уникальны)"""
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        """Создание и регистрация счётчика"""
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = ()) -> Gauge:
+        """Создание и регистрация текущего значения"""
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        """Создание и регистрация гистограммы"""
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Метрики, общие для всего бота
+registry = MetricsRegistry()
+
+HANDLER_LATENCY = registry.histogram(
+    'bot_handler_duration_seconds', 'Время обработки команд и кнопок', ('handler',)
+)
+HANDLER_ERRORS = registry.counter(
+    'bot_handler_errors_total', 'Ошибки в обработчиках команд и кнопок', ('handler',)
+)
+WEATHER_API_LATENCY = registry.histogram(
+    'weather_api_duration_seconds', 'Время запросов к OpenWeatherMap', ('endpoint',)
+)
+WEATHER_API_ERRORS = registry.counter(
+    'weather_api_errors_total', 'Ошибки запросов к OpenWeatherMap', ('endpoint',)
+)
+STORAGE_WRITE_LATENCY = registry.histogram(
+    'storage_write_duration_seconds', 'Время записи журнала действий и базы пользователей', ('store',)
+)
+CACHE_REQUESTS = registry.counter(
+    'cache_requests_total', 'Обращения к кешам: hit, stale или miss', ('cache', 'result')
+)
+EVENT_LOOP_LAG = registry.gauge(
+    'event_loop_lag_seconds', 'Задержка пробуждения фоновой задачи в цикле событий'
+)
+EVENT_LOOP_READY = registry.gauge(
+    'event_loop_ready_callbacks', 'Колбэки, ожидающие выполнения в цикле событий'
+)
+EVENT_LOOP_TASKS = registry.gauge(
+    'event_loop_tasks', 'Незавершённые задачи asyncio'
+)
+ACTION_LOG_DROPPED = registry.counter(
+    'action_log_dropped_rows_total', 'Строки журнала действий, отброшенные из-за переполнения буфера'
+)
+UPDATE_QUEUE_SIZE = registry.gauge(
+    'bot_update_queue_size', 'Обновления в очереди приложения'
+)
+
+def timed(handler_name: str):
+    """Декоратор асинхронного обработчика: время выполнения и ошибки"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            with HANDLER_LATENCY.time(handler=handler_name):
+                try:
+                    return await handler(*args, **kwargs)
+                except Exception:
+                    HANDLER_ERRORS.inc(handler=handler_name)
+                    raise
+        return wrapper
+    return decorator
+
+async def measure_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Фоновая задача: насколько позже запланированного просыпается цикл событий"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set(max(loop.time() - started - interval, 0.0))
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics для Prometheus"""
+
+    def __init__(self, listen: str, port: int, metrics_registry: MetricsRegistry = registry):
+        self.listen = listen
+        self.port = port
+        self.registry = metrics_registry
+        self._runner = None
+        self._lag_task = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Выдача метрик в текстовом формате"""
+        return web.Response(
+            body=self.registry.render().encode('utf-8'),
+            headers={'Content-Type': CONTENT_TYPE}
+        )
+
+    async def start(self):
+        """Запуск HTTP-сервера и замера задержки цикла событий"""
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.listen, self.port).start()
+        except OSError:
+            # Порт занят — сервер не запущен, освобождаем то, что успели создать
+            await runner.cleanup()
+            raise
+        self._runner = runner
+
+        # Замеры цикла событий запускаются только вместе с работающим сервером
+        loop = asyncio.get_running_loop()
+        # _ready — очередь готовых к запуску колбэков в стандартном цикле событий
+        EVENT_LOOP_READY.set_function(lambda: len(getattr(loop, '_ready', ())))
+        EVENT_LOOP_TASKS.set_function(lambda: len(asyncio.all_tasks(loop)))
+        self._lag_task = asyncio.create_task(measure_loop_lag())
+        logger.info(f"Метрики доступны на http://{self.listen}:{self.port}/metrics")
+
+    async def stop(self):
+        """Остановка HTTP-сервера"""
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
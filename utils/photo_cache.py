@@ -0,0 +1,100 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from config import PHOTO_CACHE_FILE
+
+logger = logging.getLogger(__name__)
+
+class PhotoCache:
+    """
+    Кеш file_id фотографий экскурсий.
+
+    После первой отправки фото по URL Telegram возвращает file_id, по которому
+    то же фото отправляется без повторной загрузки. Запись привязана к URL:
+    если в price.xls у экскурсии сменилось фото, старый file_id не используется.
+
+    Записи читаются в память при запуске, а изменения сразу пишутся в SQLite,
+    поэтому при отправке фото база не читается. Записи, сделанные другими
+    процессами бота, подхватываются при следующем запуске.
+    """
+
+    def __init__(self, db_file: str = PHOTO_CACHE_FILE):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        # Копия в памяти: excursion_id -> (url, file_id)
+        self._entries = {}
+        directory = os.path.dirname(db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.ensure_schema()
+        self.load()
+
+    def ensure_schema(self):
+        """Создание таблицы кеша, если она не существует"""
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS photos (
+                    excursion_id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    updated_at INTEGER NOT NULL
+                )
+            """)
+
+    def load(self):
+        """Чтение всех записей из базы в память"""
+        with self._lock:
+            rows = self.conn.execute("SELECT excursion_id, url, file_id FROM photos").fetchall()
+        self._entries = {excursion_id: (url, file_id) for excursion_id, url, file_id in rows}
+
+    def get(self, excursion_id, url: str) -> str:
+        """file_id фото экскурсии (None, если фото ещё не отправлялось или URL изменился)"""
+        entry = self._entries.get(str(excursion_id))
+        if entry is None or entry[0] != url:
+            return None
+        return entry[1]
+
+    def set(self, excursion_id, url: str, file_id: str):
+        """Сохранение file_id для фото экскурсии (заменяет запись со старым URL)"""
+        excursion_id = str(excursion_id)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO photos VALUES (?, ?, ?, ?)",
+                (excursion_id, url, file_id, int(time.time()))
+            )
+        self._entries[excursion_id] = (url, file_id)
+
+    def invalidate(self, excursion_id):
+        """Удаление записи экскурсии (например, если Telegram отклонил file_id)"""
+        excursion_id = str(excursion_id)
+        with self._lock:
+            self.conn.execute("DELETE FROM photos WHERE excursion_id = ?", (excursion_id,))
+        self._entries.pop(excursion_id, None)
+
+    def prune(self, photos: dict) -> int:
+        """
+        Удаление записей, которые не соответствуют каталогу
+
+        :param photos: Актуальные URL фото по идентификаторам экскурсий
+        :return: Количество удалённых записей
+        """
+        with self._lock:
+            rows = self.conn.execute("SELECT excursion_id, url FROM photos").fetchall()
+            stale = [(excursion_id,) for excursion_id, url in rows if photos.get(excursion_id) != url]
+            self.conn.executemany("DELETE FROM photos WHERE excursion_id = ?", stale)
+        for (excursion_id,) in stale:
+            self._entries.pop(excursion_id, None)
+        return len(stale)
+
+    def close(self):
+        """Закрытие соединения с базой"""
+        with self._lock:
+            self.conn.close()
+
+# Кеш file_id, общий для всех обработчиков
+photo_cache = PhotoCache()
@@ -0,0 +1,213 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from utils.tracing import span
+from config import (
+    RATE_LIMIT_GLOBAL, RATE_LIMIT_CHAT, RATE_LIMIT_CHAT_BURST, RATE_LIMIT_GROUP_PER_MINUTE, RATE_LIMIT_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов: меньше — раньше
+PRIORITY_INTERACTIVE = 0  # ответы на действия пользователя
+PRIORITY_BACKGROUND = 10  # фоновые рассылки и прогрев кеша
+
+# Количество чатов, после которого из таблицы удаляются неактивные
+CHAT_PRUNE_THRESHOLD = 10000
+
+class TokenBucket:
+    """Маркерная корзина: rate маркеров в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        """Начисление маркеров за прошедшее время"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Сколько ждать до появления маркера (0, если маркер есть)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        """Списание одного маркера"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        """Корзина заполнена — чат давно ничего не отправлял"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class ChatLimit:
+    """Ограничение одного чата"""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+        # До этого момента Telegram просил не отправлять сообщения в чат
+        self.paused_until = 0.0
+
+class FloodRateLimiter(BaseRateLimiter):
+    """
+    Планировщик исходящих запросов к Bot API.
+
+    Запросы с chat_id проходят через корзину чата (личный чат или группа) и
+    общую корзину бота. Общая корзина выдаёт маркеры по приоритету: ответы
+    пользователям раньше фоновых отправок. При 429 весь бот (и чат запроса)
+    приостанавливается на retry_after, и запрос повторяется; запросы без
+    chat_id маркеры не расходуют, но эту паузу тоже выжидают.
+
+    Приоритет задаётся через rate_limit_args={'priority': PRIORITY_BACKGROUND}.
+    """
+
+    def __init__(self, global_rate: float = RATE_LIMIT_GLOBAL, chat_rate: float = RATE_LIMIT_CHAT,
+                 chat_burst: int = RATE_LIMIT_CHAT_BURST, group_per_minute: int = RATE_LIMIT_GROUP_PER_MINUTE,
+                 max_retries: int = RATE_LIMIT_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, max(global_rate, 1))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self._chats = {}
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._pump_task = None
+        self._paused_until = 0.0
+        # Счётчики для мониторинга
+        self.delayed = 0
+        self.retries = 0
+
+    async def initialize(self):
+        """Подготовка не требуется"""
+
+    async def shutdown(self):
+        """Остановка выдачи маркеров"""
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+        for _, _, waiter in self._waiters:
+            waiter.cancel()
+        self._waiters.clear()
+
+    def _chat_limit(self, chat_id, now: float) -> ChatLimit:
+        """Ограничение для чата (создаётся при первом обращении)"""
+        limit = self._chats.get(chat_id)
+        if limit is None:
+            if len(self._chats) >= CHAT_PRUNE_THRESHOLD:
+                self._prune(now)
+            if self._is_group(chat_id):
+                bucket = TokenBucket(self.group_per_minute / 60, self.group_per_minute)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            limit = ChatLimit(bucket)
+            self._chats[chat_id] = limit
+        return limit
+
+    @staticmethod
+    def _is_group(chat_id) -> bool:
+        """Отрицательный chat_id или @username — группа или канал, у них лимит в минуту"""
+        try:
+            return int(chat_id) < 0
+        except (TypeError, ValueError):
+            return True
+
+    def _prune(self, now: float):
+        """Удаление чатов, которые давно ничего не отправляли"""
+        for chat_id in [
+            chat_id for chat_id, limit in self._chats.items()
+            if not limit.lock.locked() and limit.paused_until < now and limit.bucket.is_full(now)
+        ]:
+            del self._chats[chat_id]
+
+    async def _acquire_chat(self, chat_id):
+        """Ожидание маркера чата"""
+        limit = self._chat_limit(chat_id, time.monotonic())
+        async with limit.lock:
+            while True:
+                now = time.monotonic()
+                wait = max(limit.paused_until - now, limit.bucket.delay(now))
+                if wait <= 0:
+                    limit.bucket.take(now)
+                    return
+                self.delayed += 1
+                await asyncio.sleep(wait)
+
+    async def _wait_pause(self):
+        """Ожидание окончания общей паузы, которую Telegram назначил ответом 429"""
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            self.delayed += 1
+            await asyncio.sleep(wait)
+
+    async def _acquire_global(self, priority: int):
+        """Ожидание маркера общей корзины в порядке приоритета"""
+        now = time.monotonic()
+        if not self._waiters and self._paused_until <= now and self.global_bucket.delay(now) == 0:
+            self.global_bucket.take(now)
+            return
+
+        self.delayed += 1
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await waiter
+
+    async def _pump(self):
+        """Выдача маркеров ожидающим запросам по мере пополнения корзины"""
+        while self._waiters:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self.global_bucket.delay(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, waiter = heapq.heappop(self._waiters)
+            # Запрос мог быть отменён, пока ждал своей очереди
+            if not waiter.done():
+                self.global_bucket.take(now)
+                waiter.set_result(None)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        """Отправка запроса с учётом ограничений и повтором после 429"""
+        chat_id = data.get('chat_id')
+        priority = PRIORITY_INTERACTIVE
+        if isinstance(rate_limit_args, dict):
+            priority = rate_limit_args.get('priority', PRIORITY_INTERACTIVE)
+
+        attempt = 0
+        while True:
+            with span("telegram.wait", method=endpoint):
+                if chat_id is not None:
+                    await self._acquire_chat(chat_id)
+                    await self._acquire_global(priority)
+                else:
+                    # Запросы без чата (answerCallbackQuery, getMe, setWebhook) не расходуют
+                    # маркеры, но после 429 ждут окончания общей паузы вместе со всеми
+                    await self._wait_pause()
+            try:
+                with span("telegram", method=endpoint):
+                    return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"Telegram ограничил {endpoint} (чат {chat_id}): повтор через {e.retry_after} с")
+                until = time.monotonic() + e.retry_after
+                # retry_after относится и к общему лимиту бота: приостанавливаем все запросы
+                self._paused_until = max(self._paused_until, until)
+                if chat_id is not None:
+                    limit = self._chat_limit(chat_id, time.monotonic())
+                    limit.paused_until = max(limit.paused_until, until)
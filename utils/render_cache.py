@@ -0,0 +1,35 @@
+from utils.metrics import CACHE_REQUESTS
+
+class RenderCache:
+    """
+    Кеш готовых текстов и клавиатур.
+
+    Каждая запись помечена версией исходных данных: при смене версии
+    запись собирается заново при первом обращении. Если версия общая для
+    всех записей (shared_version), при её смене кеш очищается целиком,
+    чтобы не хранить записи удалённых из данных ключей.
+    """
+
+    def __init__(self, name: str = 'render', shared_version: bool = False):
+        self.name = name
+        self.shared_version = shared_version
+        self._entries = {}
+        self._version = None
+
+    def get(self, key, version, builder):
+        """Готовое значение для ключа и версии (builder вызывается при промахе)"""
+        if self.shared_version and version != self._version:
+            self._entries.clear()
+            self._version = version
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return entry[1]
+        CACHE_REQUESTS.inc(cache=self.name, result='miss')
+        value = builder()
+        self._entries[key] = (version, value)
+        return value
+
+    def clear(self):
+        """Удаление всех записей"""
+        self._entries.clear()
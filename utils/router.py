@@ -0,0 +1,96 @@
+import time
+import logging
+from utils.metrics import HANDLER_LATENCY, HANDLER_ERRORS
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+class RouteStats:
+    """Статистика маршрута: чтение метрик bot_handler_* с меткой handler=имя маршрута"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @property
+    def calls(self) -> int:
+        """Количество вызовов"""
+        return HANDLER_LATENCY.snapshot(handler=self.name)[2]
+
+    @property
+    def errors(self) -> int:
+        """Количество вызовов, завершившихся ошибкой"""
+        return int(HANDLER_ERRORS.get(handler=self.name))
+
+    @property
+    def average(self) -> float:
+        """Среднее время обработки"""
+        _, total, count = HANDLER_LATENCY.snapshot(handler=self.name)
+        return total / count if count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля времени обработки"""
+        return HANDLER_LATENCY.quantile(q, handler=self.name)
+
+class CallbackRouter:
+    """
+    Маршрутизация callback_data по таблице.
+
+    Точные маршруты ищутся по всей строке, префиксные — по части до первого
+    символа «_», поэтому поиск обработчика занимает постоянное время.
+    """
+
+    def __init__(self):
+        self.exact_routes = {}
+        self.prefix_routes = {}
+        self.stats = {}
+
+    def add_exact(self, data: str, handler, name: str = None):
+        """Регистрация обработчика handler(update, context) для точного значения"""
+        self.exact_routes[data] = (name or data, handler)
+        self.stats.setdefault(name or data, RouteStats(name or data))
+
+    def add_prefix(self, prefix: str, handler, name: str = None):
+        """Регистрация обработчика handler(update, context, payload) для префикса вида «name_»"""
+        if not prefix.endswith('_') or '_' in prefix[:-1]:
+            raise ValueError(f"Префикс маршрута должен иметь вид «name_»: {prefix}")
+        self.prefix_routes[prefix] = (name or prefix, handler)
+        self.stats.setdefault(name or prefix, RouteStats(name or prefix))
+
+    def resolve(self, data: str):
+        """Поиск маршрута: (имя, обработчик, аргументы) или None"""
+        route = self.exact_routes.get(data)
+        if route is not None:
+            return route[0], route[1], ()
+
+        head, separator, payload = data.partition('_')
+        if separator:
+            route = self.prefix_routes.get(head + separator)
+            if route is not None:
+                return route[0], route[1], (payload,)
+        return None
+
+    async def dispatch(self, update, context, data: str) -> bool:
+        """Вызов обработчика для callback_data с замером времени"""
+        route = self.resolve(data)
+        if route is None:
+            return False
+
+        name, handler, args = route
+        started = time.perf_counter()
+        error = False
+        try:
+            with span("route", route=name):
+                await handler(update, context, *args)
+        except Exception:
+            error = True
+            raise
+        finally:
+            # Единственный учёт времени маршрута: /routes читает эти же метрики
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=name)
+            if error:
+                HANDLER_ERRORS.inc(handler=name)
+        return True
+
+    def get_stats(self) -> dict:
+        """Статистика маршрутов, по которым были вызовы"""
+        return {name: stats for name, stats in self.stats.items() if stats.calls}
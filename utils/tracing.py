@@ -0,0 +1,166 @@
+import os
+import io
+import json
+import time
+import pstats
+import random
+import asyncio
+import logging
+import cProfile
+import contextvars
+from datetime import datetime
+from contextlib import contextmanager
+from telegram.ext import Application
+from config import TRACE_SAMPLE_RATE, TRACE_FILE, PROFILE_DIR, PROFILE_MAX_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Трассировка текущего обновления (None, если обновление не попало в выборку)
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+class Trace:
+    """Замеры времени для одного обновления"""
+
+    def __init__(self, update_id, user_id):
+        self.update_id = update_id
+        self.user_id = user_id
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add_span(self, name: str, started: float, duration: float, error: bool, attrs: dict):
+        """Добавление замера участка"""
+        span = {
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+        }
+        if error:
+            span["error"] = True
+        span.update(attrs)
+        self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        """Запись трассировки для JSONL"""
+        return {
+            "update_id": self.update_id,
+            "user_id": self.user_id,
+            "started": datetime.fromtimestamp(self.started_at).isoformat(timespec='milliseconds'),
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "spans": self.spans,
+        }
+
+@contextmanager
+def span(name: str, **attrs):
+    """Замер участка кода, если текущее обновление трассируется"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        trace.add_span(name, started, time.perf_counter() - started, error, attrs)
+
+class Tracer:
+    """Выборочная трассировка обновлений с записью в JSONL"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, file_path: str = TRACE_FILE):
+        self.sample_rate = sample_rate
+        self.file_path = file_path
+
+    def start(self, update):
+        """Начало трассировки, если обновление попало в выборку: (trace, token) или None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        user = getattr(update, 'effective_user', None)
+        trace = Trace(getattr(update, 'update_id', None), user.id if user else None)
+        return trace, _current_trace.set(trace)
+
+    def finish(self, started):
+        """Завершение трассировки и запись её в файл"""
+        trace, token = started
+        _current_trace.reset(token)
+        line = json.dumps(trace.to_dict(), ensure_ascii=False) + '\n'
+        try:
+            directory = os.path.dirname(self.file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Одна запись в режиме O_APPEND: строки разных процессов не перемешиваются
+            fd = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.error(f"Не удалось записать трассировку: {e}")
+
+# Трассировщик, общий для всего бота
+tracer = Tracer()
+
+class TracingApplication(Application):
+    """Application, который трассирует выборку обрабатываемых обновлений"""
+
+    async def process_update(self, update):
+        started = tracer.start(update)
+        if started is None:
+            return await super().process_update(update)
+        try:
+            with span("process_update"):
+                return await super().process_update(update)
+        finally:
+            tracer.finish(started)
+
+class Profiler:
+    """Профилирование цикла событий через cProfile в течение заданного времени"""
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        """Идёт ли сейчас профилирование"""
+        return self._task is not None and not self._task.done()
+
+    def start(self, seconds: float):
+        """Запуск профилирования в фоне (задача с результатом run) или None, если оно уже идёт"""
+        if self.running:
+            return None
+        self._task = asyncio.ensure_future(self.run(min(seconds, PROFILE_MAX_SECONDS)))
+        return self._task
+
+    async def run(self, seconds: float) -> tuple:
+        """
+        Профилирование на seconds секунд
+
+        :return: (путь к .prof файлу, текстовая сводка самых затратных функций)
+        """
+        profiler = cProfile.Profile()
+        logger.info(f"Профилирование запущено на {seconds} с")
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"profile-{os.getpid()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        path = os.path.join(self.directory, f"{name}.prof")
+        profiler.dump_stats(path)
+
+        buffer = io.StringIO()
+        pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(25)
+        summary = buffer.getvalue()
+        with open(os.path.join(self.directory, f"{name}.txt"), 'w', encoding='utf-8') as file:
+            file.write(summary)
+        logger.info(f"Профиль сохранён: {path}")
+        return path, summary
+
+# Профилировщик, общий для всего бота
+profiler = Profiler()
@@ -1,35 +1,104 @@
 import csv
 import os
+import sys
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import pytz
-from config import TIMEZONE
+from config import TIMEZONE, USER_FLUSH_INTERVAL, USER_CACHE_SIZE
+from utils.metrics import STORAGE_WRITE_LATENCY
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Поля записи о пользователе (в порядке колонок CSV)
+USER_FIELDS = [
+    'user_id',
+    'username',
+    'first_name',
+    'last_name',
+    'phone_number',
+    'language_code',
+    'last_activity',
+    'last_command',
+    'registration_date'
+]
+
+# Версия схемы: 1 — данные перенесены из CSV
+SCHEMA_VERSION = 1
 
 class UserDataManager:
-    def __init__(self, csv_file='data/users.csv'):
+    def __init__(self, db_file='data/users.db', csv_file='data/users.csv', flush_interval=USER_FLUSH_INTERVAL,
+                 cache_size=USER_CACHE_SIZE):
+        self.db_file = db_file
         self.csv_file = csv_file
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        # Кеш записей (от давно активных к недавним) и изменённые пользователи:
+        # используются после вызова start()
+        self._cache = OrderedDict()
+        self._dirty = set()
+        # В кеше все пользователи базы: промах означает нового пользователя
+        self._complete = False
+        self._flush_task = None
+        self._wakeup = None
+        self._stopping = False
         self.ensure_data_dir()
-        self.ensure_csv_exists()
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.ensure_schema()
+        self.migrate_from_csv()
+        # Отдельное соединение для чтения одной записи: в режиме WAL оно не ждёт,
+        # пока поток отложенной записи держит _lock и основное соединение
+        self._read_lock = threading.Lock()
+        self._read_conn = sqlite3.connect(self.db_file, check_same_thread=False)
 
     def ensure_data_dir(self):
         """Создание директории для данных, если она не существует"""
-        os.makedirs(os.path.dirname(self.csv_file), exist_ok=True)
-
-    def ensure_csv_exists(self):
-        """Создание CSV файла с заголовками, если он не существует"""
-        if not os.path.exists(self.csv_file):
-            with open(self.csv_file, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    'user_id',
-                    'username',
-                    'first_name',
-                    'last_name',
-                    'phone_number',
-                    'language_code',
-                    'last_activity',
-                    'last_command',
-                    'registration_date'
-                ])
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+
+    def ensure_schema(self):
+        """Создание таблицы пользователей, если она не существует"""
+        with self._lock:
+            # WAL позволяет читать базу, пока идёт запись
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT NOT NULL DEFAULT '',
+                    first_name TEXT NOT NULL DEFAULT '',
+                    last_name TEXT NOT NULL DEFAULT '',
+                    phone_number TEXT NOT NULL DEFAULT '',
+                    language_code TEXT NOT NULL DEFAULT '',
+                    last_activity TEXT NOT NULL DEFAULT '',
+                    last_command TEXT NOT NULL DEFAULT '',
+                    registration_date TEXT NOT NULL DEFAULT ''
+                )
+            """)
+            self.conn.commit()
+
+    def migrate_from_csv(self):
+        """Однократный перенос пользователей из старого CSV файла"""
+        with self._lock:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        users = []
+        if os.path.exists(self.csv_file):
+            with open(self.csv_file, 'r', newline='', encoding='utf-8') as file:
+                users = [user for user in csv.DictReader(file) if user.get('user_id')]
+
+        self.write_users(users)
+        with self._lock:
+            self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            self.conn.commit()
+        if users:
+            print(f"Перенесено {len(users)} пользователей из {self.csv_file} в {self.db_file}")
 
     def get_current_time(self):
         """Получение текущего времени в нужном формате"""
@@ -38,71 +107,240 @@ class UserDataManager:
     def update_user(self, user_data: dict, command: str = None):
         """Обновление или добавление информации о пользователе"""
         current_time = self.get_current_time()
-        users = self.read_users()
-        
+
         user_entry = {
             'user_id': user_data.get('id'),
-            'username': user_data.get('username', ''),
-            'first_name': user_data.get('first_name', ''),
-            'last_name': user_data.get('last_name', ''),
-            'phone_number': user_data.get('phone_number', ''),
-            'language_code': user_data.get('language_code', ''),
+            'username': user_data.get('username') or '',
+            'first_name': user_data.get('first_name') or '',
+            'last_name': user_data.get('last_name') or '',
+            'phone_number': user_data.get('phone_number') or '',
+            'language_code': user_data.get('language_code') or '',
             'last_activity': current_time,
             'last_command': command or '',
             'registration_date': current_time
         }
 
-        # Проверяем, существует ли пользователь
-        user_exists = False
-        for i, user in enumerate(users):
-            if str(user['user_id']) == str(user_entry['user_id']):
-                user_exists = True
-                # Сохраняем дату регистрации и телефон, если они уже были
-                user_entry['registration_date'] = user['registration_date']
-                if not user_entry['phone_number'] and user['phone_number']:
-                    user_entry['phone_number'] = user['phone_number']
-                users[i] = user_entry
-                break
+        # Пока включена отложенная запись, изменения копятся в памяти
+        if self._flush_task is not None:
+            # При промахе кеша запись читается из базы по первичному ключу, не дожидаясь записи пакета
+            with span("storage.update_user_cached"):
+                self._update_cached(user_entry)
+            return
 
-        if not user_exists:
-            users.append(user_entry)
+        # Дата регистрации и телефон сохраняются, если они уже были
+        with self._lock, span("storage.update_user"):
+            self.conn.execute("""
+                INSERT INTO users VALUES (
+                    :user_id, :username, :first_name, :last_name, :phone_number,
+                    :language_code, :last_activity, :last_command, :registration_date
+                )
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    phone_number = CASE WHEN excluded.phone_number != ''
+                        THEN excluded.phone_number ELSE users.phone_number END,
+                    language_code = excluded.language_code,
+                    last_activity = excluded.last_activity,
+                    last_command = excluded.last_command
+            """, user_entry)
+            self.conn.commit()
 
-        self.write_users(users)
+    def _get_cached(self, user_id: int) -> dict:
+        """Запись пользователя из кеша (при промахе читается из базы)"""
+        user_id = int(user_id)
+        user = self._cache.get(user_id)
+        if user is not None:
+            self._cache.move_to_end(user_id)
+            return user
+        if self._complete:
+            return None
+        user = self._read_user(user_id)
+        if user is not None:
+            self._cache[user_id] = user
+        return user
+
+    def _update_cached(self, user_entry: dict):
+        """Обновление записи в кеше с теми же правилами, что и в базе"""
+        user_id = int(user_entry['user_id'])
+        user = self._get_cached(user_id)
+        if user is None:
+            user = dict(user_entry, user_id=user_id)
+            self._cache[user_id] = user
+        else:
+            phone_number = user_entry['phone_number'] or user['phone_number']
+            user.update({
+                field: user_entry[field] for field in USER_FIELDS
+                if field not in ('user_id', 'registration_date', 'phone_number')
+            })
+            user['phone_number'] = phone_number
+        self._dirty.add(user_id)
+
+    def _read_user(self, user_id: int) -> dict:
+        """Чтение пользователя из базы (не блокируется записью пакета)"""
+        with self._read_lock:
+            row = self._read_conn.execute(
+                f"SELECT {', '.join(USER_FIELDS)} FROM users WHERE user_id = ?", (int(user_id),)
+            ).fetchone()
+        return dict(zip(USER_FIELDS, row)) if row else None
+
+    def get_user(self, user_id: int) -> dict:
+        """Получение пользователя по идентификатору"""
+        user = self._cache.get(int(user_id))
+        if user is not None:
+            return dict(user)
+        return self._read_user(user_id)
 
     def read_users(self) -> list:
-        """Чтение всех пользователей из CSV"""
-        if not os.path.exists(self.csv_file):
-            return []
-        
-        with open(self.csv_file, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            return list(reader)
+        """Чтение всех пользователей"""
+        with self._lock:
+            rows = self.conn.execute(f"SELECT {', '.join(USER_FIELDS)} FROM users ORDER BY user_id").fetchall()
+        users = {row[0]: dict(zip(USER_FIELDS, row)) for row in rows}
+        # Учитываем изменения, которые ещё не записаны в базу
+        for user_id in self._dirty:
+            users[user_id] = dict(self._cache[user_id])
+        return [users[user_id] for user_id in sorted(users)]
 
     def write_users(self, users: list):
-        """Запись пользователей в CSV"""
-        with open(self.csv_file, 'w', newline='', encoding='utf-8') as file:
-            if not users:
-                return
-            
-            writer = csv.DictWriter(file, fieldnames=users[0].keys())
-            writer.writeheader()
-            writer.writerows(users)
+        """Запись (добавление или замена) списка пользователей"""
+        if not users:
+            return
+        rows = [[user.get(field) or '' for field in USER_FIELDS] for user in users]
+        for row in rows:
+            row[0] = int(row[0])
+        with self._lock, STORAGE_WRITE_LATENCY.time(store='users_db'), span("storage.users_db"):
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO users VALUES ({', '.join('?' * len(USER_FIELDS))})", rows
+            )
+            self.conn.commit()
 
     def log_user_action(self, user_id: int, action: str):
         """Логирование действий пользователя"""
-        users = self.read_users()
-        for user in users:
-            if str(user['user_id']) == str(user_id):
+        if self._flush_task is not None:
+            with span("storage.user_action_cached"):
+                user = self._get_cached(user_id)
+            if user is not None:
                 user['last_activity'] = self.get_current_time()
                 user['last_command'] = action
-                break
-        self.write_users(users)
+                self._dirty.add(int(user_id))
+            return
+
+        with self._lock:
+            self.conn.execute(
+                "UPDATE users SET last_activity = ?, last_command = ? WHERE user_id = ?",
+                (self.get_current_time(), action, int(user_id))
+            )
+            self.conn.commit()
 
     def update_phone_number(self, user_id: int, phone_number: str):
         """Обновление номера телефона пользователя"""
-        users = self.read_users()
-        for user in users:
-            if str(user['user_id']) == str(user_id):
-                user['phone_number'] = phone_number
+        # Телефон записывается сразу, даже при отложенной записи
+        user = self._cache.get(int(user_id))
+        if user is not None:
+            user['phone_number'] = phone_number
+        with self._lock:
+            self.conn.execute(
+                "UPDATE users SET phone_number = ? WHERE user_id = ?", (phone_number, int(user_id))
+            )
+            self.conn.commit()
+
+    def _read_recent_users(self) -> list:
+        """Недавно активные пользователи (не больше cache_size + 1), от новых к старым"""
+        with self._lock:
+            return self.conn.execute(
+                f"SELECT {', '.join(USER_FIELDS)} FROM users ORDER BY last_activity DESC LIMIT ?",
+                (self.cache_size + 1,)
+            ).fetchall()
+
+    async def start(self):
+        """Запуск отложенной записи изменений пользователей"""
+        if self._flush_task is not None:
+            return
+        # Кеш заполняется заранее, чтобы обработчики не читали базу в цикле событий
+        rows = await asyncio.to_thread(self._read_recent_users)
+        for row in reversed(rows[:self.cache_size]):
+            self._cache.setdefault(row[0], dict(zip(USER_FIELDS, row)))
+        self._complete = len(rows) <= self.cache_size
+        logger.info(f"Загружено в кеш пользователей: {len(self._cache)}")
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Отложенная запись пользователей включена (раз в {self.flush_interval} с)")
+
+    async def stop(self):
+        """Остановка отложенной записи с сохранением всех изменений"""
+        if self._flush_task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._flush_task
+        self._flush_task = None
+        # Без отложенной записи изменения идут мимо кеша, поэтому он больше не актуален
+        self._cache.clear()
+        self._complete = False
+
+    async def flush(self):
+        """Запись изменённых пользователей в базу одним пакетом"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        users = [dict(self._cache[user_id]) for user_id in dirty]
+        try:
+            await asyncio.to_thread(self.write_users, users)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при записи пользователей: {e}")
+            # Повторим запись в следующий раз
+            self._dirty |= dirty
+            return
+        self._evict()
+
+    def _evict(self):
+        """Удаление из кеша давно активных пользователей сверх cache_size (кроме несохранённых)"""
+        excess = len(self._cache) - self.cache_size
+        if excess <= 0:
+            return
+        for user_id in list(self._cache):
+            if excess <= 0:
                 break
-        self.write_users(users) 
\ No newline at end of file
+            if user_id not in self._dirty:
+                del self._cache[user_id]
+                excess -= 1
+        self._complete = False
+
+    async def _flush_loop(self):
+        """Периодическая запись изменённых пользователей"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    def export_csv(self, csv_file: str = None) -> int:
+        """Выгрузка всех пользователей в CSV для работы в таблицах"""
+        csv_file = csv_file or self.csv_file
+        users = self.read_users()
+        with open(csv_file, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=USER_FIELDS)
+            writer.writeheader()
+            writer.writerows(users)
+        return len(users)
+
+    def close(self):
+        """Закрытие соединения с базой"""
+        with self._read_lock:
+            self._read_conn.close()
+        with self._lock:
+            self.conn.close()
+
+if __name__ == '__main__':
+    # Выгрузка пользователей: python -m utils.user_data export [путь к CSV]
+    if len(sys.argv) < 2 or sys.argv[1] != 'export':
+        print("Использование: python -m utils.user_data export [путь к CSV]")
+        sys.exit(1)
+    manager = UserDataManager()
+    target = sys.argv[2] if len(sys.argv) > 2 else manager.csv_file
+    count = manager.export_csv(target)
+    print(f"Выгружено {count} пользователей в {target}")
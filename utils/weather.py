@@ -1,7 +1,24 @@
-import aiohttp
+import os
+import json
+import time
+import asyncio
+import random
+import logging
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import pytz
-from config import WEATHER_API_KEY, TIMEZONE
+from config import (
+    WEATHER_API_KEY, WEATHER_API_URL, TIMEZONE, WEATHER_UPDATE_INTERVAL, FORECAST_DAYS,
+    SUPPORTED_CITIES, WEATHER_PREFETCH_CONCURRENCY, WEATHER_PREFETCH_JITTER, WEATHER_SNAPSHOT_FILE,
+    WEATHER_GROUP_MAX_IDS
+)
+from utils.cache import AsyncTTLCache
+from utils.geocoding import city_registry, location_query
+from utils.http_client import get_session
+from utils.metrics import WEATHER_API_LATENCY, WEATHER_API_ERRORS
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
 
 # Добавляем словарь с эмодзи для разных погодных условий
 WEATHER_EMOJIS = {
@@ -27,59 +44,251 @@ def get_weather_emoji(description: str) -> str:
             return emoji
     return WEATHER_EMOJIS['default']
 
+# Кеш ответов погодного API по ключу (город, тип запроса)
+weather_cache = AsyncTTLCache(ttl=WEATHER_UPDATE_INTERVAL, name='weather')
+
+def is_successful(data) -> bool:
+    """Проверка, что ответ не содержит ошибки и его можно кешировать"""
+    if isinstance(data, list):
+        return bool(data) and "error" not in data[0]
+    return "error" not in data
+
+def get_data_version(city: str, endpoint: str):
+    """Версия закешированных данных для города (меняется при каждом обновлении)"""
+    return weather_cache.get_version((city, endpoint))
+
 async def get_weather(city: str) -> dict:
-    """Получение текущей погоды для города"""
-    async with aiohttp.ClientSession() as session:
-        try:
-            # Специальная обработка для Красной Поляны
-            if city == "Красная Поляна":
-                weather_url = f"https://api.openweathermap.org/data/2.5/weather?id=542681&appid={WEATHER_API_KEY}&units=metric&lang=ru"
-            else:
-                # Получаем координаты города
-                geocoding_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city},RU&limit=1&appid={WEATHER_API_KEY}"
-                async with session.get(geocoding_url) as response:
-                    location_data = await response.json()
-                    if not location_data:
-                        return {"error": "Город не найден"}
-                    
-                    lat = location_data[0]["lat"]
-                    lon = location_data[0]["lon"]
-                
-                weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric&lang=ru"
+    """Получение текущей погоды для города (с кешированием)"""
+    # Устаревшие данные отдаём сразу, свежие подтянутся в фоне
+    weather = await weather_cache.get_or_fetch(
+        (city, "weather"), lambda: fetch_weather(city), is_valid=is_successful, allow_stale=True
+    )
+    # Возвращаем копию, чтобы вызывающий код не изменял общую запись кеша
+    return dict(weather)
+
+async def get_forecast(city: str, days: int = 7) -> list:
+    """Получение прогноза погоды на неделю (с кешированием)"""
+    forecast = await weather_cache.get_or_fetch(
+        (city, "forecast"), lambda: fetch_forecast(city), is_valid=is_successful, allow_stale=True
+    )
+    return forecast[:days]
+
+async def refresh_forecast(city: str, semaphore: asyncio.Semaphore, jitter: float = 0):
+    """Обновление прогноза для одного города"""
+    # Случайная задержка размазывает запросы к API во времени
+    if jitter:
+        await asyncio.sleep(random.uniform(0, jitter))
+    async with semaphore:
+        forecast = await weather_cache.refresh((city, "forecast"), lambda: fetch_forecast(city), is_valid=is_successful)
+    if not is_successful(forecast):
+        logger.warning(f"Не удалось обновить прогноз для города {city}")
+
+async def refresh_all_weather(cities: list = None, concurrency: int = WEATHER_PREFETCH_CONCURRENCY, jitter: float = WEATHER_PREFETCH_JITTER):
+    """Обновление погоды для всех городов с ограничением параллельности"""
+    cities = cities or SUPPORTED_CITIES
+    # Текущая погода — одним групповым запросом, прогнозы — по городам
+    weather = await get_weather_batch(cities, concurrency)
+    for city, data in weather.items():
+        if is_successful(data):
+            weather_cache.set((city, "weather"), data)
+        else:
+            logger.warning(f"Не удалось обновить погоду для города {city}")
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*[refresh_forecast(city, semaphore, jitter) for city in cities])
+    logger.info(f"Погода обновлена для {len(cities)} городов")
+
+async def prefetch_weather_job(context):
+    """Задача JobQueue: фоновое обновление погоды для всех городов"""
+    await refresh_all_weather()
+
+def save_weather_snapshot(file_path: str = WEATHER_SNAPSHOT_FILE):
+    """Сохранение закешированной погоды в файл, общий для всех процессов бота"""
+    entries = [[city, endpoint, value] for (city, endpoint), value in weather_cache.items()]
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{file_path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(entries, file, ensure_ascii=False)
+    os.replace(tmp_path, file_path)
+
+# Время изменения последнего загруженного снимка погоды
+_snapshot_mtime = None
+
+def load_weather_snapshot(file_path: str = WEATHER_SNAPSHOT_FILE) -> bool:
+    """Загрузка погоды из снимка, если он изменился с прошлой загрузки"""
+    global _snapshot_mtime
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    if mtime == _snapshot_mtime:
+        return False
+
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            entries = json.load(file)
+    except (OSError, ValueError) as e:
+        logger.error(f"Не удалось прочитать снимок погоды: {e}")
+        return False
+
+    for city, endpoint, value in entries:
+        weather_cache.set((city, endpoint), value)
+    _snapshot_mtime = mtime
+    return True
+
+async def sync_weather_snapshot_job(context):
+    """Задача JobQueue: подхват погоды, обновлённой приёмным процессом"""
+    if load_weather_snapshot():
+        logger.info("Погода загружена из общего снимка")
+
+@asynccontextmanager
+async def weather_request(session, url: str, endpoint: str):
+    """GET-запрос к погодному API с учётом времени и ошибок"""
+    started = time.perf_counter()
+    try:
+        with span(f"http.{endpoint}"):
+            async with session.get(url) as response:
+                yield response
+                if response.status != 200:
+                    WEATHER_API_ERRORS.inc(endpoint=endpoint)
+    except Exception:
+        WEATHER_API_ERRORS.inc(endpoint=endpoint)
+        raise
+    finally:
+        WEATHER_API_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+
+def parse_weather(weather_data: dict) -> dict:
+    """Текущая погода из ответа OpenWeatherMap в формате бота"""
+    # Конвертируем время восхода и заката
+    tz = pytz.timezone(TIMEZONE)
+    sunrise = datetime.fromtimestamp(weather_data["sys"]["sunrise"]).astimezone(tz).strftime("%H:%M")
+    sunset = datetime.fromtimestamp(weather_data["sys"]["sunset"]).astimezone(tz).strftime("%H:%M")
+    
+    weather_info = {
+        "temp": round(weather_data["main"]["temp"]),
+        "feels_like": round(weather_data["main"]["feels_like"]),
+        "humidity": weather_data["main"]["humidity"],
+        "pressure": round(weather_data["main"]["pressure"] * 0.750062),  # Конвертация из гПа в мм рт.ст.
+        "wind_speed": round(weather_data["wind"]["speed"]),
+        "wind_direction": get_wind_direction(weather_data["wind"]["deg"]),
+        "clouds": weather_data["clouds"]["all"],
+        "description": weather_data["weather"][0]["description"],
+        "sunrise": sunrise,
+        "sunset": sunset
+    }
+    
+    # Добавляем visibility только если оно есть в ответе
+    if "visibility" in weather_data:
+        weather_info["visibility_m"] = weather_data["visibility"]
+        weather_info["visibility"] = round(weather_data["visibility"] / 1000, 1)
+        weather_info["visibility_info"] = f"\n👁 Видимость: {weather_info['visibility']} км"
+    else:
+        weather_info["visibility_m"] = None
+        weather_info["visibility"] = None
+        weather_info["visibility_info"] = "\n👁 Видимость: нет данных"
+    
+    return weather_info
+
+async def fetch_weather(city: str) -> dict:
+    """Запрос текущей погоды для города у OpenWeatherMap"""
+    session = get_session()
+    try:
+        # Координаты берём из реестра, геокодер вызывается только для новых городов
+        location = await city_registry.resolve(city, session)
+        if location is None:
+            return {"error": "Город не найден"}
+        
+        weather_url = f"{WEATHER_API_URL}/data/2.5/weather?{location_query(location)}&appid={WEATHER_API_KEY}&units=metric&lang=ru"
+        
+        async with weather_request(session, weather_url, "weather") as response:
+            weather_data = await response.json()
+            weather_info = parse_weather(weather_data)
+        # Идентификатор города нужен для группового запроса погоды
+        city_registry.remember_group_id(city, weather_data.get("id"))
+        return weather_info
             
-            async with session.get(weather_url) as response:
-                weather_data = await response.json()
-                
-                # Конвертируем время восхода и заката
-                tz = pytz.timezone(TIMEZONE)
-                sunrise = datetime.fromtimestamp(weather_data["sys"]["sunrise"]).astimezone(tz).strftime("%H:%M")
-                sunset = datetime.fromtimestamp(weather_data["sys"]["sunset"]).astimezone(tz).strftime("%H:%M")
-                
-                weather_info = {
-                    "temp": round(weather_data["main"]["temp"]),
-                    "feels_like": round(weather_data["main"]["feels_like"]),
-                    "humidity": weather_data["main"]["humidity"],
-                    "pressure": round(weather_data["main"]["pressure"] * 0.750062),  # Конвертация из гПа в мм рт.ст.
-                    "wind_speed": round(weather_data["wind"]["speed"]),
-                    "wind_direction": get_wind_direction(weather_data["wind"]["deg"]),
-                    "clouds": weather_data["clouds"]["all"],
-                    "description": weather_data["weather"][0]["description"],
-                    "sunrise": sunrise,
-                    "sunset": sunset
-                }
-                
-                # Добавляем visibility только если оно есть в ответе
-                if "visibility" in weather_data:
-                    weather_info["visibility"] = round(weather_data["visibility"] / 1000, 1)
-                    weather_info["visibility_info"] = f"\n👁 Видимость: {weather_info['visibility']} км"
-                else:
-                    weather_info["visibility"] = None
-                    weather_info["visibility_info"] = "\n👁 Видимость: нет данных"
-                
-                return weather_info
-                
-        except Exception as e:
-            return {"error": f"Ошибка при получении погоды: {str(e)}"}
+    except Exception as e:
+        return {"error": f"Ошибка при получении погоды: {str(e)}"}
+
+# Групповой запрос недоступен для ключа API: больше не пытаемся до перезапуска
+_group_unavailable = False
+
+async def fetch_weather_group(cities: list) -> dict:
+    """
+    Текущая погода для нескольких городов запросами /data/2.5/group
+
+    Используются идентификаторы городов из реестра; города без идентификатора
+    и города, которых нет в ответе, в результат не попадают. Если запрос одной
+    из частей не удался, возвращаются данные уже полученных частей.
+
+    :return: {город: погода}
+    """
+    global _group_unavailable
+    if _group_unavailable:
+        return {}
+    # Несколько посёлков могут получить идентификатор одного и того же города
+    by_id = {}
+    for city, city_id in city_registry.group_ids(cities).items():
+        by_id.setdefault(city_id, []).append(city)
+    if not by_id:
+        return {}
+
+    session = get_session()
+    ids = list(by_id)
+    results = {}
+    try:
+        for start in range(0, len(ids), WEATHER_GROUP_MAX_IDS):
+            chunk = ids[start:start + WEATHER_GROUP_MAX_IDS]
+            group_url = (f"{WEATHER_API_URL}/data/2.5/group?id={','.join(map(str, chunk))}"
+                         f"&appid={WEATHER_API_KEY}&units=metric&lang=ru")
+            async with weather_request(session, group_url, "group") as response:
+                if response.status in (401, 403, 404):
+                    _group_unavailable = True
+                    logger.warning(f"Групповой запрос погоды недоступен (HTTP {response.status}), города запрашиваются по одному")
+                    return results
+                if response.status != 200:
+                    logger.warning(f"Групповой запрос погоды не удался: HTTP {response.status}")
+                    return results
+                group_data = await response.json()
+            for item in group_data.get("list", []):
+                item_cities = by_id.get(item.get("id"), [])
+                if not item_cities:
+                    continue
+                try:
+                    weather_info = parse_weather(item)
+                except (KeyError, IndexError, TypeError) as e:
+                    logger.warning(f"Неполные данные о погоде для {', '.join(item_cities)} в групповом ответе: {e}")
+                    continue
+                for city in item_cities:
+                    # У каждого города своя копия: записи кеша не должны быть общими
+                    results[city] = dict(weather_info)
+    except Exception as e:
+        logger.warning(f"Ошибка группового запроса погоды: {e}")
+    return results
+
+async def get_weather_batch(cities: list = None, concurrency: int = WEATHER_PREFETCH_CONCURRENCY) -> dict:
+    """
+    Текущая погода для всех городов за один цикл обновления
+
+    Сначала один групповой запрос по сохранённым идентификаторам городов,
+    затем отдельные запросы (не больше concurrency одновременно) для городов,
+    которых не оказалось в групповом ответе.
+
+    :return: {город: погода или {"error": ...}} в порядке cities
+    """
+    cities = cities or SUPPORTED_CITIES
+    results = await fetch_weather_group(cities)
+    missing = [city for city in cities if city not in results]
+    if missing:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_one(city: str):
+            async with semaphore:
+                results[city] = await fetch_weather(city)
+
+        await asyncio.gather(*[fetch_one(city) for city in missing])
+    return {city: results[city] for city in cities}
 
 def get_wind_direction(degrees: float) -> str:
     """Конвертация градусов в текстовое направление ветра"""
@@ -90,80 +299,71 @@ def get_wind_direction(degrees: float) -> str:
     index = round(degrees / 45) % 8
     return directions[index]
 
-async def get_forecast(city: str, days: int = 7) -> list:
-    """Получение прогноза погоды на неделю"""
-    async with aiohttp.ClientSession() as session:
-        try:
-            # Специальная обработка для Красной Поляны
-            if city == "Красная Поляна":
-                forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?id=542681&appid={WEATHER_API_KEY}&units=metric&lang=ru"
-            else:
-                # Получаем координаты города
-                geocoding_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city},RU&limit=1&appid={WEATHER_API_KEY}"
-                async with session.get(geocoding_url) as response:
-                    location_data = await response.json()
-                    if not location_data:
-                        return [{"error": "Город не найден"}]
-                    
-                    lat = location_data[0]["lat"]
-                    lon = location_data[0]["lon"]
-                
-                forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric&lang=ru"
+async def fetch_forecast(city: str, days: int = FORECAST_DAYS) -> list:
+    """Запрос прогноза погоды на неделю у OpenWeatherMap"""
+    session = get_session()
+    try:
+        # Координаты берём из реестра, геокодер вызывается только для новых городов
+        location = await city_registry.resolve(city, session)
+        if location is None:
+            return [{"error": "Город не найден"}]
+        
+        forecast_url = f"{WEATHER_API_URL}/data/2.5/forecast?{location_query(location)}&appid={WEATHER_API_KEY}&units=metric&lang=ru"
+        
+        async with weather_request(session, forecast_url, "forecast") as response:
+            forecast_data = await response.json()
             
-            async with session.get(forecast_url) as response:
-                forecast_data = await response.json()
-                
-                if "error" in forecast_data:
-                    return [{"error": forecast_data["error"]}]
-                
-                # Группируем прогноз по дням
-                daily_forecast = {}
-                tz = pytz.timezone(TIMEZONE)
+            if "error" in forecast_data:
+                return [{"error": forecast_data["error"]}]
+            
+            # Группируем прогноз по дням
+            daily_forecast = {}
+            tz = pytz.timezone(TIMEZONE)
+            
+            for item in forecast_data["list"]:
+                date = datetime.fromtimestamp(item["dt"]).astimezone(tz)
+                date_key = date.strftime("%Y-%m-%d")
                 
-                for item in forecast_data["list"]:
-                    date = datetime.fromtimestamp(item["dt"]).astimezone(tz)
-                    date_key = date.strftime("%Y-%m-%d")
-                    
-                    if date_key not in daily_forecast:
-                        daily_forecast[date_key] = {
-                            "date": date.strftime("%d.%m.%Y"),
-                            "weekday": date.strftime("%A"),
-                            "temp_min": float('inf'),
-                            "temp_max": float('-inf'),
-                            "descriptions": set(),
-                            "emojis": set()
-                        }
-                    
-                    temp = round(item["main"]["temp"])
-                    daily_forecast[date_key]["temp_min"] = min(daily_forecast[date_key]["temp_min"], temp)
-                    daily_forecast[date_key]["temp_max"] = max(daily_forecast[date_key]["temp_max"], temp)
-                    daily_forecast[date_key]["descriptions"].add(item["weather"][0]["description"])
-                    daily_forecast[date_key]["emojis"].add(get_weather_emoji(item["weather"][0]["description"]))
+                if date_key not in daily_forecast:
+                    daily_forecast[date_key] = {
+                        "date": date.strftime("%d.%m.%Y"),
+                        "weekday": date.strftime("%A"),
+                        "temp_min": float('inf'),
+                        "temp_max": float('-inf'),
+                        "descriptions": set(),
+                        "emojis": set()
+                    }
                 
-                # Преобразуем в список и сортируем по дате
-                forecast = []
-                for date_key in sorted(daily_forecast.keys())[:days]:
-                    day_data = daily_forecast[date_key]
-                    # Конвертируем weekday в русский язык
-                    weekday_ru = {
-                        'Monday': 'Понедельник',
-                        'Tuesday': 'Вторник',
-                        'Wednesday': 'Среда',
-                        'Thursday': 'Четверг',
-                        'Friday': 'Пятница',
-                        'Saturday': 'Суббота',
-                        'Sunday': 'Воскресенье'
-                    }[day_data["weekday"]]
-                    
-                    forecast.append({
-                        "date": day_data["date"],
-                        "weekday": weekday_ru,
-                        "temp_min": round(day_data["temp_min"]),
-                        "temp_max": round(day_data["temp_max"]),
-                        "descriptions": list(day_data["descriptions"]),
-                        "weather_emojis": " ".join(day_data["emojis"])
-                    })
+                temp = round(item["main"]["temp"])
+                daily_forecast[date_key]["temp_min"] = min(daily_forecast[date_key]["temp_min"], temp)
+                daily_forecast[date_key]["temp_max"] = max(daily_forecast[date_key]["temp_max"], temp)
+                daily_forecast[date_key]["descriptions"].add(item["weather"][0]["description"])
+                daily_forecast[date_key]["emojis"].add(get_weather_emoji(item["weather"][0]["description"]))
+            
+            # Преобразуем в список и сортируем по дате
+            forecast = []
+            for date_key in sorted(daily_forecast.keys())[:days]:
+                day_data = daily_forecast[date_key]
+                # Конвертируем weekday в русский язык
+                weekday_ru = {
+                    'Monday': 'Понедельник',
+                    'Tuesday': 'Вторник',
+                    'Wednesday': 'Среда',
+                    'Thursday': 'Четверг',
+                    'Friday': 'Пятница',
+                    'Saturday': 'Суббота',
+                    'Sunday': 'Воскресенье'
+                }[day_data["weekday"]]
                 
-                return forecast
-        except Exception as e:
-            return [{"error": f"Ошибка при получении прогноза: {str(e)}"}] 
\ No newline at end of file
+                forecast.append({
+                    "date": day_data["date"],
+                    "weekday": weekday_ru,
+                    "temp_min": round(day_data["temp_min"]),
+                    "temp_max": round(day_data["temp_max"]),
+                    "descriptions": list(day_data["descriptions"]),
+                    "weather_emojis": " ".join(day_data["emojis"])
+                })
+            
+            return forecast
+    except Exception as e:
+        return [{"error": f"Ошибка при получении прогноза: {str(e)}"}] 
\ No newline at end of file
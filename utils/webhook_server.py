@@ -0,0 +1,82 @@
+import hmac
+import json
+import logging
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передаёт secret_token из setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+def application_sink(application):
+    """sink, который ставит обновления в очередь приложения"""
+    async def sink(data: dict):
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            raise ValueError("пустое обновление")
+        await application.update_queue.put(update)
+    return sink
+
+class WebhookServer:
+    """
+    Встроенный HTTP-сервер для приёма обновлений.
+
+    Принимает одно обновление или JSON-массив обновлений, поэтому через него
+    можно прогонять записанные обновления локально, без Telegram.
+    """
+
+    def __init__(self, sink, listen: str, port: int, path: str, secret: str):
+        # sink — корутина, получающая обновление в виде словаря из JSON
+        self.sink = sink
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Приём обновлений и передача их в sink"""
+        # Сравниваем байты: compare_digest не принимает строки с не-ASCII символами
+        token = request.headers.get(SECRET_HEADER, '').encode('utf-8', 'surrogateescape')
+        if not hmac.compare_digest(token, self.secret.encode('utf-8')):
+            logger.warning(f"Отклонён запрос с неверным секретом от {request.remote}")
+            return web.json_response({"error": "invalid secret token"}, status=403)
+
+        try:
+            payload = await request.json(loads=json.loads)
+        except ValueError:
+            return web.json_response({"error": "invalid JSON"}, status=400)
+
+        items = payload if isinstance(payload, list) else [payload]
+        accepted = 0
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                await self.sink(item)
+            except Exception as e:
+                logger.error(f"Не удалось принять обновление: {e}")
+                continue
+            accepted += 1
+
+        return web.json_response({"accepted": accepted})
+
+    async def start(self):
+        """Запуск HTTP-сервера"""
+        if not self.secret:
+            # Без секрета любой, кто знает адрес, может присылать боту обновления
+            raise ValueError("WEBHOOK_SECRET не задан: режим вебхука без секрета не запускается")
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"Вебхук слушает http://{self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Остановка HTTP-сервера"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
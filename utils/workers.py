@@ -0,0 +1,274 @@
+import queue
+import signal
+import asyncio
+import logging
+import multiprocessing
+from telegram import Bot, Update
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import Application
+from config import (
+    BOT_TOKEN, BOT_RUN_MODE, SUPPORTED_CITIES, WEATHER_UPDATE_INTERVAL,
+    WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    WORKER_QUEUE_SIZE, WORKER_CONCURRENCY, WORKER_DRAIN_TIMEOUT, METRICS_LISTEN, METRICS_PORT
+)
+from utils.action_logger import action_logger
+from utils.excursion_catalog import catalog
+from utils.geocoding import city_registry
+from utils.http_client import init_http_client, close_http_client, get_session
+from utils.weather import refresh_all_weather, save_weather_snapshot, load_weather_snapshot
+from utils.webhook_server import WebhookServer
+from utils.metrics import MetricsServer
+
+logger = logging.getLogger(__name__)
+
+# Таймаут long polling в приёмном процессе, секунды
+POLL_TIMEOUT = 30
+
+def shard_key(data: dict) -> int:
+    """Ключ распределения обновления: id пользователя, иначе id чата или update_id"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get('from')
+        if isinstance(sender, dict) and 'id' in sender:
+            return sender['id']
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return data.get('update_id', 0)
+
+class UpdateSequencer:
+    """
+    Обработка обновлений в рабочем процессе.
+
+    Обновления разных пользователей обрабатываются параллельно, а обновления
+    одного пользователя — строго по очереди, в порядке поступления.
+    """
+
+    def __init__(self, application: Application, concurrency: int = WORKER_CONCURRENCY):
+        self.application = application
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._tails = {}
+
+    async def submit(self, key, update: Update):
+        """Постановка обновления в очередь пользователя (ждёт, если занято concurrency задач)"""
+        await self.semaphore.acquire()
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._process(previous, update))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._release(key, done))
+
+    def _release(self, key, task):
+        """Освобождение места после обработки обновления"""
+        self.semaphore.release()
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _process(self, previous, update: Update):
+        """Обработка обновления после завершения предыдущего обновления того же пользователя"""
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.application.process_update(update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}", exc_info=True)
+
+    async def drain(self):
+        """Ожидание обработки всех принятых обновлений"""
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+def next_update(updates: multiprocessing.Queue):
+    """Следующее обновление из очереди (None — остановка или завершение приёмного процесса)"""
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            return updates.get(timeout=1)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                logger.warning("Приёмный процесс завершился, рабочий процесс останавливается")
+                return None
+
+async def run_worker(index: int, updates: multiprocessing.Queue):
+    """Рабочий процесс: приложение без собственного приёма обновлений"""
+    # Импорт здесь: main сам импортирует этот модуль
+    from main import build_application
+
+    if index != 0:
+        # Снимок каталога и файл статистики ведёт процесс 0, остальные их только читают
+        catalog.owns_snapshot = False
+        action_logger.persist_stats = False
+    catalog.load()
+    load_weather_snapshot()
+    application = build_application(Application.builder().token(BOT_TOKEN).updater(None), shared_weather=True)
+    # По номеру процесса выбирается порт метрик
+    application.bot_data['worker_index'] = index
+    sequencer = UpdateSequencer(application)
+    loop = asyncio.get_running_loop()
+
+    await application.initialize()
+    try:
+        await application.post_init(application)
+        await application.start()
+        logger.info(f"Рабочий процесс {index} запущен")
+        while True:
+            data = await loop.run_in_executor(None, next_update, updates)
+            if data is None:
+                break
+            update = Update.de_json(data, application.bot)
+            if update is not None:
+                await sequencer.submit(shard_key(data), update)
+        # Плавная остановка: дорабатываем всё, что уже принято
+        await sequencer.drain()
+    finally:
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+        logger.info(f"Рабочий процесс {index} остановлен")
+
+def worker_main(index: int, updates: multiprocessing.Queue):
+    """Точка входа рабочего процесса"""
+    # Остановкой управляет приёмный процесс: он пришлёт признак конца очереди
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(run_worker(index, updates))
+
+class ShardDispatcher:
+    """Распределение обновлений по рабочим процессам по user_id"""
+
+    def __init__(self, queues: list):
+        self.queues = queues
+        # Обновления кладутся в очереди по одному, чтобы сохранить порядок
+        self._lock = asyncio.Lock()
+
+    async def put(self, data: dict):
+        """Передача обновления процессу, который обслуживает его пользователя"""
+        target = self.queues[shard_key(data) % len(self.queues)]
+        async with self._lock:
+            try:
+                target.put_nowait(data)
+            except queue.Full:
+                # Процесс не успевает — ждём место в очереди, не принимая новые обновления
+                await asyncio.to_thread(target.put, data)
+
+async def poll_updates(bot: Bot, dispatcher: ShardDispatcher, allowed_updates: list):
+    """Long polling в приёмном процессе"""
+    await bot.delete_webhook()
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates)
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramError as e:
+                logger.warning(f"Ошибка при получении обновлений: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await dispatcher.put(update.to_dict())
+                offset = update.update_id + 1
+    finally:
+        if offset is not None:
+            # Подтверждаем Telegram уже переданные обновления, чтобы они не пришли повторно
+            try:
+                await bot.get_updates(offset=offset, timeout=0, limit=1)
+            except TelegramError as e:
+                logger.warning(f"Не удалось подтвердить обновления: {e}")
+
+async def publish_weather():
+    """Фоновое обновление погоды и публикация снимка для рабочих процессов"""
+    while True:
+        try:
+            await refresh_all_weather()
+            save_weather_snapshot()
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении погоды: {e}")
+        await asyncio.sleep(WEATHER_UPDATE_INTERVAL)
+
+async def stop_workers(queues: list, processes: list):
+    """Плавная остановка: конец очереди каждому процессу и ожидание их завершения"""
+    for updates in queues:
+        await asyncio.to_thread(updates.put, None)
+    for process in processes:
+        await asyncio.to_thread(process.join, WORKER_DRAIN_TIMEOUT)
+        if process.is_alive():
+            logger.warning(f"{process.name} не завершился за {WORKER_DRAIN_TIMEOUT} с, процесс прерван")
+            process.terminate()
+            await asyncio.to_thread(process.join)
+
+async def run_sharded(workers: int, allowed_updates: list):
+    """
+    Запуск бота в несколько процессов
+
+    :param workers: Количество рабочих процессов
+    :param allowed_updates: Типы обновлений, которые запрашиваются у Telegram
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: остановка по KeyboardInterrupt
+            pass
+
+    await init_http_client()
+    # Координаты городов определяются до запуска процессов, те читают их с диска
+    await city_registry.resolve_all(SUPPORTED_CITIES, get_session())
+
+    # spawn: рабочие процессы не наследуют соединения SQLite и цикл событий
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        context.Process(target=worker_main, args=(index, queues[index]), name=f"bot-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Запущено рабочих процессов: {workers}")
+
+    dispatcher = ShardDispatcher(queues)
+    weather_task = asyncio.create_task(publish_weather())
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(METRICS_LISTEN, METRICS_PORT)
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logger.error(f"Не удалось запустить сервер метрик на порту {METRICS_PORT}: {e}")
+            metrics_server = None
+    server = None
+    receiver = None
+    bot = Bot(BOT_TOKEN)
+    try:
+        await bot.initialize()
+        if BOT_RUN_MODE == 'webhook':
+            server = WebhookServer(dispatcher.put, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+            await server.start()
+            if WEBHOOK_URL:
+                await bot.set_webhook(
+                    url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=allowed_updates
+                )
+                logger.info(f"Вебхук зарегистрирован: {WEBHOOK_URL}")
+        else:
+            receiver = asyncio.create_task(poll_updates(bot, dispatcher, allowed_updates))
+        await stop_event.wait()
+    finally:
+        # Сначала перестаём принимать обновления, затем дорабатываем принятые
+        if server is not None:
+            await server.stop()
+        if receiver is not None:
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+        weather_task.cancel()
+        await asyncio.gather(weather_task, return_exceptions=True)
+        await stop_workers(queues, processes)
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await bot.shutdown()
+        await close_http_client()